@@ -6,7 +6,8 @@ and support functions for conversion into different formats.
 from itertools import chain
 
 from fire.translator.util import rjust_zero
-from fire.translator.util import factor_transforms, xform_entity, fire_entity
+from fire.translator.util import xform_entity
+from fire.translator.layouts import register, fields_from_items
 
 """
 _END_OF_PAYER_TRANSFORMS
@@ -36,7 +37,10 @@ _ITEMS += [
     ("blank_4", ("", 2, "\x00", lambda x: x))
 ]
 
-_END_OF_PAYER_SORT, _END_OF_PAYER_TRANSFORMS = factor_transforms(_ITEMS)
+_LAYOUT = register("end_of_payer", fields_from_items(_ITEMS))
+_END_OF_PAYER_SORT, _END_OF_PAYER_TRANSFORMS = _LAYOUT.sort, _LAYOUT.transforms
+_fire_end_of_payer = _LAYOUT.encode
+_fire_end_of_payer_bytes = _LAYOUT.encode_bytes
 
 def xform(data):
     """
@@ -74,4 +78,22 @@ def fire(data):
     str
         String formatted to meet IRS Publication 1220
     """
-    return fire_entity(_END_OF_PAYER_TRANSFORMS, _END_OF_PAYER_SORT, data)
+    return _fire_end_of_payer(data)
+
+def fire_bytes(data):
+    """
+    Returns the same record as fire(), as ASCII bytes. Non-ASCII
+    characters are transliterated (see util.to_ascii).
+
+    Parameters
+    ----------
+    data : dict
+        Expects data parameter to have all keys specified in
+        _END_OF_PAYER_TRANSFORMS.
+
+    Returns
+    ----------
+    bytes
+        Bytes formatted to meet IRS Publication 1220
+    """
+    return _fire_end_of_payer_bytes(data)
@@ -4,7 +4,8 @@ Representation of a "extension_of_time" record, including transformation
 functions and support functions for conversion into different formats.
 """
 from fire.translator.util import digits_only, uppercase
-from fire.translator.util import factor_transforms, xform_entity, fire_entity
+from fire.translator.util import xform_entity
+from fire.translator.layouts import register, fields_from_items
 
 """
 EXTENSION_OF_TIME_TRANSFORMS
@@ -30,8 +31,11 @@ _ITEMS = [
     ("blank_2", ("", 2, "\x00", lambda x: x))
 ]
 
+_LAYOUT = register("extension_of_time", fields_from_items(_ITEMS), 200)
 _EXTENSION_OF_TIME_SORT, _EXTENSION_OF_TIME_TRANSFORMS = \
-    factor_transforms(_ITEMS)
+    _LAYOUT.sort, _LAYOUT.transforms
+_fire_extension_of_time = _LAYOUT.encode
+_fire_extension_of_time_bytes = _LAYOUT.encode_bytes
 
 def xform(data):
     """
@@ -69,5 +73,22 @@ def fire(data):
     str
         String formatted to meet IRS Publication 1220
     """
-    return fire_entity(_EXTENSION_OF_TIME_TRANSFORMS,
-                       _EXTENSION_OF_TIME_SORT, data, 200)
+    return _fire_extension_of_time(data)
+
+def fire_bytes(data):
+    """
+    Returns the same record as fire(), as ASCII bytes. Non-ASCII
+    characters are transliterated (see util.to_ascii).
+
+    Parameters
+    ----------
+    data : dict
+        Expects data parameter to have all keys specified in
+        EXTENSION_OF_TIME_TRANSFORMS.
+
+    Returns
+    ----------
+    bytes
+        Bytes formatted to meet IRS Publication 1220
+    """
+    return _fire_extension_of_time_bytes(data)
@@ -0,0 +1,158 @@
+"""
+Module: Forms
+Payee ("B") record layouts of the 1099 forms other than 1099-MISC and
+1099-NEC, declared as data and registered with translator.layouts.
+
+Positions 1-543 (record type through the record sequence number) are shared
+by every form, and are taken from the payees module. Positions 663-750
+(special data entries through the end of the record) are also common to
+these forms. Positions 544-662 are specific to each form, and are declared
+below with their start positions in IRS Publication 1220.
+"""
+from fire.translator.util import digits_only, uppercase, rjust_zero
+from fire.translator.layouts import Field, register, get_layout, \
+                                    fields_from_items
+from fire.entities import payees
+
+# Type of return (payer "A" record) of each form
+RETURN_TYPES = {
+    "MISC": "A",
+    "NEC": "NE",
+    "INT": "6",
+    "DIV": "1",
+    "B": "B",
+    "K": "MC"
+}
+
+_SHARED_END = [name for name, _ in payees._ITEMS].index("blank_5") + 1
+_SHARED = fields_from_items(payees._ITEMS[:_SHARED_END])
+
+_TRAILER = [
+    Field("special_data_entries", 663, 60),
+    Field("state_income_tax_withheld", 723, 12),
+    Field("local_income_tax_withheld", 735, 12),
+    Field("combined_federal_state_code", 747, 2),
+    Field("blank_end", 749, 2)
+]
+
+_FORM_FIELDS = {
+    "INT": [
+        Field("second_tin_notice", 544, 1),
+        Field("blank_6", 545, 2),
+        Field("foreign_country_or_us_possession", 547, 40, "", "\x00",
+              uppercase, "uppercase"),
+        Field("cusip_number", 587, 13, "", "\x00", uppercase, "uppercase"),
+        Field("fatca_filing_requirement_indicator", 600, 1),
+        Field("blank_7", 601, 62)
+    ],
+    "DIV": [
+        Field("second_tin_notice", 544, 1),
+        Field("blank_6", 545, 2),
+        Field("foreign_country_or_us_possession", 547, 40, "", "\x00",
+              uppercase, "uppercase"),
+        Field("fatca_filing_requirement_indicator", 587, 1),
+        Field("blank_7", 588, 75)
+    ],
+    "B": [
+        Field("second_tin_notice", 544, 1),
+        Field("noncovered_security_indicator", 545, 1),
+        Field("type_of_gain_or_loss_indicator", 546, 1),
+        Field("gross_proceeds_indicator", 547, 1),
+        Field("date_sold_or_disposed", 548, 8, "", "\x00", digits_only,
+              "digits_only"),
+        Field("cusip_number", 556, 13, "", "\x00", uppercase, "uppercase"),
+        Field("description_of_property", 569, 39, "", "\x00", uppercase,
+              "uppercase"),
+        Field("date_acquired", 608, 8, "", "\x00", digits_only, "digits_only"),
+        Field("loss_not_allowed_indicator", 616, 1),
+        Field("applicable_check_box_of_form_8949", 617, 1),
+        Field("applicable_check_box_for_collectibles", 618, 1),
+        Field("fatca_filing_requirement_indicator", 619, 1),
+        Field("applicable_check_box_for_qof", 620, 1),
+        Field("blank_6", 621, 42)
+    ],
+    "K": [
+        Field("second_tin_notice", 544, 1),
+        Field("blank_6", 545, 2),
+        Field("type_of_filer_indicator", 547, 1),
+        Field("type_of_payment_indicator", 548, 1),
+        Field("number_of_payment_transactions", 549, 13, "0000000000000",
+              "\x00", lambda x: rjust_zero(x, 13), "rjust_zero"),
+        Field("blank_7", 562, 3),
+        Field("payment_settlement_entity_name_and_phone", 565, 40, "",
+              "\x00", uppercase, "uppercase"),
+        Field("merchant_category_code", 605, 4, "", "\x00", digits_only,
+              "digits_only"),
+        Field("fatca_filing_requirement_indicator", 609, 1),
+        Field("blank_8", 610, 53)
+    ]
+}
+
+# Name of the registered payee layout of each form
+PAYEE_LAYOUTS = {"MISC": "payees", "NEC": "payees"}
+for _form, _fields in _FORM_FIELDS.items():
+    PAYEE_LAYOUTS[_form] = register(f"payees_{_form.lower()}",
+                                    _SHARED + _fields + _TRAILER).name
+
+
+def payee_layout(form_type):
+    """
+    Returns the payee record layout of a form.
+
+    Parameters
+    ----------
+    form_type : str
+        form type, one of the keys of RETURN_TYPES
+
+    Returns
+    ----------
+    translator.layouts.Layout
+        The registered layout.
+    """
+    if form_type not in PAYEE_LAYOUTS:
+        raise Exception(f"Unknown form type: {form_type} \
+                -- Expected one of: {', '.join(PAYEE_LAYOUTS)}")
+    return get_layout(PAYEE_LAYOUTS[form_type])
+
+
+def xform(form_type, data):
+    """
+    Applies the transformation functions of a form's payee layout to each
+    payee in data, adding default values for missing fields.
+
+    Parameters
+    ----------
+    form_type : str
+        form type, one of the keys of RETURN_TYPES
+
+    data : list of dict
+        user-supplied payee data
+
+    Returns
+    ----------
+    list of dict
+        Payee records, ready to be formatted with fire().
+    """
+    layout = payee_layout(form_type)
+    return [layout.xform(payee) for payee in data]
+
+
+def fire(form_type, data):
+    """
+    Returns the FIRE-formatted payee records of a form.
+
+    Parameters
+    ----------
+    form_type : str
+        form type, one of the keys of RETURN_TYPES
+
+    data : list of dict
+        payee records, as returned by xform()
+
+    Returns
+    ----------
+    str
+        Concatenated payee records.
+    """
+    encode = payee_layout(form_type).encode
+    return "".join(encode(payee) for payee in data)
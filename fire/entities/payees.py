@@ -9,7 +9,8 @@ an individual payee)
 from itertools import chain
 
 from fire.translator.util import digits_only, uppercase, rjust_zero
-from fire.translator.util import factor_transforms, xform_entity, fire_entity
+from fire.translator.util import xform_entity
+from fire.translator.layouts import register, fields_from_items
 """
 _PAYEE_TRANSFORMS
 -----------------------
@@ -17,53 +18,63 @@ Stores metadata associated with each field in a Transmitter record.
 Values in key-value pairs represent metadata in the following format:
 
 (default value, length, fill character, transformation function)
+
+Entries of _ITEMS add a fifth element, the transform kind: the vectorized
+equivalent of the transformation function, used by the columnar renderer
+(see layouts.TRANSFORM_KINDS).
 """
 
 _ITEMS = [
-    ("record_type", ("B", 1, "\x00", lambda x: x)),
-    ("payment_year", ("", 4, "\x00", lambda x: x)),
-    ("corrected_return_indicator", ("", 1, "\x00", uppercase)),
-    ("payees_name_control", ("", 4, "\x00", uppercase)),
-    ("type_of_tin", ("1", 1, "\x00", lambda x: x)),
-    ("payees_tin", ("000000000", 9, "\x00", digits_only)),
-    ("payers_account_number_for_payee", ("", 20, "\x00", lambda x: x)),
-    ("payers_office_code", ("", 4, "\x00", lambda x: x)),
-    ("blank_1", ("", 10, "\x00", lambda x: x))
+    ("record_type", ("B", 1, "\x00", lambda x: x, "identity")),
+    ("payment_year", ("", 4, "\x00", lambda x: x, "identity")),
+    ("corrected_return_indicator", ("", 1, "\x00", uppercase, "uppercase")),
+    ("payees_name_control", ("", 4, "\x00", uppercase, "uppercase")),
+    ("type_of_tin", ("1", 1, "\x00", lambda x: x, "identity")),
+    ("payees_tin", ("000000000", 9, "\x00", digits_only, "digits_only")),
+    ("payers_account_number_for_payee",
+     ("", 20, "\x00", lambda x: x, "identity")),
+    ("payers_office_code", ("", 4, "\x00", lambda x: x, "identity")),
+    ("blank_1", ("", 10, "\x00", lambda x: x, "identity"))
 ]
 
 for field in chain((x for x in range(1, 10)), \
                    (chr(x) for x in range(ord('A'), ord('I'))), \
                    'J'):
     _ITEMS.append((f"payment_amount_{field}",
-                   ("000000000000", 12, "\x00", lambda x: rjust_zero(x, 12))))
+                   ("000000000000", 12, "\x00", lambda x: rjust_zero(x, 12),
+                    "rjust_zero")))
 
 _ITEMS += [
-    ("blank_2", ("", 16, "\x00", lambda x: x)),
-    ("foreign_country_indicator", ("", 1, "\x00", lambda x: x)),
-    ("first_payee_name_line", ("", 40, "\x00", uppercase)),
-    ("second_payee_name_line", ("", 40, "\x00", uppercase)),
-    ("payee_mailing_address", ("", 40, "\x00", lambda x: x)),
-    ("blank_3", ("", 40, "\x00", lambda x: x)),
-    ("payee_city", ("", 40, "\x00", lambda x: x)),
-    ("payee_state", ("", 2, "\x00", lambda x: x)),
-    ("payee_zip_code", ("", 9, "\x00", lambda x: x)),
-    ("blank_4", ("", 1, "\x00", lambda x: x)),
+    ("blank_2", ("", 16, "\x00", lambda x: x, "identity")),
+    ("foreign_country_indicator", ("", 1, "\x00", lambda x: x, "identity")),
+    ("first_payee_name_line", ("", 40, "\x00", uppercase, "uppercase")),
+    ("second_payee_name_line", ("", 40, "\x00", uppercase, "uppercase")),
+    ("payee_mailing_address", ("", 40, "\x00", lambda x: x, "identity")),
+    ("blank_3", ("", 40, "\x00", lambda x: x, "identity")),
+    ("payee_city", ("", 40, "\x00", lambda x: x, "identity")),
+    ("payee_state", ("", 2, "\x00", lambda x: x, "identity")),
+    ("payee_zip_code", ("", 9, "\x00", digits_only, "digits_only")),
+    ("blank_4", ("", 1, "\x00", lambda x: x, "identity")),
     ("record_sequence_number",
-     ("00000003", 8, "\x00", lambda x: rjust_zero(x, 8))),
-    ("blank_5", ("", 36, "\x00", lambda x: x)),
-    ("second_tin_notice", ("", 1, "\x00", lambda x: x)),
-    ("blank_6", ("", 2, "\x00", lambda x: x)),
-    ("direct_sales_indicator", ("", 1, "\x00", lambda x: x)),
-    ("fatca_filing_requirement_indicator", ("", 1, "\x00", lambda x: x)),
-    ("blank_7", ("", 114, "\x00", lambda x: x)),
-    ("special_data_entries", ("", 60, "\x00", lambda x: x)),
-    ("state_income_tax_withheld", ("", 12, "\x00", lambda x: x)),
-    ("local_income_tax_withheld", ("", 12, "\x00", lambda x: x)),
-    ("combined_federal_state_code", ("", 2, "\x00", lambda x: x)),
-    ("blank_8", ("", 2, "\x00", lambda x: x))
+     ("00000003", 8, "\x00", lambda x: rjust_zero(x, 8), "rjust_zero")),
+    ("blank_5", ("", 36, "\x00", lambda x: x, "identity")),
+    ("second_tin_notice", ("", 1, "\x00", lambda x: x, "identity")),
+    ("blank_6", ("", 2, "\x00", lambda x: x, "identity")),
+    ("direct_sales_indicator", ("", 1, "\x00", lambda x: x, "identity")),
+    ("fatca_filing_requirement_indicator",
+     ("", 1, "\x00", lambda x: x, "identity")),
+    ("blank_7", ("", 114, "\x00", lambda x: x, "identity")),
+    ("special_data_entries", ("", 60, "\x00", lambda x: x, "identity")),
+    ("state_income_tax_withheld", ("", 12, "\x00", lambda x: x, "identity")),
+    ("local_income_tax_withheld", ("", 12, "\x00", lambda x: x, "identity")),
+    ("combined_federal_state_code", ("", 2, "\x00", lambda x: x, "identity")),
+    ("blank_8", ("", 2, "\x00", lambda x: x, "identity"))
 ]
 
-_PAYEE_SORT, _PAYEE_TRANSFORMS = factor_transforms(_ITEMS)
+_LAYOUT = register("payees", fields_from_items(_ITEMS))
+_PAYEE_SORT, _PAYEE_TRANSFORMS = _LAYOUT.sort, _LAYOUT.transforms
+_fire_payee = _LAYOUT.encode
+_fire_payee_bytes = _LAYOUT.encode_bytes
 
 def xform(data):
     """
@@ -103,7 +114,21 @@ def fire(data):
     str
         String formatted to meet IRS Publication 1220
     """
-    payees_string = ""
-    for payee in data:
-        payees_string += fire_entity(_PAYEE_TRANSFORMS, _PAYEE_SORT, payee)
-    return payees_string
+    return "".join([_fire_payee(payee) for payee in data])
+
+def fire_bytes(data):
+    """
+    Returns the same records as fire(), as ASCII bytes. Non-ASCII
+    characters are transliterated (see util.to_ascii).
+
+    Parameters
+    ----------
+    data : array[dict]
+        Expects data elements to have all keys specified in _PAYEE_TRANSFORMS.
+
+    Returns
+    ----------
+    bytes
+        Bytes formatted to meet IRS Publication 1220
+    """
+    return b"".join([_fire_payee_bytes(payee) for payee in data])
@@ -4,7 +4,8 @@ Representation of a "payer" record, including transformation functions
 and support functions for conversion into different formats.
 """
 from fire.translator.util import digits_only, uppercase, rjust_zero
-from fire.translator.util import factor_transforms, xform_entity, fire_entity
+from fire.translator.util import xform_entity
+from fire.translator.layouts import register, fields_from_items
 
 """
 _PAYER_TRANSFORMS
@@ -42,7 +43,10 @@ _ITEMS = [
     ("blank_5", ("", 2, "\x00", lambda x: x))
 ]
 
-_PAYER_SORT, _PAYER_TRANSFORMS = factor_transforms(_ITEMS)
+_LAYOUT = register("payer", fields_from_items(_ITEMS))
+_PAYER_SORT, _PAYER_TRANSFORMS = _LAYOUT.sort, _LAYOUT.transforms
+_fire_payer = _LAYOUT.encode
+_fire_payer_bytes = _LAYOUT.encode_bytes
 
 def xform(data):
     """
@@ -79,4 +83,21 @@ def fire(data):
     str
         String formatted to meet IRS Publication 1220
     """
-    return fire_entity(_PAYER_TRANSFORMS, _PAYER_SORT, data)
+    return _fire_payer(data)
+
+def fire_bytes(data):
+    """
+    Returns the same record as fire(), as ASCII bytes. Non-ASCII
+    characters are transliterated (see util.to_ascii).
+
+    Parameters
+    ----------
+    data : dict
+        Expects data parameter to have all keys specified in _PAYER_TRANSFORMS.
+
+    Returns
+    ----------
+    bytes
+        Bytes formatted to meet IRS Publication 1220
+    """
+    return _fire_payer_bytes(data)
@@ -0,0 +1,111 @@
+"""
+Module: entities.state_totals
+Representation of a "state_totals" (K) record, including transformation
+functions and support functions for conversion into different formats.
+
+One K record is written per state participating in the Combined
+Federal/State Filing Program, after the end_of_payer (C) record.
+
+Support functions are built to handle arrays of state totals (as opposed to
+an individual record)
+"""
+from itertools import chain
+
+from fire.translator.util import rjust_zero
+from fire.translator.util import xform_entity
+from fire.translator.layouts import register, fields_from_items
+
+"""
+_STATE_TOTALS_TRANSFORMS
+-----------------------
+Stores metadata associated with each field in a State Totals record.
+Values in key-value pairs represent metadata in the following format:
+
+(default value, length, fill character, transformation function)
+"""
+
+_ITEMS = [
+    ("record_type", ("K", 1, "\x00", lambda x: x)),
+    ("number_of_payees", ("00000000", 8, "0", lambda x: rjust_zero(x, 8))),
+    ("blank_1", ("", 6, "\x00", lambda x: x)),
+]
+
+for field in chain((x for x in range(1, 10)), \
+                   (chr(x) for x in range(ord('A'), ord('I'))), \
+                   'J'):
+    _ITEMS.append((f"payment_amount_{field}",
+                   (18*"0", 18, "0", lambda x: rjust_zero(x, 18))))
+
+_ITEMS += [
+    ("blank_2", ("", 160, "\x00", lambda x: x)),
+    ("record_sequence_number", ("", 8, "0", lambda x: x)),
+    ("blank_3", ("", 199, "\x00", lambda x: x)),
+    ("state_income_tax_withheld_total",
+     (18*"0", 18, "0", lambda x: rjust_zero(x, 18))),
+    ("local_income_tax_withheld_total",
+     (18*"0", 18, "0", lambda x: rjust_zero(x, 18))),
+    ("blank_4", ("", 4, "\x00", lambda x: x)),
+    ("combined_federal_state_code", ("", 2, "0", lambda x: rjust_zero(x, 2))),
+    ("blank_5", ("", 2, "\x00", lambda x: x))
+]
+
+_LAYOUT = register("state_totals", fields_from_items(_ITEMS))
+_STATE_TOTALS_SORT, _STATE_TOTALS_TRANSFORMS = _LAYOUT.sort, _LAYOUT.transforms
+_fire_state_totals = _LAYOUT.encode
+_fire_state_totals_bytes = _LAYOUT.encode_bytes
+
+def xform(data):
+    """
+    Applies transformation functions definted in _STATE_TOTALS_TRANSFORMS to
+    data supplied as parameter.
+
+    Parameters
+    ----------
+    data : array[dict]
+        Array of dict elements containing State Totals data.
+        Expects element of the array to have keys that exist in the
+        _STATE_TOTALS_TRANSFORMS dict (not required to have all keys).
+
+    Returns
+    ----------
+    array[dict]
+        Array of dicts containing processed (transformed) data provided as a
+        parameter.
+    """
+    return [xform_entity(_STATE_TOTALS_TRANSFORMS, state) for state in data]
+
+def fire(data):
+    """
+    Returns a string formatted to the IRS Publication 1220 specification based
+    on data supplied as parameter.
+
+    Parameters
+    ----------
+    data : array[dict]
+        Expects data elements to have all keys specified in
+        _STATE_TOTALS_TRANSFORMS.
+
+    Returns
+    ----------
+    str
+        String formatted to meet IRS Publication 1220
+    """
+    return "".join([_fire_state_totals(state) for state in data])
+
+def fire_bytes(data):
+    """
+    Returns the same records as fire(), as ASCII bytes. Non-ASCII
+    characters are transliterated (see util.to_ascii).
+
+    Parameters
+    ----------
+    data : array[dict]
+        Expects data elements to have all keys specified in
+        _STATE_TOTALS_TRANSFORMS.
+
+    Returns
+    ----------
+    bytes
+        Bytes formatted to meet IRS Publication 1220
+    """
+    return b"".join([_fire_state_totals_bytes(state) for state in data])
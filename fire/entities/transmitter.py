@@ -5,7 +5,8 @@ Representation of a "transmitter" record, including transformation functions
 and support functions for conversion into different formats.
 """
 from fire.translator.util import digits_only, uppercase, rjust_zero
-from fire.translator.util import factor_transforms, xform_entity, fire_entity
+from fire.translator.util import xform_entity
+from fire.translator.layouts import register, fields_from_items
 
 """
 _TRANSMITTER_TRANSFORMS
@@ -48,7 +49,7 @@ _ITEMS = [
     ("vendor_mailing_address", ("", 40, "\x00", lambda x: x)),
     ("vendor_city", ("", 40, "\x00", uppercase)),
     ("vendor_state", ("", 2, "\x00", uppercase)),
-    ("vendor_zip_code", ("", 9, "\x00", lambda x: x)),
+    ("vendor_zip_code", ("", 9, "\x00", digits_only)),
     ("vendor_contact_name", ("", 40, "\x00", uppercase)),
     ("vendor_contact_telephone_and_ext",
      ("", 15, "\x00", digits_only)),
@@ -58,7 +59,10 @@ _ITEMS = [
     ("blank_7", ("", 2, "\x00", lambda x: x))
 ]
 
-_TRANSMITTER_SORT, _TRANSMITTER_TRANSFORMS = factor_transforms(_ITEMS)
+_LAYOUT = register("transmitter", fields_from_items(_ITEMS))
+_TRANSMITTER_SORT, _TRANSMITTER_TRANSFORMS = _LAYOUT.sort, _LAYOUT.transforms
+_fire_transmitter = _LAYOUT.encode
+_fire_transmitter_bytes = _LAYOUT.encode_bytes
 
 def xform(data):
     """
@@ -96,4 +100,22 @@ def fire(data):
     str
         String formatted to meet IRS Publication 1220
     """
-    return fire_entity(_TRANSMITTER_TRANSFORMS, _TRANSMITTER_SORT, data)
+    return _fire_transmitter(data)
+
+def fire_bytes(data):
+    """
+    Returns the same record as fire(), as ASCII bytes. Non-ASCII
+    characters are transliterated (see util.to_ascii).
+
+    Parameters
+    ----------
+    data : dict
+        Expects data parameter to have all keys specified in
+        _TRANSMITTER_TRANSFORMS.
+
+    Returns
+    ----------
+    bytes
+        Bytes formatted to meet IRS Publication 1220
+    """
+    return _fire_transmitter_bytes(data)
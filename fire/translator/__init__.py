@@ -2,4 +2,12 @@
 Module entrypoint
 """
 
-from .translator import cli
+
+def __getattr__(name):
+    # The CLI is resolved on first access, so that importing lightweight
+    # submodules (e.g. fire.translator.util) does not load click and the full
+    # translator pipeline.
+    if name == "cli":
+        from .translator import cli
+        return cli
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,229 @@
+"""
+Module: Translator (asyncio)
+Asynchronous version of the translator pipeline, for use from asyncio-based
+services.
+
+File reads and writes run in an executor, and CPU-heavy stages (validation,
+transformation and rendering of payees) are split into chunks of payees that
+are each run in an executor, yielding to the event loop between chunks. Many
+conversions can therefore run side by side in one process without blocking
+the event loop for the duration of any of them.
+
+By default the event loop's default executor (a thread pool) is used. A
+concurrent.futures.ProcessPoolExecutor may be passed instead, to spread the
+chunked stages across CPUs; file I/O always runs in the default executor.
+"""
+import asyncio
+
+from fire.entities import transmitter, payer, payees, end_of_payer, \
+                          state_totals, end_of_transmission
+from . import translator
+from .writer import _Sink
+
+# Number of payees processed per executor call
+DEFAULT_CHUNK_SIZE = 500
+
+
+async def run(input_path, output_path, type="MISC",
+              chunk_size=DEFAULT_CHUNK_SIZE, executor=None, archive_path=None):
+    """
+    Asynchronous equivalent of translator.run().
+
+    Parameters
+    ----------
+    input_path : str
+        system path for file containing the user input JSON data
+
+    output_path : str
+        optional system path for the output to be generated
+
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    chunk_size : int
+        number of payees processed per executor call
+
+    executor : concurrent.futures.Executor
+        optional executor for CPU-heavy stages. Defaults to the event loop's
+        default executor.
+
+    archive_path : str
+        optional path of an archival copy of the output (see
+        write_1099_file).
+
+    """
+    if output_path is None:
+        output_path = translator.get_default_output_path(input_path)
+
+    user_data = await extract_user_data(input_path, executor)
+    await validate_user_data(user_data, translator.get_schema_path(type),
+                             chunk_size, executor)
+
+    master = await load_full_schema(user_data, chunk_size, executor)
+    # Edits master in-place, so always runs in a thread rather than in a
+    # (possibly process-based) executor
+    await asyncio.get_running_loop().run_in_executor(
+        None, translator.insert_generated_values, master)
+
+    await write_1099_file(master, output_path, chunk_size, executor,
+                          archive_path)
+
+
+async def extract_user_data(path, executor=None):
+    """
+    Asynchronous equivalent of translator.extract_user_data(). The file is
+    read and parsed in the executor.
+
+    Parameters
+    ----------
+    path : str
+        system path for file containing the user input JSON data
+
+    executor : concurrent.futures.Executor
+        optional executor to read and parse the file in
+
+    Returns
+    ----------
+    dict
+        JSON data loaded from file at input path
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, translator.extract_user_data,
+                                      path)
+
+
+async def validate_user_data(data, schema_path, chunk_size=DEFAULT_CHUNK_SIZE,
+                             executor=None):
+    """
+    Asynchronous equivalent of translator.validate_user_data(). The
+    transmitter and payer records are validated first, followed by the payees
+    in chunks of chunk_size. Raises the first validation error found; note
+    that payee indexes in its path are relative to the chunk.
+
+    Parameters
+    ----------
+    data : dict
+        data to be validated
+
+    schema_path : str
+        system path for file containing schema to data validate against
+
+    chunk_size : int
+        number of payees validated per executor call
+
+    executor : concurrent.futures.Executor
+        optional executor to validate in
+    """
+    loop = asyncio.get_running_loop()
+    payee_list = data.get("payees")
+    if not isinstance(payee_list, list):
+        await loop.run_in_executor(executor, translator.validate_user_data,
+                                   data, schema_path)
+        return
+
+    # The schema has no top-level constraints spanning records, so the
+    # records can be validated separately
+    header = {key: value for key, value in data.items() if key != "payees"}
+    header["payees"] = []
+    await loop.run_in_executor(executor, translator.validate_user_data,
+                               header, schema_path)
+    for start in range(0, len(payee_list), chunk_size):
+        chunk = {"payees": payee_list[start:start + chunk_size]}
+        await loop.run_in_executor(executor, translator.validate_user_data,
+                                   chunk, schema_path)
+
+
+async def load_full_schema(data, chunk_size=DEFAULT_CHUNK_SIZE,
+                           executor=None):
+    """
+    Asynchronous equivalent of translator.load_full_schema(). Payees are
+    transformed in chunks of chunk_size.
+
+    Parameters
+    ----------
+    data : dict
+        JSON data to be merged into master schema
+
+    chunk_size : int
+        number of payees transformed per executor call
+
+    executor : concurrent.futures.Executor
+        optional executor to transform payees in
+
+    Returns
+    ----------
+    dict
+        Master schema with all fields provided in input parameter included
+    """
+    loop = asyncio.get_running_loop()
+    merged_data = translator.load_full_schema(
+        {"transmitter": data["transmitter"], "payer": data["payer"],
+         "payees": []})
+    payee_list = data["payees"]
+    for start in range(0, len(payee_list), chunk_size):
+        merged_data["payees"] += await loop.run_in_executor(
+            executor, payees.xform, payee_list[start:start + chunk_size])
+    return merged_data
+
+
+async def write_1099_file(data, path, chunk_size=DEFAULT_CHUNK_SIZE,
+                          executor=None, archive_path=None):
+    """
+    Renders the records in data and writes them to path. Payees are rendered
+    in chunks of chunk_size, and each chunk is written as soon as it has been
+    rendered. Output is committed as by translator.write_1099_file() (see
+    writer.write_records): it goes to a partial file that is fsync'd and
+    renamed to path once complete, or removed if writing fails, and is
+    compressed if path ends in .gz, .xz or .bz2.
+
+    Parameters
+    ----------
+    data : dict
+        Master set of records, with generated values inserted.
+
+    path : str
+        Path of file to be written.
+
+    chunk_size : int
+        number of payees rendered per executor call
+
+    executor : concurrent.futures.Executor
+        optional executor to render payees in
+
+    archive_path : str
+        optional path of an archival copy of the same records, written in
+        the same pass. Compressed according to its own extension.
+    """
+    loop = asyncio.get_running_loop()
+    sinks = []
+    try:
+        for sink_path in (path, archive_path):
+            if sink_path is not None:
+                sinks.append(await loop.run_in_executor(None, _Sink,
+                                                        sink_path))
+        await loop.run_in_executor(
+            None, _write, sinks,
+            transmitter.fire_bytes(data["transmitter"]) +
+            payer.fire_bytes(data["payer"]))
+        payee_list = data["payees"]
+        for start in range(0, len(payee_list), chunk_size):
+            chunk = await loop.run_in_executor(
+                executor, payees.fire_bytes,
+                payee_list[start:start + chunk_size])
+            await loop.run_in_executor(None, _write, sinks, chunk)
+        await loop.run_in_executor(
+            None, _write, sinks,
+            end_of_payer.fire_bytes(data["end_of_payer"]) +
+            state_totals.fire_bytes(data.get("state_totals", [])) +
+            end_of_transmission.fire_bytes(data["end_of_transmission"]))
+        for sink in sinks:
+            await loop.run_in_executor(None, sink.commit)
+    except BaseException:
+        for sink in sinks:
+            sink.discard()
+        raise
+
+
+def _write(sinks, data):
+    for sink in sinks:
+        sink.write(data)
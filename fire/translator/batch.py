@@ -0,0 +1,202 @@
+"""
+Module: Batch
+Converts many input files in one invocation. Files are processed by a pool of
+worker processes; each worker loads and compiles the schema validator for the
+form type once, and reuses it for every file it converts.
+
+A machine-readable JSON summary is written at the end of the run, containing
+the status, payee count, payment totals and timing of every input file.
+"""
+import os
+import glob
+import json
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from . import translator
+from .util import AMOUNT_CODES
+from .compression import COMPRESSION_SUFFIXES
+
+
+def collect_inputs(pattern):
+    """
+    Returns the sorted list of input files matching pattern. If pattern is a
+    directory, all *.json files directly inside it (including compressed
+    *.json.gz, *.json.xz and *.json.bz2 files) are returned.
+
+    Parameters
+    ----------
+    pattern : str
+        directory path, or glob pattern matching input files
+
+    Returns
+    ----------
+    list of str
+        system paths of the input files
+    """
+    if os.path.isdir(pattern):
+        paths = []
+        for suffix in [""] + list(COMPRESSION_SUFFIXES):
+            paths += glob.glob(os.path.join(pattern, "*.json" + suffix))
+    else:
+        paths = glob.glob(pattern)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def get_output_path(input_path, output_dir=None):
+    """
+    Returns the output path for the given input file: the input file name
+    with its extension (and compression extension, if any) replaced by
+    ".ascii", in output_dir if given, or otherwise next to the input file.
+
+    Parameters
+    ----------
+    input_path : str
+        system path for the input file
+
+    output_dir : str
+        optional directory for generated files
+
+    Returns
+    ----------
+    str
+        system path for the output file
+    """
+    if output_dir is None:
+        output_dir = os.path.dirname(os.path.abspath(input_path))
+    name, extension = os.path.splitext(os.path.basename(input_path))
+    if extension.lower() in COMPRESSION_SUFFIXES:
+        name = os.path.splitext(name)[0]
+    return os.path.join(output_dir, f"{name}.ascii")
+
+
+def _init_worker(type):
+    """
+    Pool initializer: compiles the validator for the form type once per
+    worker process.
+    """
+    translator.load_validator(translator.get_schema_path(type))
+
+
+def convert_file(input_path, output_path, type="MISC"):
+    """
+    Converts a single input file, and returns a summary of the result. Errors
+    are captured in the summary rather than raised, so that one bad file does
+    not abort the rest of the batch.
+
+    Parameters
+    ----------
+    input_path : str
+        system path for file containing the user input JSON data
+
+    output_path : str
+        system path for the output to be generated
+
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    Returns
+    ----------
+    dict
+        Summary of the conversion: input, output, status, error, payees,
+        totals (by amount code) and seconds.
+    """
+    result = {
+        "input": input_path,
+        "output": output_path,
+        "status": "ok",
+        "error": None,
+        "payees": 0,
+        "totals": {},
+        "seconds": 0.0
+    }
+    start = perf_counter()
+    try:
+        user_data = translator.extract_user_data(input_path)
+        translator.validate_user_data(user_data,
+                                      translator.get_schema_path(type))
+        master = translator.load_full_schema(user_data)
+        translator.insert_generated_values(master)
+        translator.write_1099_file(translator.get_fire_bytes(master),
+                                   output_path)
+
+        result["payees"] = len(master["payees"])
+        for code in AMOUNT_CODES:
+            total = int(master["end_of_payer"]["payment_amount_" + code])
+            if total != 0:
+                result["totals"][code] = total
+    except Exception as error: # pylint: disable=broad-except
+        result["status"] = "error"
+        result["error"] = f"{error.__class__.__name__}: {error}"
+    result["seconds"] = round(perf_counter() - start, 6)
+    return result
+
+
+def run_batch(input_paths, output_dir=None, type="MISC", workers=None,
+              summary_path=None):
+    """
+    Converts all input files through a pool of worker processes, and writes a
+    JSON summary of the run. Raises an Exception before converting anything
+    if two input files would be written to the same output path, e.g. files
+    with the same name in different directories and a shared output_dir.
+
+    Parameters
+    ----------
+    input_paths : list of str
+        system paths for files containing user input JSON data
+
+    output_dir : str
+        optional directory for generated files. Defaults to the directory of
+        each input file.
+
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    workers : int
+        optional number of worker processes. Defaults to the number of CPUs.
+
+    summary_path : str
+        optional system path for the JSON summary. Defaults to
+        batch_summary.json in output_dir (or the current directory).
+
+    Returns
+    ----------
+    dict
+        The summary written to summary_path.
+    """
+    output_paths = [get_output_path(path, output_dir) for path in input_paths]
+    seen = {}
+    for input_path, output_path in zip(input_paths, output_paths):
+        key = os.path.normcase(os.path.abspath(output_path))
+        if key in seen:
+            raise Exception(f"Inputs {seen[key]} and {input_path} would both \
+be written to {output_path}")
+        seen[key] = input_path
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    if summary_path is None:
+        summary_path = os.path.join(output_dir or ".", "batch_summary.json")
+
+    start = perf_counter()
+    files = []
+    if input_paths:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(type,)) as pool:
+            files = list(pool.map(convert_file, input_paths, output_paths,
+                                  [type] * len(input_paths)))
+
+    succeeded = sum(1 for result in files if result["status"] == "ok")
+    summary = {
+        "type": type,
+        "total_files": len(files),
+        "succeeded": succeeded,
+        "failed": len(files) - succeeded,
+        "payees": sum(result["payees"] for result in files),
+        "seconds": round(perf_counter() - start, 6),
+        "summary_path": summary_path,
+        "files": files
+    }
+    translator.write_1099_file(json.dumps(summary, indent=2), summary_path)
+    return summary
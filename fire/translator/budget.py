@@ -0,0 +1,333 @@
+"""
+Module: Budget
+Memory-budgeted execution: chooses how a conversion holds its payees from
+the size of the input and a memory budget, and reports the peak resident
+set size of the process.
+
+Three strategies are available, from fastest to leanest:
+
+* "memory": the input is loaded, transformed into the master schema and
+  rendered in memory (the default pipeline, see translator.run).
+* "spill": the input is loaded, but payees are transformed, totalled and
+  rendered one at a time, and their records spilled to a record file (see
+  translator.write_streamed); the transformed payees are never held
+  together.
+* "stream": the input is not loaded either. Payees are read one at a time
+  from the JSON input with an incremental parser (see read_streaming), so
+  memory use does not depend on the number of payees.
+
+Memory use of the first two strategies is estimated as a multiple of the
+(uncompressed) input size, measured on the pipeline; the budget available to
+the conversion is the budget less the memory the process already uses.
+"""
+import os
+import json
+import codecs
+import struct
+import tempfile
+
+from .compression import detect_compression, open_input
+
+STRATEGIES = ("memory", "spill", "stream")
+# Peak memory of the "memory" and "spill" strategies, per byte of JSON input
+MEMORY_FACTOR = 7
+SPILL_FACTOR = 5
+# Assumed compression ratio of xz and bz2 inputs (and of gzip inputs whose
+# recorded size has wrapped around)
+COMPRESSION_RATIO = 10
+# Size of the reads of the incremental parser, in bytes
+READ_SIZE = 1 << 16
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def parse_size(value):
+    """
+    Parses a memory size given in bytes, or with a K, M or G suffix (powers
+    of 1024), e.g. "512M".
+
+    Parameters
+    ----------
+    value : str or int
+        memory size
+
+    Returns
+    ----------
+    int
+        Size in bytes.
+    """
+    if isinstance(value, int):
+        return value
+    text = value.strip().upper().rstrip("B")
+    multiplier = 1
+    if text and text[-1] in "KMG":
+        multiplier = 1024 ** ("KMG".index(text[-1]) + 1)
+        text = text[:-1]
+    try:
+        size = int(float(text) * multiplier)
+    except ValueError:
+        size = 0
+    if size <= 0:
+        raise Exception(f"Invalid memory size: {value} \
+                -- Expected bytes, or a number with a K, M or G suffix")
+    return size
+
+
+def current_rss():
+    """
+    Returns the resident set size of the process, in bytes, or its peak
+    resident set size where the current size cannot be read.
+    """
+    try:
+        with open("/proc/self/statm", mode="r", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss() or 0
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the process, in bytes, or None on
+    platforms without /proc or the resource module.
+
+    On Linux, the peak is read from /proc (VmHWM): ru_maxrss carries over
+    the peak of the parent process into a forked and exec'd child, which
+    would misreport the peak of subprocesses.
+    """
+    try:
+        with open("/proc/self/status", mode="r", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def estimate_input_size(path):
+    """
+    Returns the (uncompressed) size of an input file, in bytes. The size of
+    gzip files is read from their trailer; the size of other compressed
+    files is estimated with COMPRESSION_RATIO.
+
+    Parameters
+    ----------
+    path : str
+        system path of an existing file
+
+    Returns
+    ----------
+    int
+        Estimated size of the decompressed contents.
+    """
+    size = os.path.getsize(path)
+    compression = detect_compression(path)
+    if compression is None:
+        return size
+    if compression == "gzip" and size >= 4:
+        with open(path, mode="rb") as file:
+            file.seek(-4, os.SEEK_END)
+            recorded = struct.unpack("<I", file.read(4))[0]
+        # The trailer holds the size modulo 4GB
+        if recorded >= size:
+            return recorded
+    return size * COMPRESSION_RATIO
+
+
+def choose_strategy(input_size, max_memory, baseline=None):
+    """
+    Returns the fastest strategy whose estimated peak memory fits the
+    budget (see the module docstring).
+
+    Parameters
+    ----------
+    input_size : int
+        (uncompressed) size of the JSON input, in bytes
+
+    max_memory : int
+        memory budget of the process, in bytes
+
+    baseline : int
+        memory already used by the process, in bytes. Defaults to its
+        current resident set size.
+
+    Returns
+    ----------
+    str
+        "memory", "spill" or "stream".
+    """
+    if baseline is None:
+        baseline = current_rss()
+    available = max_memory - baseline
+    if input_size * MEMORY_FACTOR <= available:
+        return "memory"
+    if input_size * SPILL_FACTOR <= available:
+        return "spill"
+    return "stream"
+
+
+class _Scanner:
+    """
+    Incremental reader of JSON values from a binary file: values are decoded
+    from a sliding text buffer, refilled as needed, so only the value being
+    decoded needs to fit in memory.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+    def _fill(self):
+        chunk = self.file.read(READ_SIZE)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + \
+            self._decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+
+    def peek(self):
+        """
+        Skips whitespace, and returns the next character ("" at the end).
+        """
+        while True:
+            buffer = self.buffer
+            pos = self.pos
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            self.pos = pos
+            if pos < len(buffer) or self.eof:
+                return buffer[pos:pos + 1]
+            self._fill()
+
+    def expect(self, chars):
+        """
+        Consumes the next character, which must be one of chars.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise Exception(f"Invalid JSON input: expected {chars!r} -- \
+                    Found: {char or 'end of file'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decodes and returns the next JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+                # A value ending with the buffer may be cut short (e.g. a
+                # number), unless the file is exhausted
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iter_array(self):
+        """
+        Yields the elements of the array starting at the next character.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def _spool_payees(payee_iter, spill_dir):
+    spool = tempfile.TemporaryFile(mode="w+", encoding="utf-8",
+                                   prefix="fire-1099-payees-", dir=spill_dir)
+    for payee in payee_iter:
+        spool.write(json.dumps(payee))
+        spool.write("\n")
+    spool.seek(0)
+    return spool
+
+
+def _iter_spool(spool):
+    with spool:
+        for line in spool:
+            yield json.loads(line)
+
+
+def read_streaming(path, spill_dir=None):
+    """
+    Reads user data from a (possibly compressed) JSON input without loading
+    its payees: every other top-level key is loaded, and the payees are read
+    one at a time as they are iterated.
+
+    The payees are streamed from the input if the transmitter and payer
+    precede them. Otherwise, they are copied to an unnamed temporary file
+    (one JSON line per payee) while the rest of the input is read, and
+    streamed from there. Keys following the payees are read, and added to
+    the returned dict, once the payees have been exhausted.
+
+    Parameters
+    ----------
+    path : str
+        system path of the JSON input
+
+    spill_dir : str
+        optional directory for the temporary payee file
+
+    Returns
+    ----------
+    dict
+        User data, whose payees are an iterator of dict.
+    """
+    file = open_input(path)
+    scanner = _Scanner(file)
+    data = {}
+
+    def read_keys(first):
+        while first or scanner.expect(",}") == ",":
+            first = False
+            if scanner.peek() == "}":
+                scanner.pos += 1
+                return None
+            key = scanner.value()
+            scanner.expect(":")
+            if key == "payees":
+                return key
+            data[key] = scanner.value()
+        return None
+
+    def stream_payees():
+        with file:
+            yield from scanner.iter_array()
+            read_keys(False)
+
+    try:
+        scanner.expect("{")
+        if read_keys(True) is None:
+            file.close()
+            data.setdefault("payees", iter(()))
+            return data
+        if "transmitter" in data and "payer" in data:
+            data["payees"] = stream_payees()
+            return data
+        spool = _spool_payees(scanner.iter_array(), spill_dir)
+        read_keys(False)
+    except BaseException:
+        file.close()
+        raise
+    file.close()
+    data["payees"] = _iter_spool(spool)
+    return data
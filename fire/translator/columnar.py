@@ -0,0 +1,440 @@
+"""
+Module: Columnar
+Payee input from Apache Arrow columnar files (Parquet and Feather), such as
+payee tables exported from a data warehouse.
+
+The transmitter and payer still come from a JSON input file; the payees come
+from a Parquet or Feather file with one column per payee field, named as in
+payees._ITEMS. Only those columns are read. The file is read in record
+batches, and each batch is validated, transformed and rendered column by
+column with Arrow compute kernels: every payee field becomes a column of
+fixed-width strings, the columns are joined into a column of 750-byte B
+records, and the buffer holding those records is written to the output as
+is. Payment totals are column sums, and per-state totals a group by.
+
+Python code only runs per value for columns holding non-ASCII text (which
+is transliterated as in the JSON path, see util.to_ascii) and for fields
+whose layout declares no transform kind (see layouts.TRANSFORM_KINDS), so
+throughput does not depend on building a Python object per payee.
+
+pyarrow is an optional dependency, only imported when a columnar file is
+read.
+"""
+import os.path
+import json
+
+from fire.entities import transmitter, payer
+# Registers the "payees" layout
+from fire.entities import payees # pylint: disable=unused-import
+from . import metrics
+from .layouts import get_layout
+from .util import AMOUNT_CODES, to_ascii
+
+COLUMNAR_FORMATS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather"
+}
+# Number of payees rendered at a time
+DEFAULT_BATCH_SIZE = 1 << 16
+RECORD_LENGTH = 750
+# Rendered records of a batch must fit in a single Arrow string buffer
+MAX_BATCH_SIZE = (2 ** 31 - 1) // RECORD_LENGTH
+# Payee fields generated while writing, rather than read from the input
+GENERATED_FIELDS = ("record_sequence_number",)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        raise Exception("Parquet and Feather input require pyarrow \
+                -- Install it with: pip install pyarrow")
+    return pyarrow, pyarrow.compute
+
+
+def columnar_format(path):
+    """
+    Returns the columnar format implied by the extension of path.
+
+    Parameters
+    ----------
+    path : str
+        system path of a file
+
+    Returns
+    ----------
+    str or None
+        "parquet", "feather", or None for other files.
+    """
+    return COLUMNAR_FORMATS.get(os.path.splitext(path)[1].lower())
+
+
+def _check_format(path):
+    file_format = columnar_format(path)
+    if file_format is None:
+        raise Exception(f"Unknown columnar file type: {path} \
+                -- Expected one of: {', '.join(COLUMNAR_FORMATS)}")
+    return file_format
+
+
+def iter_batches(path, batch_size=DEFAULT_BATCH_SIZE, columns=None):
+    """
+    Yields the record batches of a Parquet or Feather file, of at most
+    batch_size rows. Feather files are memory-mapped, and their batches are
+    sliced without copying.
+
+    Parameters
+    ----------
+    path : str
+        system path of a .parquet/.pq or .feather/.arrow file
+
+    batch_size : int
+        maximum number of rows per batch
+
+    columns : collection of str
+        optional names of the columns to read. Other columns may be left out
+        of the batches.
+
+    Yields
+    ----------
+    pyarrow.RecordBatch
+        Record batch.
+    """
+    pa, _ = _import_pyarrow()
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    if _check_format(path) == "parquet":
+        import pyarrow.parquet
+        parquet_file = pyarrow.parquet.ParquetFile(path, memory_map=True)
+        names = parquet_file.schema_arrow.names
+        if columns is not None:
+            names = [name for name in names if name in columns]
+        yield from parquet_file.iter_batches(batch_size, columns=names)
+        return
+
+    import pyarrow.ipc
+    reader = pyarrow.ipc.open_file(pa.memory_map(path))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        for start in range(0, batch.num_rows, batch_size):
+            yield batch.slice(start, batch_size)
+
+
+def column_names(path):
+    """
+    Returns the column names of a Parquet or Feather file, from its schema.
+
+    Parameters
+    ----------
+    path : str
+        system path of a .parquet/.pq or .feather/.arrow file
+
+    Returns
+    ----------
+    list of str
+        Column names.
+    """
+    pa, _ = _import_pyarrow()
+    if _check_format(path) == "parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.read_schema(path).names
+    import pyarrow.ipc
+    with pa.memory_map(path) as source:
+        return pyarrow.ipc.open_file(source).schema.names
+
+
+def _resolve(schema, definition):
+    while "$ref" in definition:
+        definition = schema["definitions"][definition["$ref"].split("/")[-1]]
+    return definition
+
+
+class BatchRenderer:
+    """
+    Validates, transforms and renders record batches of payees into B
+    records, column by column (see the module docstring).
+
+    Attributes
+    ----------
+    self.columns : list of str
+        Payee fields read from the input, in record order.
+
+    self.required : list of str
+        Payee fields the schema requires.
+
+    Methods
+    ----------
+    check_columns(names):
+        Checks that the input has every required column.
+
+    render(batch, first_sequence, offset):
+        Returns the B records of a batch, with their totals.
+    """
+    def __init__(self, schema_path):
+        with open(schema_path, mode="r", encoding="utf-8") as schema_file:
+            schema = json.load(schema_file)
+        items = schema["properties"]["payees"]["items"]
+        self.required = list(items.get("required", []))
+        self._checks = {}
+        for field, definition in items["properties"].items():
+            definition = _resolve(schema, definition)
+            if field in GENERATED_FIELDS or not any(
+                    key in definition for key in
+                    ("pattern", "minLength", "maxLength")):
+                continue
+            self._checks[field] = (definition.get("pattern"),
+                                   definition.get("minLength"),
+                                   definition.get("maxLength"))
+        layout = get_layout("payees")
+        self._fields = [(field.name, field.default, field.length, field.fill,
+                         field.transform, layout.kinds[field.name])
+                        for field in layout.fields]
+        self.columns = [field[0] for field in self._fields
+                        if field[0] not in GENERATED_FIELDS]
+
+    def check_columns(self, names):
+        """
+        Raises an Exception if a column required by the schema is missing.
+
+        Parameters
+        ----------
+        names : collection of str
+            column names of the input
+        """
+        missing = [field for field in self.required if field not in names]
+        if missing:
+            raise Exception(f"Missing required payee columns: \
+                    {', '.join(missing)}")
+
+    def _validate(self, pc, name, column, offset):
+        if name in self.required and column.null_count:
+            index = pc.index(pc.is_null(column), True).as_py()
+            raise Exception(f"Invalid payee {offset + index}: \
+                    {name} is required")
+        if name not in self._checks:
+            return
+        pattern, min_length, max_length = self._checks[name]
+        lengths = pc.utf8_length(column)
+        checks = []
+        if pattern is not None:
+            checks.append(pc.match_substring_regex(column, pattern))
+        if min_length is not None:
+            checks.append(pc.greater_equal(lengths, min_length))
+        if max_length is not None:
+            checks.append(pc.less_equal(lengths, max_length))
+        valid = checks[0]
+        for check in checks[1:]:
+            valid = pc.and_(valid, check)
+        if pc.all(valid).as_py() is False:
+            index = pc.index(valid, False).as_py()
+            raise Exception(f"Invalid payee {offset + index}: {name} \
+                    -- Value: {column[index].as_py()!r}")
+
+    def _transform(self, pa, pc, column, default, length, transform, kind):
+        is_ascii = pc.all(pc.string_is_ascii(column)).as_py() is not False
+        if kind is None or not is_ascii:
+            return pa.array(
+                [default if value is None
+                 else to_ascii(transform(value), length).decode("ascii")
+                 for value in column.to_pylist()], pa.string())
+        if kind == "uppercase":
+            column = pc.ascii_upper(column)
+        elif kind in ("digits_only", "rjust_zero"):
+            column = pc.replace_substring_regex(column, "[^0-9]", "")
+            if kind == "rjust_zero":
+                column = pc.utf8_lpad(column, length, "0")
+        return pc.fill_null(column, default)
+
+    def render(self, batch, first_sequence, offset=0):
+        """
+        Validates, transforms and renders a record batch of payees. Missing
+        columns and null values take the field's default value, as missing
+        keys do in JSON input. Columns of other types than string are cast
+        to string first.
+
+        Parameters
+        ----------
+        batch : pyarrow.RecordBatch
+            Record batch of payees.
+
+        first_sequence : int
+            Sequence number of the first payee of the batch.
+
+        offset : int
+            Position of the first payee of the batch in the input, for error
+            messages.
+
+        Returns
+        ----------
+        tuple
+            The concatenated FIRE-formatted records (a memoryview of the
+            Arrow buffer), the payment totals of the batch in the order of
+            AMOUNT_CODES, and the transformed (unpadded) columns, keyed by
+            field name.
+        """
+        pa, pc = _import_pyarrow()
+        count = batch.num_rows
+        names = batch.schema.names
+        values = {}
+        padded = []
+        for name, default, length, fill, transform, kind in self._fields:
+            if name == "record_sequence_number":
+                column = pc.utf8_lpad(pc.cast(pa.array(
+                    range(first_sequence, first_sequence + count),
+                    pa.int64()), pa.string()), length, "0")
+            elif name in names:
+                column = batch.column(names.index(name))
+                if column.type != pa.string():
+                    column = pc.cast(column, pa.string())
+                self._validate(pc, name, column, offset)
+                column = self._transform(pa, pc, column, default, length,
+                                         transform, kind)
+            else:
+                values[name] = pa.scalar(default, pa.string())
+                padded.append(default.ljust(length, fill))
+                continue
+            lengths = pc.utf8_length(column)
+            if count and pc.max(lengths).as_py() > length:
+                index = pc.index(pc.greater(lengths, length), True).as_py()
+                raise Exception(f"Generated a record string of incorrect \
+                        length: Expected: {length} -- Key: {name} \
+                        -- Payee: {offset + index} \
+                        -- Value: {column[index].as_py()}")
+            values[name] = column
+            padded.append(pc.utf8_rpad(column, length, fill))
+        metrics.count("payees_processed", count)
+
+        if count == 0:
+            return b"", [0] * len(AMOUNT_CODES), values
+        records = pc.binary_join_element_wise(*padded, "")
+        offsets = memoryview(records.buffers()[1]).cast("i")
+        start = offsets[records.offset]
+        end = offsets[records.offset + count]
+        if end - start != count * RECORD_LENGTH:
+            raise Exception(f"Generated records of invalid length: \
+                    {end - start} -- Expected: {count * RECORD_LENGTH}")
+        amounts = []
+        for code in AMOUNT_CODES:
+            column = values["payment_amount_" + code]
+            if isinstance(column, pa.Scalar):
+                amounts.append(count * int(column.as_py()))
+            else:
+                amounts.append(
+                    pc.sum(pc.cast(column, pa.int64())).as_py() or 0)
+        return memoryview(records.buffers()[2])[start:end], amounts, values
+
+
+def add_state_totals(states, values, count):
+    """
+    Adds the transformed payee columns of a batch to per-state totals,
+    grouping by combined_federal_state_code. Payees without a numeric state
+    code do not participate, as in StateTotals.add().
+
+    Parameters
+    ----------
+    states : StateTotals
+        Per-state totals to add to.
+
+    values : dict
+        Transformed columns of the batch, as returned by
+        BatchRenderer.render().
+
+    count : int
+        Number of payees in the batch.
+    """
+    pa, pc = _import_pyarrow()
+
+    def column_of(name, digits=False):
+        column = values[name]
+        if isinstance(column, pa.Scalar):
+            column = pa.array([column.as_py()] * count, pa.string())
+        if digits:
+            column = pc.replace_substring_regex(column, "[^0-9]", "")
+            column = pc.cast(pc.if_else(pc.equal(column, ""), "0", column),
+                             pa.int64())
+        return column
+
+    codes = column_of("combined_federal_state_code")
+    table = pa.table(
+        [pc.cast(pc.if_else(pc.match_substring_regex(codes, "^[0-9]+$"),
+                            codes, None), pa.int64())] +
+        [column_of("payment_amount_" + code, True) for code in AMOUNT_CODES] +
+        [column_of("state_income_tax_withheld", True),
+         column_of("local_income_tax_withheld", True)],
+        names=["code"] + list(AMOUNT_CODES) + ["state_tax", "local_tax"])
+    table = table.filter(pc.is_valid(table.column("code")))
+    grouped = table.group_by("code").aggregate(
+        [("code", "count")] +
+        [(name, "sum") for name in table.column_names[1:]])
+    for row in grouped.to_pylist():
+        code = row["code"]
+        states.payee_counts[code] += row["code_count"]
+        totals = states.totals[code]
+        for i, amount_code in enumerate(AMOUNT_CODES):
+            totals[i] += row[amount_code + "_sum"]
+        states.state_tax_withheld[code] += row["state_tax_sum"]
+        states.local_tax_withheld[code] += row["local_tax_sum"]
+
+
+def write_columnar(data, payees_path, path, type="MISC", archive_path=None,
+                   batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Validates the transmitter and payer in user data, and writes a
+    transmission to path with the payees of a Parquet or Feather file,
+    rendered one record batch at a time (see the module docstring).
+
+    Parameters
+    ----------
+    data : dict
+        user input data, as returned by translator.extract_user_data(). Its
+        payees, if any, are ignored.
+
+    payees_path : str
+        system path of the Parquet (.parquet, .pq) or Feather (.feather,
+        .arrow) payee file
+
+    path : str
+        system path of the output file
+
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    archive_path : str
+        optional path of an archival copy (see writer.write_records)
+
+    batch_size : int
+        maximum number of payees rendered at a time
+
+    Returns
+    ----------
+    int
+        Number of payees written.
+    """
+    from . import translator
+    from .reject import validate_header
+    from .writer import RecordWriter, stream_records
+
+    schema_path = translator.get_schema_path(type)
+    validate_header(data, schema_path)
+    renderer = BatchRenderer(schema_path)
+    transmitter_data = transmitter.xform(data["transmitter"])
+    payer_data = payer.xform(data["payer"])
+
+    renderer.check_columns(column_names(payees_path))
+
+    def fill(file):
+        record_writer = RecordWriter(file, transmitter_data, payer_data)
+        for batch in iter_batches(payees_path, batch_size, renderer.columns):
+            offset = record_writer.totals.payee_count
+            records, amounts, values = renderer.render(
+                batch, record_writer.seq.get_current() + 1, offset)
+            record_writer.write_block(records, batch.num_rows, amounts)
+            if record_writer.states is not None and batch.num_rows:
+                add_state_totals(record_writer.states, values,
+                                 batch.num_rows)
+        record_writer.finish()
+        return record_writer.totals.payee_count
+
+    return stream_records(fill, path, archive_path)
@@ -0,0 +1,130 @@
+"""
+Module: Compression
+Transparent reading and writing of gzip, xz and bz2 compressed files, using
+the standard library codecs.
+
+Input files are recognized by their magic bytes, falling back to their
+extension; output files are compressed according to their extension. Codec
+modules are only imported when a compressed file is actually encountered.
+"""
+import os.path
+
+# Output compression, by file extension
+COMPRESSION_SUFFIXES = {
+    ".gz": "gzip",
+    ".xz": "xz",
+    ".bz2": "bz2"
+}
+# Input compression, by leading bytes
+COMPRESSION_MAGIC = [
+    (b"\x1f\x8b", "gzip"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"BZh", "bz2")
+]
+MAGIC_LENGTH = max(len(magic) for magic, _ in COMPRESSION_MAGIC)
+
+
+def compression_for_path(path):
+    """
+    Returns the compression implied by the extension of path.
+
+    Parameters
+    ----------
+    path : str
+        system path of a file
+
+    Returns
+    ----------
+    str or None
+        "gzip", "xz", "bz2", or None for uncompressed files.
+    """
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
+def detect_compression(path):
+    """
+    Returns the compression of an existing file, from its magic bytes if it
+    has any, and otherwise from its extension.
+
+    Parameters
+    ----------
+    path : str
+        system path of an existing file
+
+    Returns
+    ----------
+    str or None
+        "gzip", "xz", "bz2", or None for uncompressed files.
+    """
+    with open(path, mode="rb") as file:
+        head = file.read(MAGIC_LENGTH)
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    if head.lstrip()[:1] in (b"{", b"["):
+        return None
+    return compression_for_path(path)
+
+
+def open_input(path):
+    """
+    Opens a possibly compressed file for binary reading, decompressing it on
+    the fly (see detect_compression).
+
+    Parameters
+    ----------
+    path : str
+        system path of an existing file
+
+    Returns
+    ----------
+    file object
+        Binary file object yielding the decompressed contents.
+    """
+    compression = detect_compression(path)
+    if compression == "gzip":
+        import gzip
+        return gzip.open(path, mode="rb")
+    if compression == "xz":
+        import lzma
+        return lzma.open(path, mode="rb")
+    if compression == "bz2":
+        import bz2
+        return bz2.open(path, mode="rb")
+    return open(path, mode="rb")
+
+
+def compress_stream(file, compression):
+    """
+    Wraps a binary file object opened for writing in a compressor. Closing
+    the returned object flushes the compressed stream, but leaves file open,
+    so that it can be fsync'd (see writer.write_records). gzip streams are
+    written without a file name or timestamp, so that identical input gives
+    identical output.
+
+    Parameters
+    ----------
+    file : file object
+        Binary file object opened for writing.
+
+    compression : str
+        "gzip", "xz", "bz2", or None to write uncompressed.
+
+    Returns
+    ----------
+    file object
+        Object to write the uncompressed contents to, or file itself if
+        compression is None.
+    """
+    if compression == "gzip":
+        import gzip
+        return gzip.GzipFile(filename="", mode="wb", fileobj=file, mtime=0)
+    if compression == "xz":
+        import lzma
+        return lzma.LZMAFile(file, mode="wb")
+    if compression == "bz2":
+        import bz2
+        return bz2.BZ2File(file, mode="wb")
+    if compression is not None:
+        raise Exception(f"Unsupported compression: {compression}")
+    return file
@@ -0,0 +1,274 @@
+"""
+Module: Dedup
+Detects and merges duplicate payees in user data, before it is merged into
+the master schema.
+
+Payees are duplicates if they have the same TIN (digits only) and the same
+payer's account number (case and surrounding whitespace ignored). Duplicates
+are merged into the first occurrence: payment amounts are summed, and name
+and address fields keep their first value, with any differing values
+reported as conflicts.
+
+The index of merged payees is kept in memory up to a memory budget. Beyond
+that, it is spilled to an SQLite database in a temporary file. Input payees
+are released as they are added to the index, and the merged payees are then
+read back from it one at a time as the output is written, so deduplication
+adds at most the memory budget to the memory needed to hold the input. (The
+input itself is still loaded in full, and runs that are neither sorted nor
+screened hold all merged payees while converting them.)
+"""
+import os
+import json
+import sqlite3
+import tempfile
+
+from .extsort import drain
+from .util import digits_only, AMOUNT_CODES
+
+# Default budget for the in-memory index, in bytes
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+# Estimated per-entry overhead of the in-memory index (dict entry, key tuple,
+# payee dict and string objects), in bytes
+ENTRY_OVERHEAD = 1024
+
+AMOUNT_FIELDS = ["payment_amount_" + code for code in AMOUNT_CODES]
+CONFLICT_FIELDS = [
+    "payees_name_control",
+    "first_payee_name_line",
+    "second_payee_name_line",
+    "payee_mailing_address",
+    "payee_city",
+    "payee_state",
+    "payee_zip_code"
+]
+
+
+def payee_key(payee):
+    """
+    Returns the deduplication key of a (user-supplied) payee: its TIN with
+    punctuation removed, and its account number normalized to uppercase
+    without surrounding whitespace.
+
+    Parameters
+    ----------
+    payee : dict
+        user-supplied payee data
+
+    Returns
+    ----------
+    str
+        Deduplication key.
+    """
+    return digits_only(payee.get("payees_tin", "")) + "|" + \
+        payee.get("payers_account_number_for_payee", "").strip().upper()
+
+
+def merge_payee(merged, duplicate, key, conflicts):
+    """
+    Merges duplicate into merged: payment amounts are summed, and differing
+    name and address values are appended to conflicts. _Note: this edits
+    merged and conflicts in-place._
+
+    Parameters
+    ----------
+    merged : dict
+        payee that duplicate is merged into
+
+    duplicate : dict
+        payee with the same key as merged
+
+    key : str
+        deduplication key of both payees
+
+    conflicts : list of dict
+        list to append conflicts to
+    """
+    for field in AMOUNT_FIELDS:
+        if field in duplicate:
+            total = int(digits_only(merged.get(field, "")) or 0) + \
+                int(digits_only(duplicate[field]) or 0)
+            merged[field] = str(total)
+    for field in CONFLICT_FIELDS:
+        if field not in duplicate:
+            continue
+        kept = merged.get(field, "")
+        if kept.strip().upper() != duplicate[field].strip().upper():
+            conflicts.append({"key": key, "field": field,
+                              "kept": kept, "discarded": duplicate[field]})
+
+
+class PayeeIndex:
+    """
+    Hash index of merged payees, keyed by payee_key(). Entries are kept in a
+    dict until their estimated size exceeds the memory budget; they are then
+    moved to an SQLite table (indexed on the key) in a temporary file. The
+    dict and the table never hold the same key.
+
+    Attributes
+    ----------
+    self.conflicts : list of dict
+        Conflicting name/address values found while merging.
+
+    self.input_count : int
+        Number of payees added.
+
+    self.duplicate_count : int
+        Number of payees merged into an earlier payee.
+
+    Methods
+    ----------
+    add(payee):
+        Adds a payee, merging it into an earlier payee with the same key.
+
+    __iter__():
+        Iterates over merged payees, in order of first occurrence.
+
+    close():
+        Removes the spill file, if any. Also called when the index is
+        garbage collected.
+    """
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, spill_dir=None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.conflicts = []
+        self.input_count = 0
+        self.duplicate_count = 0
+        self._entries = {}
+        self._memory_used = 0
+        self._db = None
+        self._db_path = None
+
+    def add(self, payee):
+        """
+        Adds a payee to the index.
+
+        Parameters
+        ----------
+        payee : dict
+            user-supplied payee data
+        """
+        key = payee_key(payee)
+        position = self.input_count
+        self.input_count += 1
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.duplicate_count += 1
+            merge_payee(entry[1], payee, key, self.conflicts)
+            return
+
+        if self._db is not None:
+            row = self._db.execute("SELECT data FROM payees WHERE key = ?",
+                                   (key,)).fetchone()
+            if row is not None:
+                self.duplicate_count += 1
+                merged = json.loads(row[0])
+                merge_payee(merged, payee, key, self.conflicts)
+                self._db.execute("UPDATE payees SET data = ? WHERE key = ?",
+                                 (json.dumps(merged), key))
+                return
+
+        self._entries[key] = (position, dict(payee))
+        self._memory_used += ENTRY_OVERHEAD + sum(
+            len(field) + len(value) for field, value in payee.items()
+            if isinstance(value, str))
+        if self._memory_used > self.memory_budget:
+            self._spill()
+
+    def _spill(self):
+        if self._db is None:
+            handle, self._db_path = tempfile.mkstemp(
+                prefix="fire-1099-dedup-", suffix=".db", dir=self.spill_dir)
+            os.close(handle)
+            self._db = sqlite3.connect(self._db_path)
+            self._db.execute("PRAGMA journal_mode = OFF")
+            self._db.execute("PRAGMA synchronous = OFF")
+            self._db.execute("CREATE TABLE payees (key TEXT PRIMARY KEY, "
+                             "position INTEGER, data TEXT)")
+        self._db.executemany(
+            "INSERT INTO payees VALUES (?, ?, ?)",
+            ((key, position, json.dumps(payee))
+             for key, (position, payee) in self._entries.items()))
+        self._entries = {}
+        self._memory_used = 0
+
+    @property
+    def spilled(self):
+        """
+        True if the index has been spilled to disk.
+        """
+        return self._db is not None
+
+    def __iter__(self):
+        if self._db is None:
+            for _, payee in sorted(self._entries.values(),
+                                   key=lambda entry: entry[0]):
+                yield payee
+            return
+        self._spill()
+        for (data,) in self._db.execute(
+                "SELECT data FROM payees ORDER BY position"):
+            yield json.loads(data)
+
+    def close(self):
+        """
+        Closes and removes the spill database, if any.
+        """
+        if self._db is not None:
+            self._db.close()
+            os.remove(self._db_path)
+            self._db = None
+
+    def __del__(self):
+        self.close()
+
+
+def _iter_merged(index):
+    try:
+        yield from index
+    finally:
+        index.close()
+
+
+def dedup_user_data(data, memory_budget=DEFAULT_MEMORY_BUDGET,
+                    spill_dir=None):
+    """
+    Replaces the payees in user data with an iterator over the deduplicated
+    payees, in order of first occurrence. The input payees are released as
+    they are indexed, and the spill file, if any, is removed once the
+    iterator is exhausted or closed. _Note: this edits the input parameter
+    in-place._
+
+    Parameters
+    ----------
+    data : dict
+        user input data, as returned by translator.extract_user_data()
+
+    memory_budget : int
+        budget for the in-memory index, in bytes
+
+    spill_dir : str
+        optional directory for the spill file. Defaults to the system
+        temporary directory.
+
+    Returns
+    ----------
+    dict
+        Report of the deduplication: input_payees, output_payees,
+        duplicates, spilled and conflicts.
+    """
+    index = PayeeIndex(memory_budget, spill_dir)
+    try:
+        for payee in drain(data["payees"]):
+            index.add(payee)
+    except BaseException:
+        index.close()
+        raise
+    data["payees"] = _iter_merged(index)
+    return {
+        "input_payees": index.input_count,
+        "output_payees": index.input_count - index.duplicate_count,
+        "duplicates": index.duplicate_count,
+        "spilled": index.spilled,
+        "conflicts": index.conflicts
+    }
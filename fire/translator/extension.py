@@ -0,0 +1,98 @@
+"""
+Module: Extension
+Processes a user-provided JSON file listing payers into a bulk Extension of
+Time (Form 8809) request file, in the format required by IRS Publication
+1220.
+
+Expected input:
+
+    {
+        "transmitter_control_code": "55AA5",
+        "payers": [{"payer_tin": ..., "first_payer_name": ..., ...}, ...]
+    }
+
+The transmitter control code applies to every payer, unless a payer supplies
+its own. Payers are transformed and rendered one at a time through the
+compiled encoder of entities.extension_of_time, and written to disk as they
+are rendered.
+"""
+import os.path
+from time import gmtime, strftime
+
+from fire.entities import extension_of_time
+from . import translator
+from .writer import write_records
+
+
+def get_schema_path():
+    """
+    Returns the system path of the schema used to validate extension of time
+    input data.
+
+    Returns
+    ----------
+    str
+        system path for the schema file
+    """
+    module_path = os.path.split(os.path.realpath(__file__))[0]
+    return os.path.join(module_path, "../schema",
+                        "extension_of_time_schema.json")
+
+
+def run(input_path, output_path=None):
+    """
+    Sequentially calls helper functions to fully process an extension of time
+    input file:
+    * Load user JSON data from input file
+    * Validate user data against the extension of time schema
+    * Transform and format each payer, writing records to the output file
+
+    Parameters
+    ----------
+    input_path : str
+        system path for file containing the user input JSON data
+
+    output_path : str
+        optional system path for the output to be generated
+
+    Returns
+    ----------
+    int
+        Number of extension records written.
+    """
+    if output_path is None:
+        input_dirname = os.path.dirname(os.path.abspath(input_path))
+        output_path = "{}/extension_{}".format(
+            input_dirname, strftime("%Y-%m-%d %H_%M_%S", gmtime())
+        )
+
+    user_data = translator.extract_user_data(input_path)
+    translator.validate_user_data(user_data, get_schema_path())
+    return write_records(iter_extension_records(user_data, binary=True),
+                         output_path)
+
+
+def iter_extension_records(data, binary=False):
+    """
+    Yields one FIRE-formatted extension of time record per payer in data.
+
+    Parameters
+    ----------
+    data : dict
+        Validated extension of time input data.
+
+    binary : bool
+        If True, records are yielded as ASCII bytes (see
+        extension_of_time.fire_bytes).
+
+    Yields
+    ----------
+    str or bytes
+        200-character extension of time record.
+    """
+    control_code = data["transmitter_control_code"]
+    fire = extension_of_time.fire_bytes if binary else extension_of_time.fire
+    for payer in data["payers"]:
+        record = {"transmitter_control_code": control_code}
+        record.update(payer)
+        yield fire(extension_of_time.xform(record))
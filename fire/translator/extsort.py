@@ -0,0 +1,185 @@
+"""
+Module: Extsort
+Sorts payees into a deterministic order (by TIN, name or account number)
+without holding them all in memory.
+
+Payees are sorted with an external merge sort: they are read in runs of a
+fixed size, each run is sorted in memory and spilled to a temporary file as
+JSON lines, and the runs are then merged with a k-way merge. Ties are broken
+by input position, so that the same input always produces the same output.
+Inputs that fit in a single run are sorted in memory without touching disk.
+"""
+import json
+import heapq
+import tempfile
+from operator import itemgetter
+
+from .util import digits_only
+
+# Number of payees sorted in memory before a run is spilled to disk
+DEFAULT_RUN_SIZE = 50000
+# Maximum number of runs merged at once; more runs are merged in passes
+MAX_MERGE_WIDTH = 64
+
+_ENTRY_ORDER = itemgetter(0, 1)
+
+
+def tin_key(payee):
+    """
+    Sort key for a (user-supplied) payee: TIN with punctuation removed.
+    """
+    return digits_only(payee.get("payees_tin", ""))
+
+
+def name_key(payee):
+    """
+    Sort key for a (user-supplied) payee: payee name lines, uppercased.
+    """
+    return " ".join([payee.get("first_payee_name_line", "").strip().upper(),
+                     payee.get("second_payee_name_line", "").strip().upper()])
+
+
+def account_key(payee):
+    """
+    Sort key for a (user-supplied) payee: payer's account number for the
+    payee, uppercased.
+    """
+    return payee.get("payers_account_number_for_payee", "").strip().upper()
+
+
+SORT_KEYS = {
+    "tin": tin_key,
+    "name": name_key,
+    "account": account_key
+}
+
+
+def drain(items):
+    """
+    Yields the elements of a list, releasing the list's reference to each
+    element as it is yielded, so that elements no longer needed by the
+    consumer can be freed before the list is exhausted. _Note: this leaves
+    the list empty._ Other iterables are yielded from as they are.
+
+    Parameters
+    ----------
+    items : list or iterable
+
+    Yields
+    ----------
+    Elements of items, in order.
+    """
+    if not isinstance(items, list):
+        yield from items
+        return
+    for i, item in enumerate(items):
+        items[i] = None
+        yield item
+    items.clear()
+
+
+def _write_run(entries, spill_dir):
+    run = tempfile.TemporaryFile(mode="w+", encoding="utf-8",
+                                 prefix="fire-1099-sort-", dir=spill_dir)
+    for entry in entries:
+        run.write(json.dumps(entry))
+        run.write("\n")
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    for line in run:
+        yield json.loads(line)
+
+
+def _merge_runs(runs, spill_dir):
+    while len(runs) > MAX_MERGE_WIDTH:
+        group, runs = runs[:MAX_MERGE_WIDTH], runs[MAX_MERGE_WIDTH:]
+        runs.append(_write_run(heapq.merge(
+            *[_read_run(run) for run in group], key=_ENTRY_ORDER), spill_dir))
+        for run in group:
+            run.close()
+    return runs
+
+
+def external_sort(items, key, run_size=DEFAULT_RUN_SIZE, spill_dir=None):
+    """
+    Yields items in order of key(item), then of input position. At most
+    run_size items are held in memory at once (plus one buffered item per
+    run during the merge).
+
+    Parameters
+    ----------
+    items : iterable of dict
+        JSON-serializable items to sort.
+
+    key : function
+        Returns the sort key (a str) of an item.
+
+    run_size : int
+        Number of items sorted in memory before being spilled to disk.
+
+    spill_dir : str
+        optional directory for run files. Defaults to the system temporary
+        directory.
+
+    Yields
+    ----------
+    dict
+        Items, in sorted order. Items spilled to disk are copies.
+    """
+    runs = []
+    entries = []
+    try:
+        for position, item in enumerate(items):
+            entries.append((key(item), position, item))
+            if len(entries) >= run_size:
+                entries.sort(key=_ENTRY_ORDER)
+                runs.append(_write_run(entries, spill_dir))
+                entries = []
+        entries.sort(key=_ENTRY_ORDER)
+
+        if not runs:
+            for _, _, item in entries:
+                yield item
+            return
+
+        runs = _merge_runs(runs, spill_dir)
+        for _, _, item in heapq.merge(*[_read_run(run) for run in runs],
+                                      iter(entries), key=_ENTRY_ORDER):
+            yield item
+    finally:
+        for run in runs:
+            run.close()
+
+
+def sort_payees(payee_list, sort_by, run_size=DEFAULT_RUN_SIZE,
+                spill_dir=None):
+    """
+    Yields (user-supplied) payees sorted by the given field. See
+    external_sort().
+
+    Parameters
+    ----------
+    payee_list : iterable of dict
+        user-supplied payee data
+
+    sort_by : str
+        "tin", "name" or "account"
+
+    run_size : int
+        Number of payees sorted in memory before being spilled to disk.
+
+    spill_dir : str
+        optional directory for run files.
+
+    Yields
+    ----------
+    dict
+        Payees, in sorted order.
+    """
+    if sort_by not in SORT_KEYS:
+        raise Exception(f"Unknown sort order: {sort_by} \
+                -- Expected one of: {', '.join(SORT_KEYS)}")
+    return external_sort(payee_list, SORT_KEYS[sort_by], run_size, spill_dir)
@@ -0,0 +1,223 @@
+"""
+Module: Index
+Sidecar index of the payee records in a FIRE output file, for looking up the
+records of a payee without scanning the whole file.
+
+The index maps each payee's TIN, account number and name control to the
+sequence numbers of its B records. Keys are stored as 8-byte hashes, so the
+index is a compact array of fixed-size entries (hash, sequence number),
+sorted by hash, and is searched by binary search over a memory map of the
+file. Records found through the index are read directly at their offset in
+the output file (records are fixed-width, and numbered from 1), and checked
+against the query, so hash collisions never produce false matches.
+
+The index records the size of the output file it was built from, and is
+refused if the output file has changed size since.
+"""
+import os
+import mmap
+import struct
+import hashlib
+
+from fire.entities import payees
+from .util import digits_only, uppercase
+from .writer import write_records
+from .compression import compression_for_path
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"FIRE1IDX"
+RECORD_LENGTH = 750
+# Magic, number of entries, size of the indexed output file
+_HEADER = struct.Struct(">8sQQ")
+# Key hash, record sequence number
+_ENTRY = struct.Struct(">8sI")
+_HASH_LENGTH = 8
+_SEQUENCE_START = 499
+_SEQUENCE_END = 507
+
+
+def _normalize_tin(value):
+    return digits_only(value)
+
+
+def _normalize_account(value):
+    return value.strip()
+
+
+def _normalize_name_control(value):
+    return uppercase(value.strip())
+
+
+# Indexed keys: normalization of query values, and payee record field
+INDEX_KEYS = {
+    "tin": (_normalize_tin, "payees_tin"),
+    "account": (_normalize_account, "payers_account_number_for_payee"),
+    "name_control": (_normalize_name_control, "payees_name_control")
+}
+
+
+def key_hash(kind, value):
+    """
+    Returns the hash under which a normalized key value is indexed.
+
+    Parameters
+    ----------
+    kind : str
+        "tin", "account" or "name_control"
+
+    value : str
+        normalized key value
+
+    Returns
+    ----------
+    bytes
+        8-byte hash.
+    """
+    return hashlib.blake2b(f"{kind}:{value}".encode("utf-8"),
+                           digest_size=_HASH_LENGTH).digest()
+
+
+def get_index_path(output_path):
+    """
+    Returns the default path of the index of an output file.
+    """
+    return output_path + INDEX_SUFFIX
+
+
+def _check_uncompressed(output_path):
+    if compression_for_path(output_path) is not None:
+        raise Exception(f"Cannot index compressed output: {output_path}")
+
+
+def _parse_payee(record):
+    return payees._LAYOUT.decode(record)
+
+
+def build_index(output_path, index_path=None):
+    """
+    Scans the payee records of an output file and writes its index. The
+    index is written through a partial file and rename, like the output.
+
+    Parameters
+    ----------
+    output_path : str
+        system path of an uncompressed FIRE output file
+
+    index_path : str
+        optional system path of the index. Defaults to the output path with
+        INDEX_SUFFIX appended.
+
+    Returns
+    ----------
+    str
+        System path of the index.
+    """
+    _check_uncompressed(output_path)
+    if index_path is None:
+        index_path = get_index_path(output_path)
+    entries = []
+    with open(output_path, mode="rb") as output:
+        for record in iter(lambda: output.read(RECORD_LENGTH), b""):
+            if record[:1] != b"B":
+                continue
+            fields = _parse_payee(record)
+            sequence_number = int(record[_SEQUENCE_START:_SEQUENCE_END])
+            for kind, (normalize, field) in INDEX_KEYS.items():
+                value = normalize(fields[field])
+                if value:
+                    entries.append(_ENTRY.pack(key_hash(kind, value),
+                                               sequence_number))
+    entries.sort()
+    header = _HEADER.pack(INDEX_MAGIC, len(entries),
+                          os.path.getsize(output_path))
+    write_records([header, b"".join(entries)], index_path)
+    return index_path
+
+
+def _find(index, count, digest):
+    """
+    Returns the sequence numbers of the entries with the given hash, by
+    binary search for the first such entry.
+    """
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        offset = _HEADER.size + middle * _ENTRY.size
+        if index[offset:offset + _HASH_LENGTH] < digest:
+            low = middle + 1
+        else:
+            high = middle
+    found = []
+    offset = _HEADER.size + low * _ENTRY.size
+    while low < count and index[offset:offset + _HASH_LENGTH] == digest:
+        found.append(_ENTRY.unpack_from(index, offset)[1])
+        low += 1
+        offset += _ENTRY.size
+    return found
+
+
+def lookup(output_path, index_path=None, **query):
+    """
+    Returns the payee records of an output file matching all of the given
+    keys, found through its index (see build_index).
+
+    Parameters
+    ----------
+    output_path : str
+        system path of an uncompressed FIRE output file
+
+    index_path : str
+        optional system path of the index. Defaults to the output path with
+        INDEX_SUFFIX appended.
+
+    tin, account, name_control : str
+        keys to match. At least one must be given. TINs may include
+        punctuation.
+
+    Returns
+    ----------
+    list of dict
+        Matching payee records, split into their fields (see
+        util.parse_entity), in file order.
+    """
+    query = {kind: value for kind, value in query.items() if value}
+    unknown = set(query) - set(INDEX_KEYS)
+    if unknown:
+        raise Exception(f"Unknown lookup keys: {', '.join(sorted(unknown))} \
+                -- Expected: {', '.join(INDEX_KEYS)}")
+    if not query:
+        raise Exception("No lookup keys given")
+    _check_uncompressed(output_path)
+    if index_path is None:
+        index_path = get_index_path(output_path)
+    query = {kind: INDEX_KEYS[kind][0](value) for kind, value in query.items()}
+
+    with open(index_path, mode="rb") as index_file, \
+         mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+        magic, count, output_size = _HEADER.unpack_from(index)
+        if magic != INDEX_MAGIC or \
+           len(index) != _HEADER.size + count * _ENTRY.size:
+            raise Exception(f"Not a FIRE index file: {index_path}")
+        if os.path.getsize(output_path) != output_size:
+            raise Exception(f"Index is out of date: {index_path} \
+                    -- rebuild it for {output_path}")
+        sequence_numbers = None
+        for kind, value in query.items():
+            found = set(_find(index, count, key_hash(kind, value)))
+            sequence_numbers = found if sequence_numbers is None \
+                else sequence_numbers & found
+
+    matches = []
+    with open(output_path, mode="rb") as output:
+        for sequence_number in sorted(sequence_numbers):
+            output.seek((sequence_number - 1) * RECORD_LENGTH)
+            record = output.read(RECORD_LENGTH)
+            if record[:1] != b"B" or \
+               int(record[_SEQUENCE_START:_SEQUENCE_END]) != sequence_number:
+                raise Exception(f"Index is out of date: {index_path} \
+                        -- rebuild it for {output_path}")
+            fields = _parse_payee(record)
+            if all(INDEX_KEYS[kind][0](fields[INDEX_KEYS[kind][1]]) == value
+                   for kind, value in query.items()):
+                matches.append(fields)
+    return matches
@@ -0,0 +1,242 @@
+"""
+Module: Layouts
+Registry of record layouts, declared as data.
+
+A layout is a list of fields, each with its name, start position (from 1, as
+in IRS Publication 1220), length, default value, fill character,
+transformation function and transform kind. The transform kind declares
+which vectorized operation (see TRANSFORM_KINDS) is equivalent to the
+transformation function, so that columnar renderers can apply it to whole
+columns; it is None for transforms without one. Layouts are checked when
+they are registered: fields must be contiguous, without overlaps or gaps,
+and add up to the record length. Each registered layout is compiled once
+into an encoder (str and bytes, see util.compile_fire_entity) and a decoder
+(see util.compile_parse_entity), so that a new record type only needs a
+layout definition to get the optimized code path.
+
+The record types of the entity modules are registered under their module
+name (e.g. "payees"); payee records of other forms are registered by
+fire.entities.forms.
+"""
+from collections import namedtuple
+
+from .util import xform_entity, compile_fire_entity, compile_parse_entity
+
+RECORD_LENGTH = 750
+# Vectorized equivalents a field's transformation function can declare:
+# unchanged, uppercased (ASCII), non-digits removed, and non-digits removed
+# then left-padded with zeros to the field length
+TRANSFORM_KINDS = ("identity", "uppercase", "digits_only", "rjust_zero")
+
+
+def _identity(value):
+    return value
+
+
+Field = namedtuple("Field",
+                   ["name", "start", "length", "default", "fill", "transform",
+                    "kind"],
+                   defaults=["", "\x00", _identity, None])
+Field.__doc__ = """
+Field of a record layout: name, start position (from 1), length, default
+value, fill character, transformation function and transform kind (one of
+TRANSFORM_KINDS, or None). Only name, start and length are required; fields
+default to empty, filled with "\\x00", and are not transformed. Untransformed
+fields are of kind "identity"; other transforms are of kind None unless
+declared.
+"""
+
+
+def fields_from_items(items, start=1):
+    """
+    Returns the fields of an entity module's _ITEMS list, with start
+    positions computed from the field lengths.
+
+    Parameters
+    ----------
+    items : list of tuple
+        (name, (default, length, fill, transform[, kind])) pairs, in record
+        order
+
+    start : int
+        start position of the first field
+
+    Returns
+    ----------
+    list of Field
+        Fields, in record order.
+    """
+    fields = []
+    for name, (default, length, fill, transform, *kind) in items:
+        fields.append(Field(name, start, length, default, fill, transform,
+                            *kind))
+        start += length
+    return fields
+
+
+def check_fields(name, fields, record_length=RECORD_LENGTH):
+    """
+    Checks that fields make up a valid layout: unique names, positive
+    lengths, known transform kinds, and contiguous positions covering the
+    record from position 1 to record_length, without overlaps or gaps.
+    Raises an Exception describing the first problem found.
+
+    Parameters
+    ----------
+    name : str
+        name of the layout, for error messages
+
+    fields : list of Field
+        fields of the layout, in any order
+
+    record_length : int
+        length of the record
+    """
+    names = set()
+    position = 1
+    for field in sorted(fields, key=lambda field: field.start):
+        if field.name in names:
+            raise Exception(f"Duplicate field in layout {name}: {field.name}")
+        names.add(field.name)
+        if field.length <= 0:
+            raise Exception(f"Invalid length in layout {name}: \
+                    {field.name} -- Length: {field.length}")
+        if field.kind is not None and field.kind not in TRANSFORM_KINDS:
+            raise Exception(f"Unknown transform kind in layout {name}: \
+                    {field.name} -- Kind: {field.kind}")
+        if field.start < position:
+            raise Exception(f"Overlapping fields in layout {name}: \
+                    {field.name} starts at {field.start} -- Expected: \
+                    {position}")
+        if field.start > position:
+            raise Exception(f"Gap in layout {name}: positions {position} \
+                    to {field.start - 1} before {field.name}")
+        position += field.length
+    if position - 1 != record_length:
+        raise Exception(f"Layout {name} does not match record length: \
+                Expected: {record_length} -- Actual: {position - 1}")
+
+
+class Layout:
+    """
+    A checked record layout, with its compiled encoders and decoder.
+
+    Attributes
+    ----------
+    self.name : str
+        Name under which the layout is registered.
+
+    self.fields : tuple of Field
+        Fields, in record order.
+
+    self.record_length : int
+        Length of the record.
+
+    self.sort : list of str
+        Field names, in record order (as returned by
+        util.factor_transforms).
+
+    self.transforms : dict
+        Field metadata, keyed by field name, in the format expected by
+        util.xform_entity and util.fire_entity.
+
+    self.kinds : dict
+        Transform kind of each field (see TRANSFORM_KINDS), or None, keyed
+        by field name.
+
+    Methods
+    ----------
+    xform(data):
+        Transforms user-supplied data into a record dict.
+
+    encode(data):
+        Formats a record dict as a str.
+
+    encode_bytes(data):
+        Formats a record dict as ASCII bytes.
+
+    decode(record):
+        Splits a formatted record into its field values.
+    """
+    def __init__(self, name, fields, record_length=RECORD_LENGTH):
+        check_fields(name, fields, record_length)
+        self.name = name
+        self.record_length = record_length
+        self.fields = tuple(sorted(fields, key=lambda field: field.start))
+        self.sort = [field.name for field in self.fields]
+        self.transforms = {field.name: (field.default, field.length,
+                                        field.fill, field.transform)
+                           for field in self.fields}
+        self.kinds = {field.name: "identity" if field.kind is None and
+                      field.transform is _identity else field.kind
+                      for field in self.fields}
+        self.encode = compile_fire_entity(self.transforms, self.sort,
+                                          record_length)
+        self.encode_bytes = compile_fire_entity(self.transforms, self.sort,
+                                                record_length, binary=True)
+        self.decode = compile_parse_entity(self.transforms, self.sort)
+
+    def xform(self, data):
+        """
+        Transforms user-supplied data into a record dict (see
+        util.xform_entity).
+        """
+        return xform_entity(self.transforms, data)
+
+
+_LAYOUTS = {}
+
+
+def register(name, fields, record_length=RECORD_LENGTH):
+    """
+    Checks and compiles a layout, and registers it under name.
+
+    Parameters
+    ----------
+    name : str
+        name of the layout. Must not be registered already.
+
+    fields : list of Field
+        fields of the layout (see check_fields)
+
+    record_length : int
+        length of the record
+
+    Returns
+    ----------
+    Layout
+        The registered layout.
+    """
+    if name in _LAYOUTS:
+        raise Exception(f"Layout already registered: {name}")
+    layout = Layout(name, fields, record_length)
+    _LAYOUTS[name] = layout
+    return layout
+
+
+def get_layout(name):
+    """
+    Returns the layout registered under name. Importing fire.entities.forms
+    registers the payee layouts of the forms it defines.
+
+    Parameters
+    ----------
+    name : str
+        name of the layout
+
+    Returns
+    ----------
+    Layout
+        The registered layout.
+    """
+    if name not in _LAYOUTS:
+        raise Exception(f"Unknown layout: {name} \
+                -- Registered: {', '.join(sorted(_LAYOUTS))}")
+    return _LAYOUTS[name]
+
+
+def layout_names():
+    """
+    Returns the names of the registered layouts, sorted.
+    """
+    return sorted(_LAYOUTS)
@@ -0,0 +1,373 @@
+"""
+Module: Metrics
+Optional Prometheus-style metrics of conversions, for alerting on slow or
+failing runs.
+
+Metrics are off until enable() is called; the hooks below then cost one
+check of a module global per call. Once enabled, the process accumulates:
+
+* fire_1099_payees_processed_total, fire_1099_payees_rejected_total and
+  fire_1099_payees_rendered_total: payees validated, set aside in a reject
+  file, and written to a FIRE file
+* fire_1099_bytes_written_total: bytes of the files committed by the writer
+* fire_1099_stage_duration_seconds: histogram of the latency of each stage
+  (validate, transform, render, write, and whole runs), labelled by stage
+* fire_1099_stage_failures_total: stages that raised, labelled by stage
+* fire_1099_cache_hits_total, fire_1099_cache_misses_total and
+  fire_1099_cache_hit_ratio: hits and misses of the caches of compiled
+  validators and tables, labelled by cache
+
+Stages are timed by decorating the functions implementing them with
+instrument() (translator.validate_user_data, load_full_schema,
+get_fire_format, get_fire_bytes and write_1099_file, and server.get_errors),
+or with timer() blocks (e.g. the streamed rendering of the server), and
+caches are registered with cached().
+
+The metrics are rendered in the Prometheus text exposition format, either to
+a file for the node exporter's textfile collector (see write_textfile), or
+served over HTTP on a local port (see serve).
+
+Metrics are per process: conversions run in worker processes (see the batch
+module) are not included.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+PREFIX = "fire_1099_"
+# Upper bounds of the stage latency histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                    30, 60, 300, 900)
+COUNTERS = {
+    "payees_processed": "Payees validated.",
+    "payees_rejected": "Payees set aside in a reject file.",
+    "payees_rendered": "Payees written to a FIRE file.",
+    "bytes_written": "Bytes of the files committed by the writer.",
+    "stage_failures": "Stages that raised an exception, by stage."
+}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_REGISTRY = None
+_CACHES = {}
+
+
+class MetricsRegistry:
+    """
+    Counters and stage latency histogram of a process, safe to update from
+    several threads.
+
+    Attributes
+    ----------
+    self.counters : dict
+        Counter values, by counter name (see COUNTERS) and then by tuple of
+        label (name, value) pairs.
+
+    self.durations : dict
+        Stage latency histograms, by stage: a list of bucket counts (one per
+        DURATION_BUCKETS bound, then +Inf), the sum and the count.
+
+    Methods
+    ----------
+    count(name, value=1, **labels):
+        Adds value to a counter.
+
+    observe(stage, seconds):
+        Records the latency of a stage.
+
+    render():
+        Returns the metrics in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self.counters = {name: {} for name in COUNTERS}
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1, **labels):
+        """
+        Adds value to the counter name, for the given labels.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self.counters[name]
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, stage, seconds):
+        """
+        Records the latency of a stage in the stage latency histogram.
+        """
+        with self._lock:
+            histogram = self.durations.get(stage)
+            if histogram is None:
+                histogram = self.durations[stage] = \
+                    [[0] * (len(DURATION_BUCKETS) + 1), 0.0, 0]
+            buckets = histogram[0]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+
+        Returns
+        ----------
+        str
+            One HELP and TYPE comment per metric, followed by its samples.
+        """
+        lines = []
+        with self._lock:
+            for name, help_text in COUNTERS.items():
+                values = self.counters[name] or {(): 0}
+                _header(lines, name + "_total", help_text, "counter")
+                for key, value in sorted(values.items()):
+                    lines.append(f"{PREFIX}{name}_total{_labels(key)} "
+                                 f"{_number(value)}")
+
+            _header(lines, "stage_duration_seconds",
+                    "Latency of the conversion stages, by stage.",
+                    "histogram")
+            for stage, (buckets, total, count) in sorted(
+                    self.durations.items()):
+                cumulative = 0
+                bounds = [_number(bound) for bound in DURATION_BUCKETS]
+                for bound, bucket in zip(bounds + ["+Inf"], buckets):
+                    cumulative += bucket
+                    labels = _labels((("stage", stage), ("le", bound)))
+                    lines.append(f"{PREFIX}stage_duration_seconds_bucket"
+                                 f"{labels} {cumulative}")
+                labels = _labels((("stage", stage),))
+                lines.append(f"{PREFIX}stage_duration_seconds_sum{labels} "
+                             f"{_number(total)}")
+                lines.append(f"{PREFIX}stage_duration_seconds_count{labels} "
+                             f"{count}")
+
+        caches = sorted((name, function.cache_info())
+                        for name, function in _CACHES.items())
+        for suffix, help_text, metric_type, value in (
+                ("cache_hits_total", "Hits of the caches, by cache.",
+                 "counter", lambda info: info.hits),
+                ("cache_misses_total", "Misses of the caches, by cache.",
+                 "counter", lambda info: info.misses),
+                ("cache_hit_ratio", "Hit ratio of the caches, by cache.",
+                 "gauge", lambda info: info.hits / (info.hits + info.misses)
+                 if info.hits + info.misses else 0)):
+            _header(lines, suffix, help_text, metric_type)
+            for name, info in caches:
+                lines.append(f"{PREFIX}{suffix}{_labels((('cache', name),))} "
+                             f"{_number(value(info))}")
+        return "\n".join(lines) + "\n"
+
+
+def _header(lines, name, help_text, metric_type):
+    lines.append(f"# HELP {PREFIX}{name} {help_text}")
+    lines.append(f"# TYPE {PREFIX}{name} {metric_type}")
+
+
+def _labels(key):
+    if not key:
+        return ""
+    labels = ",".join(f"{name}=\"{_escape(value)}\"" for name, value in key)
+    return "{" + labels + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"") \
+        .replace("\n", "\\n")
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def enable():
+    """
+    Starts accumulating metrics in this process, if not already started.
+
+    Returns
+    ----------
+    MetricsRegistry
+        The registry of the process.
+    """
+    global _REGISTRY # pylint: disable=global-statement
+    if _REGISTRY is None:
+        _REGISTRY = MetricsRegistry()
+    return _REGISTRY
+
+
+def disable():
+    """
+    Stops accumulating metrics, and discards those accumulated so far.
+    """
+    global _REGISTRY # pylint: disable=global-statement
+    _REGISTRY = None
+
+
+def registry():
+    """
+    Returns the registry of the process, or None if metrics are disabled.
+    """
+    return _REGISTRY
+
+
+def count(name, value=1, **labels):
+    """
+    Adds value to the counter name (see COUNTERS), if metrics are enabled.
+
+    Parameters
+    ----------
+    name : str
+        counter name, without prefix and _total suffix
+
+    value : int
+        amount to add
+
+    labels : str
+        optional label values of the sample
+    """
+    if _REGISTRY is not None:
+        _REGISTRY.count(name, value, **labels)
+
+
+def instrument(stage):
+    """
+    Returns a decorator recording the latency of each call of the decorated
+    function in the stage latency histogram, and counting calls that raise
+    as failures of the stage, if metrics are enabled.
+
+    Parameters
+    ----------
+    stage : str
+        stage label, e.g. "validate"
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _REGISTRY is None:
+                return function(*args, **kwargs)
+            with timer(stage):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def timer(stage):
+    """
+    Context manager recording the latency of its block in the stage latency
+    histogram, and counting a block that raises as a failure of the stage,
+    if metrics are enabled. For stages that are not a single function call
+    (see instrument).
+
+    Parameters
+    ----------
+    stage : str
+        stage label, e.g. "render"
+    """
+    metrics_registry = _REGISTRY
+    if metrics_registry is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        metrics_registry.count("stage_failures", stage=stage)
+        raise
+    finally:
+        metrics_registry.observe(stage, time.perf_counter() - start)
+
+
+def cached(name):
+    """
+    Returns a decorator registering a functools.lru_cache'd function, whose
+    hits and misses are then reported under the given cache label.
+
+    Parameters
+    ----------
+    name : str
+        cache label, e.g. "validator"
+    """
+    def decorator(function):
+        _CACHES[name] = function
+        return function
+
+    return decorator
+
+
+def render():
+    """
+    Returns the metrics of the process in the Prometheus text exposition
+    format (empty if metrics are disabled).
+    """
+    if _REGISTRY is None:
+        return ""
+    return _REGISTRY.render()
+
+
+def write_textfile(path):
+    """
+    Writes the metrics of the process to path, for the node exporter's
+    textfile collector. The file is written next to path and renamed over
+    it, so the collector never reads a partial file.
+
+    Parameters
+    ----------
+    path : str
+        system path of the metrics file, ending in .prom
+    """
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, mode="w", encoding="utf-8") as file:
+        file.write(render())
+    os.replace(temp_path, path)
+
+
+def serve(port, host="127.0.0.1"):
+    """
+    Serves the metrics of the process at http://host:port/metrics from a
+    daemon thread.
+
+    Parameters
+    ----------
+    port : int
+        port to listen on (0 for any free port)
+
+    host : str
+        interface to listen on
+
+    Returns
+    ----------
+    http.server.ThreadingHTTPServer
+        The running server; call shutdown() to stop it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self): # pylint: disable=invalid-name
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
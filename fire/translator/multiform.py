@@ -0,0 +1,261 @@
+"""
+Module: Multiform
+Converts an input whose payees are reported on different forms (1099-MISC
+and 1099-NEC) into a single transmission, in one pass over the payees.
+
+Each payee names its form in a form_type field ("MISC" or "NEC"); payees
+without one take the form type of the run. The transmitter and payer are
+validated once; each payee is validated against the schema of its form, and
+routed to the payer group (A record, B records, C and K records) of that
+form. Each group gets its own type of return and amount codes. Groups are
+written in the order of FORM_TYPES, followed by a single end of
+transmission record, with sequence numbers running through the whole
+transmission.
+
+Payee records are rendered as they are routed, and spooled to an unnamed
+temporary file per group next to the output; their sequence numbers are
+filled in when the groups are copied to the output, once the size of every
+group is known.
+"""
+import os
+import tempfile
+
+from fire.entities import transmitter, payer, payees, end_of_payer, \
+                          state_totals, end_of_transmission
+from . import translator, metrics
+from .reject import validate_header
+from .util import PayerTotals, StateTotals, SequenceGenerator
+from .writer import write_records, COPY_BLOCK_SIZE
+
+FORM_TYPE_FIELD = "form_type"
+# Type of return of each form, in the order groups are written
+RETURN_TYPES = {
+    "MISC": "A",
+    "NEC": "NE"
+}
+FORM_TYPES = tuple(RETURN_TYPES)
+RECORD_LENGTH = 750
+_SEQUENCE_START = 499
+_SEQUENCE_END = 507
+
+
+class PayerGroup:
+    """
+    Payees of a single form type, rendered and totalled as they are added.
+
+    Attributes
+    ----------
+    self.type : str
+        Form type of the group, "MISC" or "NEC".
+
+    self.payer : dict
+        Transformed payer record of the group.
+
+    self.totals : PayerTotals
+        Totals of the payees added so far.
+
+    self.states : StateTotals
+        Per-state totals, if the payer participates in the Combined
+        Federal/State Filing Program; otherwise None.
+
+    Methods
+    ----------
+    add(payee):
+        Totals a transformed payee record and spools its B record.
+
+    iter_records(seq):
+        Yields the records of the group, numbered from seq.
+
+    close():
+        Removes the spool file.
+    """
+    def __init__(self, type, payer_data, spill_dir=None):
+        self.type = type
+        self.payer = dict(payer_data, type_of_return=RETURN_TYPES[type])
+        self.totals = PayerTotals()
+        self.states = StateTotals() \
+            if payer_data["combined_fed_state"] == "1" else None
+        self._spool = tempfile.TemporaryFile(
+            prefix=f"fire-1099-{type.lower()}-", dir=spill_dir)
+
+    def add(self, payee):
+        """
+        Totals a single (transformed) payee record, and spools its B record.
+        The record's sequence number is filled in by iter_records().
+
+        Parameters
+        ----------
+        payee : dict
+            Payee record, as returned by payees.xform().
+        """
+        amounts = self.totals.add(payee)
+        if self.states is not None:
+            self.states.add(payee, amounts)
+        self._spool.write(payees.fire_bytes([payee]))
+
+    def iter_records(self, seq):
+        """
+        Yields the payer, payee, end of payer and state totals records of the
+        group, in order, as FIRE-formatted bytes.
+
+        Parameters
+        ----------
+        seq : SequenceGenerator
+            Sequence generator of the transmission, positioned before the
+            group's payer record. Advanced past the group's last record.
+
+        Yields
+        ----------
+        bytes
+            FIRE-formatted record.
+        """
+        end_of_payer_data = end_of_payer.xform({})
+        self.totals.insert(self.payer, end_of_payer_data)
+        self.payer["record_sequence_number"] = seq.get_next()
+        yield payer.fire_bytes(self.payer)
+
+        self._spool.seek(0)
+        for block in iter(lambda: self._spool.read(
+                COPY_BLOCK_SIZE - COPY_BLOCK_SIZE % RECORD_LENGTH), b""):
+            records = []
+            for start in range(0, len(block), RECORD_LENGTH):
+                records += [block[start:start + _SEQUENCE_START],
+                            seq.get_next().encode("ascii"),
+                            block[start + _SEQUENCE_END:
+                                  start + RECORD_LENGTH]]
+            yield b"".join(records)
+
+        end_of_payer_data["record_sequence_number"] = seq.get_next()
+        yield end_of_payer.fire_bytes(end_of_payer_data)
+        state_data = state_totals.xform(
+            self.states.records() if self.states is not None else [])
+        for state in state_data:
+            state["record_sequence_number"] = seq.get_next()
+        yield state_totals.fire_bytes(state_data)
+
+    def close(self):
+        """
+        Removes the spool file.
+        """
+        self._spool.close()
+
+
+def form_type_of(payee, default_type="MISC"):
+    """
+    Returns the form type of a (user-supplied) payee.
+
+    Parameters
+    ----------
+    payee : dict
+        user-supplied payee data
+
+    default_type : str
+        form type of payees without a form_type field
+
+    Returns
+    ----------
+    str
+        "MISC" or "NEC".
+    """
+    form_type = payee.get(FORM_TYPE_FIELD, default_type)
+    if form_type not in RETURN_TYPES:
+        raise Exception(f"Unknown form type: {form_type} \
+                -- Expected one of: {', '.join(FORM_TYPES)}")
+    return form_type
+
+
+def iter_transmission(transmitter_data, groups):
+    """
+    Yields the records of a transmission made of several payer groups.
+
+    Parameters
+    ----------
+    transmitter_data : dict
+        Transformed transmitter record. _Note: this is edited in-place._
+
+    groups : list of PayerGroup
+        Payer groups, in the order they are to be written.
+
+    Yields
+    ----------
+    bytes
+        FIRE-formatted records, or runs of records.
+    """
+    payee_count = f"{sum(group.totals.payee_count for group in groups):0>8}"
+    seq = SequenceGenerator()
+    transmitter_data["total_number_of_payees"] = payee_count
+    transmitter_data["record_sequence_number"] = seq.get_next()
+    yield transmitter.fire_bytes(transmitter_data)
+    for group in groups:
+        yield from group.iter_records(seq)
+    end_of_transmission_data = end_of_transmission.xform({})
+    end_of_transmission_data["total_number_of_payees"] = payee_count
+    end_of_transmission_data["number_of_a_records"] = f"{len(groups):0>8}"
+    end_of_transmission_data["record_sequence_number"] = seq.get_next()
+    yield end_of_transmission.fire_bytes(end_of_transmission_data)
+
+
+def write_multiform(data, path, type="MISC", archive_path=None):
+    """
+    Validates user data, routing each payee to the schema and payer group of
+    its form type, and writes the transmission to path (see the module
+    docstring). _Note: this consumes the payees of the input parameter._
+
+    Parameters
+    ----------
+    data : dict
+        user input data, as returned by translator.extract_user_data(). Its
+        payees may be a list or any other iterable.
+
+    path : str
+        system path of the output file
+
+    type : str
+        form type of payees without a form_type field, "MISC" (default) or
+        "NEC"
+
+    archive_path : str
+        optional path of an archival copy (see writer.write_records)
+
+    Returns
+    ----------
+    dict
+        Number of payees written, by form type.
+    """
+    from jsonschema.exceptions import best_match
+    from .extsort import drain
+
+    validate_header(data, translator.get_schema_path(type))
+    validators = {form_type: translator.load_validator(
+        translator.get_schema_path(form_type)) for form_type in FORM_TYPES}
+    payer_data = payer.xform(data["payer"])
+    spill_dir = os.path.dirname(os.path.abspath(path))
+    groups = {}
+    try:
+        payee_list = data["payees"]
+        if isinstance(payee_list, list):
+            payee_list = drain(payee_list)
+        for payee in payee_list:
+            form_type = form_type_of(payee, type)
+            error = best_match(validators[form_type].iter_errors(
+                {"payees": [payee]}))
+            if error is not None:
+                raise error
+            if form_type not in groups:
+                groups[form_type] = PayerGroup(form_type, payer_data,
+                                               spill_dir)
+            groups[form_type].add(payees.xform([payee])[0])
+        metrics.count("payees_processed", sum(
+            group.totals.payee_count for group in groups.values()))
+        if not groups:
+            groups[type] = PayerGroup(type, payer_data, spill_dir)
+
+        ordered = [groups[form_type] for form_type in FORM_TYPES
+                   if form_type in groups]
+        write_records(iter_transmission(
+            transmitter.xform(data["transmitter"]), ordered),
+            path, archive_path)
+        return {group.type: group.totals.payee_count for group in ordered}
+    finally:
+        for group in groups.values():
+            group.close()
@@ -0,0 +1,212 @@
+"""
+Module: Progress
+Progress events for long conversions, so that a slow run can be told apart
+from a hung one.
+
+The validate, transform and render stages of a run iterate over the payees
+through ProgressReporter.track(), which emits an event when a stage starts,
+at most once per interval while it runs, and when it finishes. Each event
+holds the stage, the number of payees done (and the total, when known), the
+elapsed time, the throughput, the estimated time remaining and the current
+resident set size.
+
+Reporting costs nothing when it is off: the stages then iterate over the
+payees directly. When it is on, the clock is only read every CHECK_EVERY
+payees.
+
+Events are handed to a callback (see translator.run). Two callbacks are
+provided for the CLI: a progress bar written to a terminal, and an NDJSON
+stream, one event per line, for job schedulers.
+"""
+import json
+import time
+
+# Default minimum time between two events of a running stage, in seconds
+DEFAULT_INTERVAL = 1.0
+# Number of payees processed between two reads of the clock
+CHECK_EVERY = 256
+STAGES = ("validate", "transform", "render")
+
+
+class ProgressReporter:
+    """
+    Tracks the progress of the stages of a run, and hands progress events to
+    a callback.
+
+    Attributes
+    ----------
+    self.callback : function
+        Function called with each event (a dict, see event()).
+
+    self.interval : float
+        Minimum time between two events of a running stage, in seconds.
+
+    Methods
+    ----------
+    track(items, stage, total=None):
+        Yields items, emitting progress events for stage.
+
+    event(stage, done, total, elapsed, finished=False):
+        Builds and emits a progress event.
+    """
+    def __init__(self, callback, interval=DEFAULT_INTERVAL,
+                 clock=time.monotonic):
+        self.callback = callback
+        self.interval = interval
+        self._clock = clock
+
+    def track(self, items, stage, total=None):
+        """
+        Yields the elements of items, emitting an event when iteration
+        starts, at most every self.interval seconds while it runs, and when
+        items is exhausted.
+
+        Parameters
+        ----------
+        items : iterable
+            payees processed by the stage, as they are processed
+
+        stage : str
+            name of the stage, e.g. "validate"
+
+        total : int
+            number of items, if known. Defaults to len(items) for sized
+            iterables.
+
+        Yields
+        ----------
+        Elements of items, in order.
+        """
+        if total is None and hasattr(items, "__len__"):
+            total = len(items)
+        clock = self._clock
+        interval = self.interval
+        start = last = clock()
+        self.event(stage, 0, total, 0.0)
+        done = 0
+        next_check = CHECK_EVERY
+        for item in items:
+            yield item
+            done += 1
+            if done == next_check:
+                next_check += CHECK_EVERY
+                now = clock()
+                if now - last >= interval:
+                    last = now
+                    self.event(stage, done, total, now - start)
+        self.event(stage, done, total, clock() - start, finished=True)
+
+    def event(self, stage, done, total, elapsed, finished=False):
+        """
+        Builds a progress event and hands it to the callback.
+
+        Parameters
+        ----------
+        stage : str
+            name of the stage
+
+        done : int
+            number of payees processed so far
+
+        total : int
+            number of payees to process, or None if unknown
+
+        elapsed : float
+            time since the stage started, in seconds
+
+        finished : bool
+            whether the stage is complete
+
+        Returns
+        ----------
+        dict
+            The event: stage, done, total, elapsed (s), rate (payees/s), eta
+            (s, None if unknown), rss (bytes) and finished.
+        """
+        from .budget import current_rss
+        rate = done / elapsed if elapsed > 0 else None
+        eta = None
+        if finished:
+            eta = 0.0
+        elif total is not None and rate:
+            eta = round((total - done) / rate, 1)
+        event = {
+            "stage": stage,
+            "done": done,
+            "total": total,
+            "elapsed": round(elapsed, 3),
+            "rate": round(rate, 1) if rate is not None else None,
+            "eta": eta,
+            "rss": current_rss(),
+            "finished": finished
+        }
+        self.callback(event)
+        return event
+
+
+def format_event(event):
+    """
+    Returns a one-line, human-readable rendering of a progress event.
+
+    Parameters
+    ----------
+    event : dict
+        progress event (see ProgressReporter.event)
+
+    Returns
+    ----------
+    str
+        e.g. "render  120000/500000 (24.0%)  41000 payees/s  ETA 9s
+        RSS 212.5 MB"
+    """
+    done = f"{event['done']}"
+    if event["total"]:
+        percent = 100 * event["done"] / event["total"]
+        done += f"/{event['total']} ({percent:.1f}%)"
+    parts = [f"{event['stage']:<9}", done]
+    if event["rate"] is not None:
+        parts.append(f"{event['rate']:.0f} payees/s")
+    if event["eta"] is not None and not event["finished"]:
+        parts.append(f"ETA {event['eta']:.0f}s")
+    elif event["finished"]:
+        parts.append(f"done in {event['elapsed']:.1f}s")
+    parts.append(f"RSS {event['rss'] / 2 ** 20:.1f} MB")
+    return "  ".join(parts)
+
+
+def bar_callback(file):
+    """
+    Returns a callback drawing progress events on a single terminal line of
+    file, moving on to a new line when a stage finishes.
+
+    Parameters
+    ----------
+    file : file object
+        text file, usually sys.stderr
+    """
+    def draw(event):
+        line = format_event(event)
+        file.write(f"\r{line:<79}")
+        if event["finished"]:
+            file.write("\n")
+        file.flush()
+
+    return draw
+
+
+def ndjson_callback(file):
+    """
+    Returns a callback writing each progress event to file as a JSON line,
+    flushed as it is written.
+
+    Parameters
+    ----------
+    file : file object
+        text file
+    """
+    def write(event):
+        file.write(json.dumps(event))
+        file.write("\n")
+        file.flush()
+
+    return write
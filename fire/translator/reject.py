@@ -0,0 +1,145 @@
+"""
+Module: Reject
+Validates payees one at a time as they stream through the translator, so that
+a malformed payee is set aside instead of aborting the whole run.
+
+The transmitter and payer records are still validated up front, and a
+problem with either aborts the run as usual. Each payee is then validated on
+its own: valid payees are passed on for conversion, and invalid payees are
+written to a reject file, one JSON object per line, with their position in
+the input and the validation errors found:
+
+    {"index": 3, "errors": [{"field": "payees_tin", "message": ...}],
+     "payee": {...}}
+
+The reject file is written next to its destination and moved into place once
+all payees have been screened, like the output file (see the writer module).
+If the run fails, the partial reject file is removed.
+"""
+import os
+import json
+
+from .writer import PARTIAL_SUFFIX, replace_file
+
+
+def validate_header(data, schema_path):
+    """
+    Validates everything in user data except the payees against the schema.
+    The schema has no constraints spanning records, so the payees can then
+    be validated separately.
+
+    Parameters
+    ----------
+    data : dict
+        user input data, as returned by translator.extract_user_data()
+
+    schema_path : str
+        system path for file containing schema to data validate against
+    """
+    from .translator import validate_user_data
+    header = {key: value for key, value in data.items() if key != "payees"}
+    header["payees"] = []
+    validate_user_data(header, schema_path)
+
+
+def payee_errors(validator, payee):
+    """
+    Returns the validation errors of a single (user-supplied) payee.
+
+    Parameters
+    ----------
+    validator : jsonschema.protocols.Validator
+        validator for the input schema, as returned by
+        translator.load_validator()
+
+    payee : dict
+        user-supplied payee data
+
+    Returns
+    ----------
+    list of dict
+        One dict per error, with the path of the offending field (empty for
+        errors concerning the payee as a whole) and the error message.
+    """
+    return [{"field": ".".join(str(part) for part in
+                               list(error.absolute_path)[2:]),
+             "message": error.message}
+            for error in validator.iter_errors({"payees": [payee]})]
+
+
+class PayeeScreen:
+    """
+    Splits a stream of (user-supplied) payees into valid payees, which are
+    passed on, and invalid payees, which are written to a reject file.
+
+    Attributes
+    ----------
+    self.accepted_count : int
+        Number of payees passed on so far.
+
+    self.rejected_count : int
+        Number of payees written to the reject file so far.
+
+    Methods
+    ----------
+    filter(payee_list):
+        Yields the valid payees, writing invalid ones to the reject file.
+
+    close():
+        Flushes the reject file and moves it into place.
+
+    discard():
+        Closes and removes the partial reject file, for failed runs.
+    """
+    def __init__(self, schema_path, reject_path):
+        from .translator import load_validator
+        self.validator = load_validator(schema_path)
+        self.reject_path = reject_path
+        self.accepted_count = 0
+        self.rejected_count = 0
+        self._file = open(reject_path + PARTIAL_SUFFIX, mode="w",
+                          encoding="utf-8")
+
+    def filter(self, payee_list):
+        """
+        Validates each payee in turn.
+
+        Parameters
+        ----------
+        payee_list : iterable of dict
+            user-supplied payee data
+
+        Yields
+        ----------
+        dict
+            Payees that passed validation, in input order.
+        """
+        for index, payee in enumerate(payee_list):
+            errors = payee_errors(self.validator, payee)
+            if errors:
+                self.rejected_count += 1
+                self._file.write(json.dumps(
+                    {"index": index, "errors": errors, "payee": payee}))
+                self._file.write("\n")
+            else:
+                self.accepted_count += 1
+                yield payee
+
+    def close(self):
+        """
+        Flushes and fsyncs the reject file, and renames it to its
+        destination.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        replace_file(self.reject_path + PARTIAL_SUFFIX, self.reject_path)
+
+    def discard(self):
+        """
+        Closes and removes the partial reject file, so that a failed run
+        leaves neither a reject file nor a partial one behind.
+        """
+        self._file.close()
+        if os.path.isfile(self.reject_path + PARTIAL_SUFFIX):
+            os.remove(self.reject_path + PARTIAL_SUFFIX)
@@ -0,0 +1,200 @@
+"""
+Module: Report
+Summary of a transmission for review before it is filed: payment totals by
+amount code, payee counts and totals by payee state, and the payees with the
+largest total payments.
+
+The report is accumulated while payer totals are computed (see
+translator.insert_payer_totals and writer.RecordWriter), from the payment
+amounts parsed there, so it adds no pass over the payees. The top payees are
+kept in a bounded heap, so memory use does not depend on the number of
+payees. The report is written next to the output file, as JSON or CSV.
+"""
+import io
+import csv
+import json
+import heapq
+
+from .util import AMOUNT_CODES
+
+REPORT_SUFFIX = ".report"
+REPORT_FORMATS = ("json", "csv")
+# Number of payees listed in the report by default
+DEFAULT_TOP_PAYEES = 10
+CSV_COLUMNS = ["section", "key", "name", "amount_code", "payees", "amount"]
+
+
+def _code_totals(totals):
+    return {code: total for code, total in zip(AMOUNT_CODES, totals)
+            if total != 0}
+
+
+class SummaryReport:
+    """
+    Accumulates the summary report of a transmission, one payee at a time.
+    Amounts are in cents, as in the records.
+
+    Attributes
+    ----------
+    self.payee_count : int
+        Number of payees added so far.
+
+    self.totals : list of int
+        Payment totals, in the order of AMOUNT_CODES.
+
+    self.states : dict
+        Payee count and payment totals (in the order of AMOUNT_CODES), by
+        payee state.
+
+    Methods
+    ----------
+    add(payee, amounts):
+        Adds a transformed payee record and its payment amounts.
+
+    top_payees():
+        Returns the payees with the largest total payments.
+
+    to_dict():
+        Returns the report as a JSON-serializable dict.
+
+    to_csv():
+        Returns the report as CSV.
+
+    write(path, format):
+        Writes the report as JSON or CSV.
+    """
+    def __init__(self, top_n=DEFAULT_TOP_PAYEES):
+        self.top_n = top_n
+        self.payee_count = 0
+        self.totals = [0] * len(AMOUNT_CODES)
+        self.states = {}
+        self._top = []
+
+    def add(self, payee, amounts):
+        """
+        Adds a single (transformed) payee record to the report.
+
+        Parameters
+        ----------
+        payee : dict
+            Payee record, as returned by payees.xform().
+
+        amounts : list of int
+            The payee's payment amounts, as returned by PayerTotals.add().
+        """
+        index = self.payee_count
+        self.payee_count += 1
+        totals = self.totals
+        for i, amount in enumerate(amounts):
+            totals[i] += amount
+
+        state_code = payee["payee_state"].upper()
+        state = self.states.get(state_code)
+        if state is None:
+            state = self.states[state_code] = [0, [0] * len(AMOUNT_CODES)]
+        state[0] += 1
+        state_totals = state[1]
+        for i, amount in enumerate(amounts):
+            state_totals[i] += amount
+
+        # Min-heap of the top payees: larger totals first, then earlier
+        # payees, so that ties are broken by input order
+        entry = (sum(amounts), -index)
+        if len(self._top) < self.top_n:
+            heapq.heappush(self._top, (entry, payee_summary(payee, index)))
+        elif self._top and entry > self._top[0][0]:
+            heapq.heapreplace(self._top, (entry, payee_summary(payee, index)))
+
+    def top_payees(self):
+        """
+        Returns the payees with the largest total payments, largest first.
+
+        Returns
+        ----------
+        list of dict
+            Payee summaries (see payee_summary), with their total.
+        """
+        return [dict(summary, total=total) for (total, _), summary in
+                sorted(self._top, key=lambda item: item[0], reverse=True)]
+
+    def to_dict(self):
+        """
+        Returns the report as a JSON-serializable dict.
+        """
+        return {
+            "payees": self.payee_count,
+            "totals": _code_totals(self.totals),
+            "total": sum(self.totals),
+            "states": {state: {"payees": count,
+                               "totals": _code_totals(totals)}
+                       for state, (count, totals)
+                       in sorted(self.states.items())},
+            "top_payees": self.top_payees()
+        }
+
+    def to_csv(self):
+        """
+        Returns the report as CSV: one row per amount code of the overall and
+        per-state totals, then one row per top payee.
+        """
+        buffer = io.StringIO()
+        output = csv.writer(buffer, lineterminator="\n")
+        output.writerow(CSV_COLUMNS)
+        for code, total in _code_totals(self.totals).items():
+            output.writerow(["total", "", "", code, self.payee_count, total])
+        for state, (count, totals) in sorted(self.states.items()):
+            for code, total in _code_totals(totals).items():
+                output.writerow(["state", state, "", code, count, total])
+        for payee in self.top_payees():
+            output.writerow(["top_payee", payee["tin"], payee["name"], "", "",
+                             payee["total"]])
+        return buffer.getvalue()
+
+    def write(self, path, format="json"):
+        """
+        Writes the report to path, through a partial file and rename.
+
+        Parameters
+        ----------
+        path : str
+            system path of the report
+
+        format : str
+            "json" (default) or "csv"
+        """
+        from .writer import write_atomic
+        if format not in REPORT_FORMATS:
+            raise Exception(f"Unknown report format: {format} \
+                    -- Expected one of: {', '.join(REPORT_FORMATS)}")
+        write_atomic(json.dumps(self.to_dict(), indent=2) if format == "json"
+                     else self.to_csv(), path)
+
+
+def payee_summary(payee, index):
+    """
+    Returns the fields identifying a (transformed) payee in the report.
+
+    Parameters
+    ----------
+    payee : dict
+        Payee record, as returned by payees.xform().
+
+    index : int
+        position of the payee in the output, from 0
+
+    Returns
+    ----------
+    dict
+        Position, TIN, name and account number of the payee.
+    """
+    return {"index": index,
+            "tin": payee["payees_tin"],
+            "name": payee["first_payee_name_line"],
+            "account": payee["payers_account_number_for_payee"]}
+
+
+def get_report_path(output_path, format="json"):
+    """
+    Returns the path of the report written next to an output file.
+    """
+    return f"{output_path}{REPORT_SUFFIX}.{format}"
@@ -0,0 +1,334 @@
+"""
+Module: Reverse
+Translates FIRE files back into the JSON input format, so that files produced
+elsewhere can be amended and re-filed.
+
+The file is read in chunks of whole 750-byte records. The transmitter and
+payer records are decoded up front; payee records are decoded by a pool of
+worker processes, chunk by chunk, using the field layouts of the entity
+modules. Fill characters and blank padding are stripped, and generated fields
+(record types, sequence numbers, counts and amount codes) are left out, as
+the translator generates them again. Zip codes and payment amounts are
+written in a form accepted by the input schema, so that the output validates
+and converts back into the same records with translator.run.
+
+Output is either a single JSON document, in the input format, or NDJSON: a
+first line holding the transmitter and payer, followed by one payee per line.
+Either way it is written as it is decoded, through a partial file and rename.
+Only files with a single payer are supported, like the translator itself.
+"""
+import os
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from fire.entities import transmitter, payer, payees
+from . import translator
+from .util import parse_entity
+from .writer import write_records
+from .compression import open_input
+
+RECORD_LENGTH = 750
+# Number of records decoded per worker task
+DEFAULT_CHUNK_RECORDS = 5000
+# Form type, by the payer's type of return
+RETURN_TYPES = {
+    "A": "MISC",
+    "NE": "NEC"
+}
+# Fields the translator generates, which are not part of the input format
+GENERATED_FIELDS = {"record_type", "record_sequence_number",
+                    "total_number_of_payees", "number_of_payees",
+                    "amount_codes"}
+
+
+def _format_value(field, value):
+    if field.startswith("payment_amount_"):
+        try:
+            dollars, cents = divmod(int(value), 100)
+        except ValueError:
+            return value
+        return f"{dollars}.{cents:02}"
+    if field.endswith("zip_code") and len(value) == 9 and value.isdigit():
+        return f"{value[:5]}-{value[5:]}"
+    return value
+
+
+def decode_entity(entity_dict, key_ordering, record, required=()):
+    """
+    Decodes a FIRE-formatted record into user-supplied data: the fields of
+    the record (see util.parse_entity), without trailing blanks. Blank and
+    generated fields are left out, as are fields holding their default value
+    (such as empty names or zero payment amounts) unless they are required.
+
+    Parameters
+    ----------
+    entity_dict: dict
+        Dictionary containing all fields of the record type (see
+        util.fire_entity).
+
+    key_ordering: list of str
+        Keys of entity_dict, in the order the fields appear in the record.
+
+    record: bytes
+        FIRE-formatted record.
+
+    required : collection of str
+        Fields to include even if they are empty.
+
+    Returns
+    ----------
+    dict
+        User-supplied data for the record.
+    """
+    data = {}
+    for field, value in parse_entity(entity_dict, key_ordering,
+                                     record).items():
+        if field.startswith("blank") or field in GENERATED_FIELDS:
+            continue
+        value = value.rstrip("\x00 ")
+        if value == entity_dict[field][0] and field not in required:
+            continue
+        data[field] = _format_value(field, value)
+    return data
+
+
+def decode_payees(chunk, required=()):
+    """
+    Decodes the payee records in a chunk of whole records. Other records are
+    returned undecoded, for the caller to check.
+
+    Parameters
+    ----------
+    chunk : bytes
+        FIRE-formatted records.
+
+    required : collection of str
+        Payee fields to include even if they are empty.
+
+    Returns
+    ----------
+    tuple
+        The decoded payees (list of dict) and the other records (list of
+        bytes), both in file order.
+    """
+    decoded = []
+    others = []
+    for start in range(0, len(chunk), RECORD_LENGTH):
+        record = chunk[start:start + RECORD_LENGTH]
+        if record[:1] == b"B":
+            decoded.append(decode_entity(payees._PAYEE_TRANSFORMS,
+                                         payees._PAYEE_SORT, record,
+                                         required))
+        else:
+            others.append(record)
+    return decoded, others
+
+
+def _read_record(file):
+    record = file.read(RECORD_LENGTH)
+    if len(record) != RECORD_LENGTH:
+        raise Exception(f"Truncated record: expected {RECORD_LENGTH} bytes \
+                -- Actual: {len(record)}")
+    return record
+
+
+def _required(schema, name):
+    properties = schema["properties"][name]
+    if properties.get("type") == "array":
+        properties = properties["items"]
+    return frozenset(properties.get("required", []))
+
+
+def read_header(file, type=None):
+    """
+    Reads and decodes the transmitter and payer records at the start of a
+    FIRE file.
+
+    Parameters
+    ----------
+    file : file object
+        binary file object positioned at the start of a FIRE file
+
+    type : str
+        optional form type of the file, "MISC" or "NEC". Detected from the
+        payer's type of return if not given.
+
+    Returns
+    ----------
+    tuple
+        The form type ("MISC" or "NEC"), and the transmitter and payer as
+        user-supplied data (dicts).
+    """
+    transmitter_record = _read_record(file)
+    payer_record = _read_record(file)
+    if transmitter_record[:1] != b"T" or payer_record[:1] != b"A":
+        raise Exception("Not a FIRE file: expected a transmitter (T) record \
+                followed by a payer (A) record")
+    if type is None:
+        return_type = parse_entity(payer._PAYER_TRANSFORMS, payer._PAYER_SORT,
+                                   payer_record)["type_of_return"]
+        return_type = return_type.rstrip("\x00 ")
+        if return_type not in RETURN_TYPES:
+            raise Exception(f"Unsupported type of return: {return_type} \
+                    -- Expected one of: {', '.join(RETURN_TYPES)}")
+        type = RETURN_TYPES[return_type]
+    schema = translator.load_validator(translator.get_schema_path(type)).schema
+    return (type,
+            decode_entity(transmitter._TRANSMITTER_TRANSFORMS,
+                          transmitter._TRANSMITTER_SORT, transmitter_record,
+                          _required(schema, "transmitter")),
+            decode_entity(payer._PAYER_TRANSFORMS, payer._PAYER_SORT,
+                          payer_record, _required(schema, "payer")))
+
+
+def _read_chunks(file, chunk_records):
+    while True:
+        chunk = file.read(chunk_records * RECORD_LENGTH)
+        if not chunk:
+            return
+        if len(chunk) % RECORD_LENGTH:
+            raise Exception(f"Truncated record: file is not a whole number \
+                    of {RECORD_LENGTH}-byte records")
+        yield chunk
+
+
+def _decode_chunks(chunks, required, workers):
+    """
+    Yields the results of decode_payees for each chunk, in order. With more
+    than one worker, a bounded number of chunks is decoded ahead in a process
+    pool, so that memory use does not depend on the size of the file.
+    """
+    if workers == 1:
+        for chunk in chunks:
+            yield decode_payees(chunk, required)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(decode_payees, chunk, required))
+            if len(pending) >= 2 * (workers or os.cpu_count() or 1):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_payees(file, type="MISC", workers=None,
+                chunk_records=DEFAULT_CHUNK_RECORDS):
+    """
+    Yields the payees of a FIRE file as user-supplied data, in file order,
+    checking the records that follow them: the payee count of the end of
+    payer (C) record must match the number of payees decoded.
+
+    Parameters
+    ----------
+    file : file object
+        binary file object positioned after the payer record (see
+        read_header)
+
+    type : str
+        form type of the file, either "MISC" (default) or "NEC"
+
+    workers : int
+        optional number of worker processes. Defaults to the number of CPUs;
+        1 decodes in the calling process.
+
+    chunk_records : int
+        number of records decoded per worker task
+
+    Yields
+    ----------
+    dict
+        User-supplied payee data.
+    """
+    schema = translator.load_validator(translator.get_schema_path(type)).schema
+    required = _required(schema, "payees")
+    count = 0
+    end_of_payer_count = None
+    for decoded, others in _decode_chunks(_read_chunks(file, chunk_records),
+                                          required, workers):
+        count += len(decoded)
+        yield from decoded
+        for record in others:
+            record_type = record[:1]
+            if record_type in (b"T", b"A"):
+                raise Exception("Files with more than one transmitter or \
+                        payer are not supported")
+            if record_type == b"C":
+                end_of_payer_count = int(record[1:9])
+    if end_of_payer_count is None:
+        raise Exception("Missing end of payer (C) record")
+    if end_of_payer_count != count:
+        raise Exception(f"Payee count mismatch: end of payer record gives \
+                {end_of_payer_count} -- Decoded: {count}")
+
+
+def _json_lines(transmitter_data, payer_data, payee_list, ndjson):
+    if ndjson:
+        yield json.dumps({"transmitter": transmitter_data,
+                          "payer": payer_data}) + "\n"
+        for payee in payee_list:
+            yield json.dumps(payee) + "\n"
+        return
+    yield "".join(['{\n"transmitter": ', json.dumps(transmitter_data),
+                   ',\n"payer": ', json.dumps(payer_data),
+                   ',\n"payees": ['])
+    separator = "\n"
+    for payee in payee_list:
+        yield separator + json.dumps(payee)
+        separator = ",\n"
+    yield "\n]\n}\n"
+
+
+def reverse(input_path, output_path=None, ndjson=False, workers=None,
+            chunk_records=DEFAULT_CHUNK_RECORDS, type=None):
+    """
+    Translates a FIRE file back into the JSON input format (see the module
+    docstring).
+
+    Parameters
+    ----------
+    input_path : str
+        system path of a FIRE file (optionally gzip, xz or bz2 compressed)
+
+    output_path : str
+        optional system path for the output. Defaults to the input path with
+        its extension replaced by .json (or .ndjson).
+
+    ndjson : bool
+        if True, output is written as NDJSON rather than a single JSON
+        document
+
+    workers : int
+        optional number of worker processes. Defaults to the number of CPUs.
+
+    chunk_records : int
+        number of records decoded per worker task
+
+    type : str
+        optional form type of the file, "MISC" or "NEC". Detected from the
+        payer's type of return if not given.
+
+    Returns
+    ----------
+    dict
+        Summary: output path, form type and number of payees.
+    """
+    if output_path is None:
+        output_path = os.path.splitext(input_path)[0] + \
+            (".ndjson" if ndjson else ".json")
+    counter = {"payees": 0}
+
+    def counted(payee_list):
+        for payee in payee_list:
+            counter["payees"] += 1
+            yield payee
+
+    with open_input(input_path) as file:
+        type, transmitter_data, payer_data = read_header(file, type)
+        write_records(_json_lines(
+            transmitter_data, payer_data,
+            counted(iter_payees(file, type, workers, chunk_records)), ndjson),
+            output_path)
+    return {"output": output_path, "type": type,
+            "payees": counter["payees"]}
@@ -0,0 +1,278 @@
+"""
+Module: Server
+Local HTTP service exposing the translator to other systems, without paying
+interpreter startup and schema loading for every conversion.
+
+Endpoints
+---------
+POST /convert?type=MISC|NEC
+    Request body: user input JSON. Responds with the FIRE-formatted file,
+    streamed back using chunked transfer encoding as records are rendered.
+    Responds 422 with a JSON list of errors if the input does not validate.
+
+POST /validate?type=MISC|NEC
+    Request body: user input JSON. Responds 200 with {"valid": true}, or 422
+    with {"valid": false, "errors": [...]}.
+
+Conversions run in a bounded pool of worker threads, sharing validators that
+are compiled when the server starts. When all workers are busy and the
+waiting queue is full, requests are rejected immediately with 503 (and a
+Retry-After header) instead of piling up. The slot is taken before the
+request body is read, so rejected bodies are never buffered.
+"""
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from . import translator, metrics
+
+# Number of records sent per chunk of a /convert response
+RECORDS_PER_CHUNK = 64
+# Number of rendered chunks buffered per response before the renderer waits
+# for the client to catch up
+BUFFERED_CHUNKS = 8
+# Seconds a worker waits on a stalled client before abandoning the response
+CLIENT_TIMEOUT = 60
+
+_CHUNK = "chunk"
+_ERROR = "error"
+_END = "end"
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """
+    HTTP server holding the shared worker pool and admission control for
+    conversion requests.
+
+    Attributes
+    ----------
+    self.pool : ThreadPoolExecutor
+        Pool running validation and rendering work.
+
+    self.slots : threading.BoundedSemaphore
+        Admission slots: one per worker, plus one per request allowed to wait
+        for a worker. Requests that cannot take a slot get a 503 response.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, workers=4, queue_size=16):
+        super().__init__(address, ConversionRequestHandler)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        for type in ["MISC", "NEC"]:
+            translator.load_validator(translator.get_schema_path(type))
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for the /convert and /validate endpoints.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """
+        Dispatches POST requests to the matching endpoint.
+        """
+        url = urlsplit(self.path)
+        endpoints = {"/convert": self._convert, "/validate": self._validate}
+        if url.path not in endpoints:
+            self._send_json(404, {"error": f"Not found: {url.path}"})
+            return
+        type = parse_qs(url.query).get("type", ["MISC"])[0].upper()
+        if type not in ("MISC", "NEC"):
+            self._send_json(400, {"error": f"Unsupported type: {type}"})
+            return
+
+
+        # Take the slot before reading the body, so that the concurrency limit
+        # also bounds the memory held by request bodies
+        if not self.server.slots.acquire(blocking=False):
+            # The unread body would be parsed as the next request
+            self.close_connection = True
+            self._send_json(503, {"error": "Server busy"},
+                            {"Retry-After": "1", "Connection": "close"})
+            return
+        try:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                user_data = json.loads(body.decode("utf-8"))
+            except ValueError as error:
+                self._send_json(400, {"error": f"Invalid JSON: {error}"})
+                return
+            endpoints[url.path](user_data, type)
+        finally:
+            self.server.slots.release()
+
+    def _validate(self, user_data, type):
+        errors = self.server.pool.submit(get_errors, user_data, type).result()
+        if errors:
+            self._send_json(422, {"valid": False, "errors": errors})
+        else:
+            self._send_json(200, {"valid": True})
+
+    def _convert(self, user_data, type):
+        chunks = queue.Queue(maxsize=BUFFERED_CHUNKS)
+        cancelled = threading.Event()
+        self.server.pool.submit(render_chunks, user_data, type, chunks,
+                                cancelled)
+
+        kind, value = chunks.get()
+        if kind == _ERROR:
+            cancelled.set()
+            self._send_json(*value)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while kind == _CHUNK:
+                self.wfile.write(f"{len(value):X}\r\n".encode("ascii"))
+                self.wfile.write(value + b"\r\n")
+                try:
+                    kind, value = chunks.get(timeout=CLIENT_TIMEOUT)
+                except queue.Empty:
+                    kind, value = _ERROR, None
+            if kind == _END:
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                # Headers are already sent; dropping the connection without
+                # the terminating chunk tells the client the body is partial
+                self.close_connection = True
+        except OSError:
+            self.close_connection = True
+        finally:
+            cancelled.set()
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        # Request logging is left to the caller's reverse proxy
+        pass
+
+
+@metrics.instrument("validate")
+def get_errors(user_data, type="MISC"):
+    """
+    Validates user data against the schema for the given form type.
+
+    Parameters
+    ----------
+    user_data : dict
+        user input data
+
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    Returns
+    ----------
+    list of dict
+        One entry per validation error, with the JSON path and message.
+    """
+    validator = translator.load_validator(translator.get_schema_path(type))
+    errors = [{"path": "/".join(str(part) for part in error.absolute_path),
+               "message": error.message}
+              for error in validator.iter_errors(user_data)]
+    if not errors:
+        metrics.count("payees_processed", len(user_data.get("payees", ())))
+    return errors
+
+
+def render_chunks(user_data, type, chunks, cancelled):
+    """
+    Worker task for /convert: validates and renders user data, putting
+    (kind, value) tuples on the chunks queue. The first item is either an
+    error, or the first chunk of output; the last item is always an error or
+    the end marker.
+
+    Parameters
+    ----------
+    user_data : dict
+        user input data
+
+    type : str
+        form type of the input data
+
+    chunks : queue.Queue
+        bounded queue the response is streamed through
+
+    cancelled : threading.Event
+        set by the request handler when the response is abandoned
+    """
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                chunks.put(item, timeout=CLIENT_TIMEOUT)
+                return True
+            except queue.Full:
+                cancelled.set()
+        return False
+
+    try:
+        errors = get_errors(user_data, type)
+        if errors:
+            put((_ERROR, (422, {"errors": errors})))
+            return
+        master = translator.load_full_schema(user_data)
+        translator.insert_generated_values(master)
+
+        # The render stage includes waiting for the client to catch up
+        with metrics.timer("render"):
+            batch = []
+            for record in translator.iter_fire_bytes(master):
+                batch.append(record)
+                if len(batch) == RECORDS_PER_CHUNK:
+                    if not put((_CHUNK, b"".join(batch))):
+                        return
+                    batch = []
+            if batch and not put((_CHUNK, b"".join(batch))):
+                return
+        metrics.count("payees_rendered", len(master["payees"]))
+        put((_END, None))
+    except Exception as error: # pylint: disable=broad-except
+        put((_ERROR, (500, {"error": f"{error.__class__.__name__}: {error}"})))
+
+
+def serve(host="127.0.0.1", port=8080, workers=4, queue_size=16):
+    """
+    Runs the conversion server until interrupted.
+
+    Parameters
+    ----------
+    host : str
+        interface to listen on. Defaults to localhost only.
+
+    port : int
+        port to listen on
+
+    workers : int
+        number of conversions run concurrently
+
+    queue_size : int
+        number of requests allowed to wait for a worker before new requests
+        are rejected with 503
+    """
+    server = ConversionServer((host, port), workers, queue_size)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,452 @@
+"""
+Module: Shard
+Renders a transmission too large for one host across several worker
+processes, on any number of hosts sharing a queue directory.
+
+A sharded run has three steps:
+
+* plan (the coordinator): the input is read and validated one payee at a
+  time (see budget.read_streaming), and split into shards of shard_size
+  payees. Each shard is written to the queue as a manifest holding its
+  payees and its preassigned range of record sequence numbers. The payee
+  count and payment totals are accumulated in the same pass, from which the
+  leading (transmitter and payer) and trailing (end of payer, state totals
+  and end of transmission) records are rendered once all shards are
+  written.
+* work (the workers): each worker claims pending shards one at a time, by
+  renaming their manifest into the claimed directory (only one rename of a
+  given file can succeed), renders their payee records, and publishes them
+  to the done directory.
+* merge: once every shard is done, the leading records, the shards in order
+  and the trailing records are concatenated into the output.
+
+Layout of the queue directory:
+
+    plan.json           job manifest, written last by the coordinator
+    header.ascii        transmitter and payer records
+    trailer.ascii       end of payer, state totals, end of transmission
+    pending/            manifests of shards waiting for a worker
+    claimed/            manifests of shards being rendered
+    done/               rendered shards (.ascii) and their results (.json)
+
+Every file is written next to its destination and renamed into place, so
+readers never see partial files. Rendering a shard is idempotent: a shard
+whose worker died can be put back in the queue (see requeue_stale) and
+rendered again.
+"""
+import os
+import json
+import time
+import socket
+import tempfile
+from itertools import chain, islice
+
+from fire.entities import transmitter, payer, payees, end_of_payer, \
+                          state_totals, end_of_transmission
+from . import translator
+from .util import PayerTotals, StateTotals, SequenceGenerator
+from .writer import write_atomic, write_records, summary_records, \
+                    replace_file, COPY_BLOCK_SIZE
+
+DEFAULT_SHARD_SIZE = 50000
+PLAN_FILE = "plan.json"
+HEADER_FILE = "header.ascii"
+TRAILER_FILE = "trailer.ascii"
+PENDING_DIR = "pending"
+CLAIMED_DIR = "claimed"
+DONE_DIR = "done"
+RECORD_LENGTH = 750
+_SEQUENCE_START = 499
+_SEQUENCE_END = 507
+# Sequence number of the first payee record (after the T and A records)
+_FIRST_PAYEE_SEQUENCE = 3
+# Seconds between checks of an idle worker for new shards
+POLL_INTERVAL = 0.5
+
+
+def shard_name(shard):
+    """
+    Returns the base file name of a shard, e.g. "shard-00042".
+    """
+    return f"shard-{shard:05}"
+
+
+def plan(input_path, queue_dir, shard_size=DEFAULT_SHARD_SIZE, type="MISC"):
+    """
+    Validates the input, splits its payees into shard manifests in the
+    pending directory of the queue, and writes the leading and trailing
+    records and the job manifest (see the module docstring).
+
+    Parameters
+    ----------
+    input_path : str
+        system path for file containing the user input JSON data
+
+    queue_dir : str
+        queue directory, shared with the workers. Created if needed; it
+        must not hold a previous plan.
+
+    shard_size : int
+        number of payees per shard
+
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    Returns
+    ----------
+    dict
+        The job manifest: type, payees, shard_size and shards (the number of
+        payees in each shard, in order).
+    """
+    from .budget import read_streaming
+    from .reject import validate_header
+    if shard_size < 1:
+        raise Exception(f"Invalid shard size: {shard_size} \
+                -- Expected a positive number of payees")
+    if os.path.exists(os.path.join(queue_dir, PLAN_FILE)):
+        raise Exception(f"Queue directory already holds a plan: {queue_dir}")
+    for directory in (PENDING_DIR, CLAIMED_DIR, DONE_DIR):
+        os.makedirs(os.path.join(queue_dir, directory), exist_ok=True)
+
+    schema_path = translator.get_schema_path(type)
+    user_data = read_streaming(input_path, queue_dir)
+    validate_header(user_data, schema_path)
+    transmitter_data = transmitter.xform(user_data["transmitter"])
+    payer_data = payer.xform(user_data["payer"])
+    totals = PayerTotals()
+    states = StateTotals() if payer_data["combined_fed_state"] == "1" \
+        else None
+
+    shards = []
+    payee_iter = translator.validate_payees(user_data["payees"], schema_path)
+    while True:
+        shard_payees = list(islice(payee_iter, shard_size))
+        if not shard_payees:
+            break
+        for payee in payees.xform(shard_payees):
+            amounts = totals.add(payee)
+            if states is not None:
+                states.add(payee, amounts)
+        name = shard_name(len(shards)) + ".json"
+        write_atomic(json.dumps({
+            "shard": len(shards),
+            "type": type,
+            "first_sequence": _FIRST_PAYEE_SEQUENCE + totals.payee_count -
+                              len(shard_payees),
+            "count": len(shard_payees),
+            "payees": shard_payees
+        }), os.path.join(queue_dir, PENDING_DIR, name))
+        shards.append(len(shard_payees))
+
+    records = summary_records(transmitter_data, payer_data, totals, states)
+    write_atomic(transmitter.fire_bytes(records["transmitter"]) +
+                 payer.fire_bytes(records["payer"]),
+                 os.path.join(queue_dir, HEADER_FILE))
+    write_atomic(end_of_payer.fire_bytes(records["end_of_payer"]) +
+                 state_totals.fire_bytes(records["state_totals"]) +
+                 end_of_transmission.fire_bytes(
+                     records["end_of_transmission"]),
+                 os.path.join(queue_dir, TRAILER_FILE))
+    job = {
+        "type": type,
+        "payees": totals.payee_count,
+        "shard_size": shard_size,
+        "shards": shards
+    }
+    write_atomic(json.dumps(job, indent=2),
+                 os.path.join(queue_dir, PLAN_FILE))
+    return job
+
+
+def claim_shard(queue_dir):
+    """
+    Claims the first pending shard of the queue, by renaming its manifest
+    into the claimed directory. Safe to call from several processes and
+    hosts at once: only one rename of a manifest succeeds.
+
+    Parameters
+    ----------
+    queue_dir : str
+        queue directory
+
+    Returns
+    ----------
+    str
+        Path of the claimed manifest, or None if no shard is pending.
+    """
+    pending_dir = os.path.join(queue_dir, PENDING_DIR)
+    if not os.path.isdir(pending_dir):
+        return None
+    for name in sorted(os.listdir(pending_dir)):
+        if not name.endswith(".json"):
+            continue
+        claimed_path = os.path.join(queue_dir, CLAIMED_DIR, name)
+        try:
+            os.rename(os.path.join(pending_dir, name), claimed_path)
+        except FileNotFoundError:
+            continue
+        # Claims are timed from the rename (see requeue_stale)
+        os.utime(claimed_path)
+        return claimed_path
+    return None
+
+
+def render_shard(manifest_path, queue_dir, worker=None):
+    """
+    Renders the payee records of a claimed shard to the done directory, and
+    releases its claim.
+
+    Parameters
+    ----------
+    manifest_path : str
+        path of the claimed manifest (see claim_shard)
+
+    queue_dir : str
+        queue directory
+
+    worker : str
+        optional name of the worker, recorded in the shard result
+
+    Returns
+    ----------
+    dict
+        The shard result: shard, count, worker and seconds.
+    """
+    start = time.perf_counter()
+    with open(manifest_path, mode="r", encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    seq = SequenceGenerator()
+    seq.counter = manifest["first_sequence"] - 1
+
+    def render():
+        for payee in payees.xform(manifest["payees"]):
+            payee["record_sequence_number"] = seq.get_next()
+            yield payees.fire_bytes([payee])
+
+    # A requeued shard may be rendered by two workers at once: each renders
+    # to a file of its own, renamed over the (identical) shard when complete
+    name = shard_name(manifest["shard"])
+    path = os.path.join(queue_dir, DONE_DIR, name)
+    own_suffix = f".{socket.gethostname()}-{os.getpid()}"
+    count = write_records(render(), path + ".ascii" + own_suffix)
+    if count != manifest["count"]:
+        raise Exception(f"Rendered payee count does not match shard \
+                {name}: Expected: {manifest['count']} -- Actual: {count}")
+    replace_file(path + ".ascii" + own_suffix, path + ".ascii")
+    result = {
+        "shard": manifest["shard"],
+        "count": count,
+        "worker": worker,
+        "seconds": round(time.perf_counter() - start, 6)
+    }
+    write_atomic(json.dumps(result), path + ".json" + own_suffix)
+    replace_file(path + ".json" + own_suffix, path + ".json")
+    try:
+        os.remove(manifest_path)
+    except FileNotFoundError:
+        # Requeued and rendered again by another worker in the meantime
+        pass
+    return result
+
+
+def requeue_stale(queue_dir, max_age):
+    """
+    Moves claims older than max_age seconds back to the pending directory,
+    so that shards whose worker died are rendered by another worker.
+
+    Parameters
+    ----------
+    queue_dir : str
+        queue directory
+
+    max_age : float
+        age in seconds after which a claim is considered stale
+
+    Returns
+    ----------
+    list of str
+        Names of the requeued manifests.
+    """
+    claimed_dir = os.path.join(queue_dir, CLAIMED_DIR)
+    now = time.time()
+    requeued = []
+    if not os.path.isdir(claimed_dir):
+        return requeued
+    for name in sorted(os.listdir(claimed_dir)):
+        path = os.path.join(claimed_dir, name)
+        try:
+            if now - os.path.getmtime(path) < max_age:
+                continue
+            os.rename(path, os.path.join(queue_dir, PENDING_DIR, name))
+        except FileNotFoundError:
+            continue
+        requeued.append(name)
+    return requeued
+
+
+def work(queue_dir, worker=None, reclaim_after=None):
+    """
+    Claims and renders pending shards until the plan is complete and no
+    shard is left. The worker may be started before the coordinator: until
+    the plan is complete, it waits for new shards.
+
+    Parameters
+    ----------
+    queue_dir : str
+        queue directory
+
+    worker : str
+        optional name of the worker. Defaults to HOST-PID.
+
+    reclaim_after : float
+        optional age in seconds after which claims of other workers are
+        considered stale and requeued (see requeue_stale), checked whenever
+        the worker looks for a shard. The worker then also waits for the
+        claims of other workers to be released before returning.
+
+    Returns
+    ----------
+    list of dict
+        Results of the shards rendered by this worker.
+    """
+    if worker is None:
+        worker = f"{socket.gethostname()}-{os.getpid()}"
+    results = []
+    while True:
+        if reclaim_after is not None:
+            requeue_stale(queue_dir, reclaim_after)
+        manifest_path = claim_shard(queue_dir)
+        if manifest_path is not None:
+            results.append(render_shard(manifest_path, queue_dir, worker))
+        elif _is_finished(queue_dir, reclaim_after is not None):
+            return results
+        else:
+            time.sleep(POLL_INTERVAL)
+
+
+def _is_finished(queue_dir, wait_for_claims):
+    # Claims of other workers may still go stale, and need requeuing
+    if not os.path.exists(os.path.join(queue_dir, PLAN_FILE)):
+        return False
+    return not (wait_for_claims and
+                os.listdir(os.path.join(queue_dir, CLAIMED_DIR)))
+
+
+def _read_blocks(path):
+    with open(path, mode="rb") as file:
+        yield from iter(lambda: file.read(COPY_BLOCK_SIZE), b"")
+
+
+def merge(queue_dir, output_path, archive_path=None):
+    """
+    Concatenates the leading records, the rendered shards in order and the
+    trailing records of a completed job into the output. Each shard is
+    checked to hold the planned number of records, starting at its
+    preassigned sequence number.
+
+    Parameters
+    ----------
+    queue_dir : str
+        queue directory
+
+    output_path : str
+        system path of the output file. Compressed if it ends in .gz, .xz or
+        .bz2.
+
+    archive_path : str
+        optional path of an archival copy (see writer.write_records)
+
+    Returns
+    ----------
+    dict
+        Summary of the merge: output, payees and shards.
+    """
+    with open(os.path.join(queue_dir, PLAN_FILE), mode="r",
+              encoding="utf-8") as plan_file:
+        job = json.load(plan_file)
+    shard_paths = [os.path.join(queue_dir, DONE_DIR, shard_name(i) + ".ascii")
+                   for i in range(len(job["shards"]))]
+    missing = [shard_name(i) for i, path in enumerate(shard_paths)
+               if not os.path.isfile(path)]
+    if missing:
+        raise Exception(f"Shards not rendered yet: {', '.join(missing)}")
+
+    sequence = _FIRST_PAYEE_SEQUENCE
+    for path, count in zip(shard_paths, job["shards"]):
+        if os.path.getsize(path) != count * RECORD_LENGTH:
+            raise Exception(f"Invalid shard size: {path} \
+                    -- Expected: {count} records")
+        with open(path, mode="rb") as shard_file:
+            first = shard_file.read(_SEQUENCE_END)[_SEQUENCE_START:]
+        if first != f"{sequence:0>8}".encode("ascii"):
+            raise Exception(f"Invalid shard sequence number: {path} \
+                    -- Expected: {sequence:0>8} -- Actual: {first!r}")
+        sequence += count
+
+    write_records(chain(
+        _read_blocks(os.path.join(queue_dir, HEADER_FILE)),
+        chain.from_iterable(_read_blocks(path) for path in shard_paths),
+        _read_blocks(os.path.join(queue_dir, TRAILER_FILE))),
+                  output_path, archive_path)
+    return {
+        "output": output_path,
+        "payees": job["payees"],
+        "shards": len(job["shards"])
+    }
+
+
+def run_sharded(input_path, output_path, type="MISC",
+                shard_size=DEFAULT_SHARD_SIZE, workers=None, queue_dir=None,
+                archive_path=None):
+    """
+    Plans, renders and merges a sharded run on this host, with a pool of
+    local worker processes.
+
+    Parameters
+    ----------
+    input_path : str
+        system path for file containing the user input JSON data
+
+    output_path : str
+        system path of the output file
+
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    shard_size : int
+        number of payees per shard
+
+    workers : int
+        optional number of worker processes. Defaults to the number of CPUs.
+
+    queue_dir : str
+        optional queue directory, kept after the run. Defaults to a temporary
+        directory next to the output, removed after the run.
+
+    archive_path : str
+        optional path of an archival copy (see writer.write_records)
+
+    Returns
+    ----------
+    dict
+        Summary of the run: output, payees, shards and workers (the number of
+        shards rendered by each worker).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    if queue_dir is None:
+        with tempfile.TemporaryDirectory(
+                prefix="fire-1099-queue-",
+                dir=os.path.dirname(os.path.abspath(output_path))) as temp_dir:
+            return run_sharded(input_path, output_path, type, shard_size,
+                               workers, temp_dir, archive_path)
+
+    job = plan(input_path, queue_dir, shard_size, type)
+    workers = min(workers or os.cpu_count() or 1, max(len(job["shards"]), 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(work, queue_dir, f"worker-{i}")
+                   for i in range(workers)]
+        results = [future.result() for future in futures]
+    summary = merge(queue_dir, output_path, archive_path)
+    summary["workers"] = {f"worker-{i}": len(result)
+                          for i, result in enumerate(results)}
+    return summary
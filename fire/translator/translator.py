@@ -9,38 +9,526 @@ Support notes:
 """
 import os.path
 import json
+from functools import lru_cache
 from time import gmtime, strftime
-from jsonschema import validate
 import click
 
 from fire.entities import transmitter, payer, payees, end_of_payer, end_of_transmission
-from .util import SequenceGenerator
+from fire.entities import state_totals
+from .util import SequenceGenerator, PayerTotals, StateTotals
+from .writer import write_atomic, write_checkpointed, write_stream
+from .compression import open_input, compression_for_path
+from . import metrics
 
+DEDUP_REPORT_SUFFIX = ".dedup.json"
+# Length of every FIRE record, in bytes
+RECORD_LENGTH = 750
+# Bytes of rendered records iter_fire_records() keeps in memory before
+# spooling them to disk
+SPOOL_MEMORY = 1 << 22
 
-@click.command()
+
+class DefaultCommandGroup(click.Group):
+    """
+    Command group that falls back to a default command when the first
+    argument is not the name of a subcommand. This keeps the original
+    single-file invocation (`fire-1099 INPUT_PATH ...`) working alongside
+    subcommands such as `fire-1099 batch`.
+    """
+    def __init__(self, *args, default_command=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and \
+           args[0] not in ctx.help_option_names:
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup, default_command="convert")
+def cli():
+    """
+    Generate files in the format required by IRS Publication 1220.
+
+    Run `fire-1099 INPUT_PATH` to convert a single input file, or one of the
+    commands below.
+    """
+
+
+@cli.command()
 @click.argument("input_path", type=click.Path(exists=True))
 @click.option(
     "--output", type=click.Path(), help="system path for the output to be generated"
 )
-@click.option("--type", "-t", help="NEC or MISC")
-def cli(input_path, output, type="MISC"):
+@click.option("--type", "-t", default="MISC", help="NEC or MISC")
+@click.option(
+    "--checkpoint-interval", type=click.IntRange(min=1),
+    help="save a resumable checkpoint every N payees; rerun with the same \
+    --output to resume. A resumed run still reads, validates and transforms \
+    every payee (the totals need them all), and only skips writing the \
+    payees before the checkpoint"
+)
+@click.option(
+    "--dedup", is_flag=True,
+    help="merge payees with the same TIN and account number, and report \
+    conflicting names/addresses in OUTPUT.dedup.json"
+)
+@click.option(
+    "--dedup-memory", type=click.IntRange(min=1), default=256,
+    show_default=True,
+    help="memory budget in MB for the dedup index before it spills to disk"
+)
+@click.option(
+    "--sort-by", type=click.Choice(["tin", "name", "account"]),
+    help="write payees sorted by TIN, name or account number, using an \
+    external sort that spills to disk for large inputs"
+)
+@click.option(
+    "--reject-file", type=click.Path(dir_okay=False),
+    help="validate payees one at a time, writing invalid payees and their \
+    errors to this NDJSON file instead of aborting the run"
+)
+@click.option(
+    "--archive", type=click.Path(dir_okay=False),
+    help="also write a copy of the output to this path, compressed according \
+    to its extension (.gz, .xz or .bz2)"
+)
+@click.option(
+    "--index", is_flag=True,
+    help="also write a sidecar index of payee records to OUTPUT.idx, for \
+    `fire-1099 lookup`"
+)
+@click.option(
+    "--report", type=click.Choice(["json", "csv"]),
+    help="also write a summary report (totals by amount code and state, top \
+    payees) to OUTPUT.report.json or OUTPUT.report.csv"
+)
+@click.option(
+    "--report-top", type=click.IntRange(min=1), default=10, show_default=True,
+    help="number of top payees listed in the report"
+)
+@click.option(
+    "--multi-form", "multiform", is_flag=True,
+    help="route payees by their form_type field (MISC or NEC, defaulting to \
+    --type) to one payer group per form, in a single transmission"
+)
+@click.option(
+    "--payees", "payees_path", type=click.Path(exists=True, dir_okay=False),
+    help="read payees from this Parquet (.parquet) or Feather (.feather) \
+    file instead of INPUT_PATH, which then only needs the transmitter and \
+    payer (requires pyarrow)"
+)
+@click.option(
+    "--max-memory",
+    help="memory budget of the run (e.g. 512M or 2G), from which it chooses \
+    to hold payees in memory, spill rendered records to disk, or stream the \
+    input; peak memory use is reported at the end"
+)
+@click.option(
+    "--progress", is_flag=True,
+    help="show the progress of the validate, transform and render stages \
+    (payees done, payees/s, ETA, RSS) on stderr"
+)
+@click.option(
+    "--progress-json", type=click.File("w"),
+    help="also write progress events to this file as NDJSON, one event per \
+    line (- for stdout)"
+)
+@click.option(
+    "--metrics-file", type=click.Path(dir_okay=False),
+    help="write Prometheus metrics of the run (payee counts, stage latency, \
+    cache hits, bytes written) to this file for the node exporter's textfile \
+    collector, also when the run fails"
+)
+def convert(input_path, output, type="MISC", checkpoint_interval=None,
+            dedup=False, dedup_memory=256, sort_by=None, reject_file=None,
+            archive=None, index=False, report=None, report_top=10,
+            multiform=False, payees_path=None, max_memory=None,
+            progress=False, progress_json=None, metrics_file=None):
     """
     Convert a JSON input file into the format required by IRS Publication 1220
 
     \b
     input_path: system path for file containing the user input JSON data
+    (optionally gzip, xz or bz2 compressed)
+    """
+    if (sort_by or reject_file or archive) and checkpoint_interval:
+        raise click.UsageError("--sort-by, --reject-file and --archive "
+                               "cannot be combined with --checkpoint-interval")
+    if multiform and (checkpoint_interval or dedup or reject_file or report):
+        raise click.UsageError("--multi-form cannot be combined with "
+                               "--checkpoint-interval, --dedup, --reject-file "
+                               "or --report")
+    if payees_path and (checkpoint_interval or dedup or sort_by or
+                        reject_file or report or multiform):
+        raise click.UsageError("--payees cannot be combined with "
+                               "--checkpoint-interval, --dedup, --sort-by, "
+                               "--reject-file, --report or --multi-form")
+    if max_memory and (checkpoint_interval or dedup or multiform or
+                       payees_path):
+        raise click.UsageError("--max-memory cannot be combined with "
+                               "--checkpoint-interval, --dedup, --multi-form "
+                               "or --payees")
+    if max_memory:
+        from .budget import parse_size
+        try:
+            max_memory = parse_size(max_memory)
+        except Exception as error:
+            raise click.BadParameter(str(error), param_hint="--max-memory")
+    callback = None
+    if progress or progress_json:
+        from .progress import bar_callback, ndjson_callback
+        callbacks = []
+        if progress:
+            callbacks.append(bar_callback(click.get_text_stream("stderr")))
+        if progress_json:
+            callbacks.append(ndjson_callback(progress_json))
+
+        def callback(event):
+            for function in callbacks:
+                function(event)
+    if metrics_file:
+        metrics.enable()
+    try:
+        summary = run(input_path, output, type, checkpoint_interval, dedup,
+                      dedup_memory * 1024 * 1024, sort_by, reject_file,
+                      archive, index, report, report_top, multiform,
+                      payees_path, max_memory, callback)
+    finally:
+        if metrics_file:
+            metrics.write_textfile(metrics_file)
+    if dedup:
+        dedup_report = summary["dedup"]
+        click.echo(f"Merged {dedup_report['duplicates']} duplicate payees "
+                   f"({len(dedup_report['conflicts'])} conflicts) -- report: "
+                   f"{summary['output']}{DEDUP_REPORT_SUFFIX}", err=True)
+    if reject_file:
+        click.echo(f"{summary['accepted']} payees accepted, "
+                   f"{summary['rejected']} rejected -- rejects: "
+                   f"{summary['rejects']}", err=True)
+    if report:
+        click.echo(f"Summary report: {summary['report']}", err=True)
+    if multiform:
+        forms = ", ".join(f"{count} {form_type}"
+                          for form_type, count in summary["forms"].items())
+        click.echo(f"Payees by form: {forms}", err=True)
+    if max_memory:
+        peak = summary["peak_rss"]
+        peak_text = "unknown" if peak is None else f"{peak / 2 ** 20:.1f} MB"
+        click.echo(f"Strategy: {summary['strategy']} -- peak RSS: "
+                   f"{peak_text}", err=True)
+        if peak is not None and peak > max_memory:
+            click.echo(f"Warning: peak RSS exceeded --max-memory "
+                       f"({max_memory / 2 ** 20:.1f} MB)", err=True)
+
+
+@cli.command()
+@click.argument("inputs")
+@click.option(
+    "--output-dir", type=click.Path(file_okay=False),
+    help="directory for generated files (defaults to each input's directory)"
+)
+@click.option("--type", "-t", default="MISC", help="NEC or MISC")
+@click.option(
+    "--workers", "-j", type=click.IntRange(min=1),
+    help="number of worker processes (defaults to the number of CPUs)"
+)
+@click.option(
+    "--summary", type=click.Path(dir_okay=False),
+    help="system path for the JSON summary (defaults to \
+    batch_summary.json in the output directory)"
+)
+@click.pass_context
+def batch(ctx, inputs, output_dir, type, workers, summary):
+    """
+    Convert many JSON input files concurrently
+
+    \b
+    inputs: directory containing *.json input files, or a glob pattern
+    """
+    from .batch import collect_inputs, run_batch
+    result = run_batch(collect_inputs(inputs), output_dir, type, workers,
+                       summary)
+    click.echo(f"{result['succeeded']} of {result['total_files']} files "
+               f"converted -- summary: {result['summary_path']}")
+    if result["failed"]:
+        ctx.exit(1)
+
+
+@cli.command()
+@click.argument("input_path", type=click.Path(exists=True))
+@click.option(
+    "--output", type=click.Path(), help="system path for the output to be generated"
+)
+def extension(input_path, output):
+    """
+    Convert a JSON list of payers into an Extension of Time request file
+
+    \b
+    input_path: system path for file containing the user input JSON data
+    """
+    from .extension import run as run_extension
+    count = run_extension(input_path, output)
+    click.echo(f"{count} extension records written")
+
+
+@cli.command()
+@click.option("--host", default="127.0.0.1", show_default=True,
+              help="interface to listen on")
+@click.option("--port", default=8080, show_default=True, help="port to listen on")
+@click.option("--workers", "-j", type=click.IntRange(min=1), default=4,
+              show_default=True, help="number of concurrent conversions")
+@click.option("--queue-size", type=click.IntRange(min=0), default=16,
+              show_default=True,
+              help="requests allowed to wait for a worker before new ones \
+              are rejected with 503")
+@click.option("--metrics-port", type=click.IntRange(min=0),
+              help="also serve Prometheus metrics of the conversions at \
+              http://HOST:PORT/metrics")
+def serve(host, port, workers, queue_size, metrics_port=None):
+    """
+    Serve conversions over HTTP (POST /convert, POST /validate)
+    """
+    from .server import serve as serve_forever
+    if metrics_port is not None:
+        metrics.enable()
+        metrics_server = metrics.serve(metrics_port, host)
+        click.echo(f"Serving metrics on http://{host}:"
+                   f"{metrics_server.server_address[1]}/metrics")
+    click.echo(f"Serving on http://{host}:{port}")
+    serve_forever(host, port, workers, queue_size)
+
+
+@cli.command()
+@click.argument("input_path", type=click.Path(exists=True))
+@click.option(
+    "--output", type=click.Path(), help="system path for the output to be generated"
+)
+@click.option("--type", "-t", default="MISC", help="NEC or MISC")
+@click.option("--interval", type=click.FloatRange(min=0.05), default=1.0,
+              show_default=True, help="seconds between checks for changes")
+def watch(input_path, output, type, interval):
+    """
+    Regenerate the output file whenever the input file changes
+
+    \b
+    input_path: system path for file containing the user input JSON data
+    """
+    from .watch import watch as watch_file
+    if output is None:
+        output = get_default_output_path(input_path)
+
+    def report(result):
+        if "error" in result:
+            click.echo(f"Not updated -- {result['error']}", err=True)
+        elif "errors" in result:
+            indexes = ", ".join(str(error["index"])
+                                for error in result["errors"])
+            click.echo(f"Not updated -- invalid payees at index {indexes}",
+                       err=True)
+        else:
+            action = "patched" if result["patched"] else "written"
+            click.echo(f"{result['payees']} payees, {result['changed']} "
+                       f"changed -- {action}: {output}")
+
+    click.echo(f"Watching {input_path} (Ctrl+C to stop)")
+    try:
+        watch_file(input_path, output, type, interval, report)
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command()
+@click.argument("output_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--tin", help="payee TIN (punctuation is ignored)")
+@click.option("--account", help="payer's account number for the payee")
+@click.option("--name-control", help="payee name control")
+@click.option(
+    "--index", "index_path", type=click.Path(exists=True, dir_okay=False),
+    help="system path of the index (defaults to OUTPUT_PATH.idx)"
+)
+@click.pass_context
+def lookup(ctx, output_path, tin, account, name_control, index_path):
+    """
+    Print the payee records of an output file matching all given keys, as
+    JSON lines, using the index written by `--index`
+
+    \b
+    output_path: system path of an (uncompressed) output file
+    """
+    from .index import lookup as lookup_records, get_index_path
+    if not (tin or account or name_control):
+        raise click.UsageError("Give at least one of --tin, --account and "
+                               "--name-control")
+    if index_path is None and \
+       not os.path.isfile(get_index_path(output_path)):
+        raise click.UsageError(f"No index at {get_index_path(output_path)} "
+                               "-- convert with --index to write one")
+    matches = lookup_records(output_path, index_path, tin=tin,
+                             account=account, name_control=name_control)
+    for fields in matches:
+        click.echo(json.dumps({key: value for key, value in fields.items()
+                               if not key.startswith("blank")}))
+    if not matches:
+        click.echo("No matching payees", err=True)
+        ctx.exit(1)
+
+
+@cli.command()
+@click.argument("input_path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--output", type=click.Path(dir_okay=False),
+    help="system path for the JSON output (defaults to the input path with \
+    a .json or .ndjson extension)"
+)
+@click.option("--ndjson", is_flag=True,
+              help="write the transmitter and payer on the first line, then \
+              one payee per line")
+@click.option(
+    "--workers", "-j", type=click.IntRange(min=1),
+    help="number of worker processes (defaults to the number of CPUs)"
+)
+@click.option("--type", "-t", type=click.Choice(["MISC", "NEC"]),
+              help="NEC or MISC (detected from the payer record by default)")
+def reverse(input_path, output, ndjson, workers, type):
+    """
+    Translate a FIRE file back into the JSON input format
+
+    \b
+    input_path: system path of a FIRE file (optionally gzip, xz or bz2
+    compressed)
+    """
+    from .reverse import reverse as reverse_file
+    summary = reverse_file(input_path, output, ndjson, workers, type=type)
+    click.echo(f"{summary['payees']} payees ({summary['type']}) written "
+               f"-- output: {summary['output']}")
+
+
+@cli.group()
+def shard():
+    """
+    Render a large input across worker processes and hosts sharing a queue
+    directory (plan, work, merge)
+    """
+
+
+@shard.command("plan")
+@click.argument("input_path", type=click.Path(exists=True))
+@click.argument("queue_dir", type=click.Path(file_okay=False))
+@click.option("--type", "-t", default="MISC", help="NEC or MISC")
+@click.option("--shard-size", type=click.IntRange(min=1), default=50000,
+              show_default=True, help="number of payees per shard")
+def shard_plan(input_path, queue_dir, type, shard_size):
+    """
+    Split an input into shard manifests in a shared queue directory
+
+    \b
+    input_path: system path for file containing the user input JSON data
+    queue_dir: queue directory shared with the workers
     """
-    run(input_path, output, type)
+    from .shard import plan
+    job = plan(input_path, queue_dir, shard_size, type)
+    click.echo(f"{job['payees']} payees in {len(job['shards'])} shards "
+               f"-- queue: {queue_dir}")
 
 
-def run(input_path, output_path, type="MISC"):
+@shard.command("work")
+@click.argument("queue_dir", type=click.Path(file_okay=False))
+@click.option("--worker", help="name of the worker (defaults to HOST-PID)")
+@click.option("--reclaim-after", type=click.FloatRange(min=0),
+              help="requeue shards claimed by other workers more than this \
+              many seconds ago, and wait for their claims to be released")
+def shard_work(queue_dir, worker, reclaim_after):
+    """
+    Render pending shards of a queue directory until none is left
+
+    \b
+    queue_dir: queue directory shared with the coordinator
+    """
+    from .shard import work
+    results = work(queue_dir, worker, reclaim_after)
+    click.echo(f"{len(results)} shards rendered "
+               f"({sum(result['count'] for result in results)} payees)")
+
+
+@shard.command("merge")
+@click.argument("queue_dir", type=click.Path(exists=True, file_okay=False))
+@click.option("--output", type=click.Path(dir_okay=False), required=True,
+              help="system path for the output to be generated")
+@click.option(
+    "--archive", type=click.Path(dir_okay=False),
+    help="also write a copy of the output to this path, compressed according \
+    to its extension (.gz, .xz or .bz2)"
+)
+def shard_merge(queue_dir, output, archive):
+    """
+    Concatenate the rendered shards of a queue directory into the output
+
+    \b
+    queue_dir: queue directory of a completed job
+    """
+    from .shard import merge
+    summary = merge(queue_dir, output, archive)
+    click.echo(f"{summary['payees']} payees from {summary['shards']} shards "
+               f"-- output: {summary['output']}")
+
+
+@shard.command("run")
+@click.argument("input_path", type=click.Path(exists=True))
+@click.option(
+    "--output", type=click.Path(), help="system path for the output to be generated"
+)
+@click.option("--type", "-t", default="MISC", help="NEC or MISC")
+@click.option("--shard-size", type=click.IntRange(min=1), default=50000,
+              show_default=True, help="number of payees per shard")
+@click.option(
+    "--workers", "-j", type=click.IntRange(min=1),
+    help="number of worker processes (defaults to the number of CPUs)"
+)
+@click.option("--queue-dir", type=click.Path(file_okay=False),
+              help="queue directory to keep (defaults to a temporary \
+              directory next to the output)")
+@click.option(
+    "--archive", type=click.Path(dir_okay=False),
+    help="also write a copy of the output to this path, compressed according \
+    to its extension (.gz, .xz or .bz2)"
+)
+def shard_run(input_path, output, type, shard_size, workers, queue_dir,
+              archive):
+    """
+    Plan, render and merge a sharded run with local worker processes
+
+    \b
+    input_path: system path for file containing the user input JSON data
+    """
+    from .shard import run_sharded
+    if output is None:
+        output = get_default_output_path(input_path)
+    summary = run_sharded(input_path, output, type, shard_size, workers,
+                          queue_dir, archive)
+    click.echo(f"{summary['payees']} payees from {summary['shards']} shards "
+               f"-- output: {summary['output']}")
+
+
+@metrics.instrument("run")
+def run(input_path, output_path, type="MISC", checkpoint_interval=None,
+        dedup=False, dedup_memory_budget=None, sort_by=None,
+        reject_path=None, archive_path=None, index=False, report=None,
+        report_top=None, multiform=False, payees_path=None,
+        max_memory=None, progress=None):
     """
     Sequentially calls helper functions to fully process :
     * Load user JSON data from input file
+    * Validate user data (optionally payee by payee, setting aside invalid
+      payees in a reject file)
+    * Optionally merge duplicate payees
+    * Optionally sort payees (in which case they are streamed to the output
+      file in sorted order, see write_streamed())
     * Transform user data and merge into a master schema
     * Generate and insert computed values into master
-    * Format ASCII string representing user- and system-generated data
-    * Write ASCII string to output file
+    * Format ASCII bytes representing user- and system-generated data
+    * Write ASCII bytes to output file
 
     Parameters
     ----------
@@ -49,33 +537,374 @@ def run(input_path, output_path, type="MISC"):
     output : str
         optional system path for the output to be generated
 
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    checkpoint_interval : int
+        optional number of payees to write between checkpoints. If given, an
+        interrupted run can be resumed by re-running with the same input and
+        output paths. The resumed run still loads, validates and transforms
+        every payee, since the generated totals depend on all of them; only
+        writing the payees before the checkpoint is skipped.
+
+    dedup : bool
+        if True, payees with the same TIN and account number are merged (see
+        the dedup module), and a report of the merge is written next to the
+        output file.
+
+    dedup_memory_budget : int
+        optional memory budget of the dedup index, in bytes
+
+    sort_by : str
+        optional sort order of payees: "tin", "name" or "account". Cannot be
+        combined with checkpoint_interval.
+
+    reject_path : str
+        optional system path for a reject file. If given, payees are
+        validated one at a time: invalid payees are written to the reject
+        file with their errors (see the reject module), and the output and
+        its totals only include valid payees. Cannot be combined with
+        checkpoint_interval.
+
+    archive_path : str
+        optional path of an archival copy of the output, compressed
+        according to its extension (e.g. ".xz"). Cannot be combined with
+        checkpoint_interval.
+
+    index : bool
+        if True, a sidecar index of the payee records is written next to the
+        output file once it is complete (see the index module). The output
+        must not be compressed.
+
+    report : str
+        optional summary report format, "json" or "csv". If given, totals by
+        amount code and by state and the top payees are accumulated while the
+        payer totals are computed, and written next to the output file (see
+        the report module).
+
+    report_top : int
+        optional number of top payees listed in the report
+
+    multiform : bool
+        if True, payees are routed by their form_type field ("MISC" or
+        "NEC", defaulting to type) to a payer group per form, all written in
+        one transmission (see the multiform module). Cannot be combined with
+        checkpoint_interval, dedup, reject_path or report.
+
+    payees_path : str
+        optional system path of a Parquet or Feather file holding the
+        payees, which are then rendered a record batch at a time (see the
+        columnar module); the input file only needs the transmitter and
+        payer. Cannot be combined with checkpoint_interval, dedup, sort_by,
+        reject_path, report or multiform.
+
+    max_memory : int
+        optional memory budget of the process, in bytes. If given, the run
+        holds its payees in memory, spills their rendered records to disk,
+        or streams them from the input, depending on the input size (see
+        the budget module), and reports the strategy chosen and its peak
+        resident set size. Cannot be combined with checkpoint_interval,
+        dedup, multiform or payees_path.
+
+    progress : function
+        optional callback, called with progress events (dicts: stage, done,
+        total, elapsed, rate, eta, rss and finished) as the validate,
+        transform and render stages iterate over the payees (see the
+        progress module). Streamed runs transform and render each payee in
+        one step, reported as the render stage. Checkpointed, multi-form
+        and columnar runs are not reported on.
+
+    Returns
+    ----------
+    dict
+        Summary of the run: output path and number of payees written, the
+        dedup report if dedup was requested, the number of accepted and
+        rejected payees and the reject file path if reject_path was given,
+        the index and report paths if requested, the number of payees per
+        form type if multiform was requested, and the strategy and peak
+        resident set size (in bytes, or None where unknown) if max_memory
+        was given.
+
+    """
+    streamed = bool(sort_by or reject_path)
+    if streamed and checkpoint_interval:
+        raise Exception("Sorted or screened output cannot be checkpointed")
+    if archive_path and checkpoint_interval:
+        raise Exception("Checkpointed output cannot be archived")
+    if multiform and (checkpoint_interval or dedup or reject_path or report):
+        raise Exception("Multi-form output cannot be checkpointed, deduped, \
+                screened or reported on")
+    if payees_path and (checkpoint_interval or dedup or sort_by or
+                        reject_path or report or multiform):
+        raise Exception("Columnar payee input cannot be checkpointed, \
+                deduped, sorted, screened, reported on or split by form")
+    if max_memory and (checkpoint_interval or dedup or multiform or
+                       payees_path):
+        raise Exception("Memory-budgeted runs cannot be checkpointed, \
+                deduped, split by form or read columnar payees")
+    schema_path = get_schema_path(type)
+    reporter = None
+    if progress is not None:
+        from .progress import ProgressReporter
+        reporter = ProgressReporter(progress)
+
+    def track(items, stage, total=None):
+        if reporter is None:
+            return items
+        return reporter.track(items, stage, total)
+
+    if output_path is None:
+        output_path = get_default_output_path(input_path)
+    if index and compression_for_path(output_path) is not None:
+        raise Exception("Compressed output cannot be indexed")
+    summary = {"output": output_path}
+    summary_report = None
+    if report:
+        from .report import SummaryReport, DEFAULT_TOP_PAYEES
+        summary_report = SummaryReport(report_top or DEFAULT_TOP_PAYEES)
+
+    strategy = None
+    if max_memory:
+        from .budget import choose_strategy, estimate_input_size
+        strategy = choose_strategy(estimate_input_size(input_path),
+                                   max_memory)
+        summary["strategy"] = strategy
+        streamed = streamed or strategy != "memory"
+
+    if strategy == "stream":
+        from .budget import read_streaming
+        user_data = read_streaming(
+            input_path, os.path.dirname(os.path.abspath(output_path)))
+    else:
+        user_data = extract_user_data(input_path)
+    screen = None
+    if reject_path:
+        from .reject import PayeeScreen, validate_header
+        from .extsort import drain
+        validate_header(user_data, schema_path)
+        screen = PayeeScreen(schema_path, reject_path)
+        payee_list = user_data["payees"]
+        user_data["payees"] = screen.filter(track(
+            drain(payee_list), "validate",
+            len(payee_list) if isinstance(payee_list, list) else None))
+    elif strategy == "stream":
+        from .reject import validate_header
+        validate_header(user_data, schema_path)
+        user_data["payees"] = track(
+            validate_payees(user_data["payees"], schema_path), "validate")
+    elif reporter is not None and not (multiform or payees_path):
+        from .reject import validate_header
+        validate_header(user_data, schema_path)
+        payee_list = user_data["payees"]
+        user_data["payees"] = list(track(
+            validate_payees(payee_list, schema_path), "validate",
+            len(payee_list)))
+    elif not (multiform or payees_path):
+        validate_user_data(user_data, schema_path)
+
+    try:
+        if dedup:
+            from .dedup import dedup_user_data, DEFAULT_MEMORY_BUDGET
+            summary["dedup"] = dedup_user_data(
+                user_data, dedup_memory_budget or DEFAULT_MEMORY_BUDGET,
+                os.path.dirname(os.path.abspath(output_path)))
+            write_1099_file(json.dumps(summary["dedup"], indent=2),
+                            output_path + DEDUP_REPORT_SUFFIX)
+
+        if payees_path:
+            from .columnar import write_columnar
+            summary["payees"] = write_columnar(user_data, payees_path,
+                                               output_path, type, archive_path)
+        elif multiform:
+            from .multiform import write_multiform
+            from .extsort import sort_payees, drain
+            if sort_by:
+                user_data["payees"] = sort_payees(
+                    drain(user_data["payees"]), sort_by,
+                    spill_dir=os.path.dirname(os.path.abspath(output_path)))
+            summary["forms"] = write_multiform(
+                user_data, output_path, "MISC" if type == "MISC" else "NEC",
+                archive_path)
+            summary["payees"] = sum(summary["forms"].values())
+        elif streamed:
+            summary["payees"] = write_streamed(
+                user_data, output_path, sort_by,
+                os.path.dirname(os.path.abspath(output_path)), archive_path,
+                summary_report, reporter)
+            if screen is not None:
+                screen.close()
+                summary["accepted"] = screen.accepted_count
+                summary["rejected"] = screen.rejected_count
+                summary["rejects"] = reject_path
+                metrics.count("payees_processed",
+                              screen.accepted_count + screen.rejected_count)
+                metrics.count("payees_rejected", screen.rejected_count)
+        else:
+            master = load_full_schema(dict(
+                user_data, payees=track(user_data["payees"], "transform")))
+            insert_generated_values(master, summary_report)
+
+            if checkpoint_interval:
+                write_checkpointed(master, output_path, checkpoint_interval,
+                                   input_fingerprint(input_path, type))
+            else:
+                write_1099_file(get_fire_bytes(dict(
+                    master, payees=track(master["payees"], "render"))),
+                                output_path, archive_path)
+
+            summary["payees"] = len(master["payees"])
+    except BaseException:
+        if screen is not None:
+            screen.discard()
+        raise
+
+    metrics.count("payees_rendered", summary["payees"])
+    if summary_report is not None:
+        from .report import get_report_path
+        summary["report"] = get_report_path(output_path, report)
+        summary_report.write(summary["report"], report)
+    if index:
+        from .index import build_index
+        summary["index"] = build_index(output_path)
+    if max_memory:
+        from .budget import peak_rss
+        summary["peak_rss"] = peak_rss()
+    return summary
+
+
+def write_streamed(data, path, sort_by=None, spill_dir=None,
+                   archive_path=None, report=None, progress=None):
+    """
+    Streams the payees in user data to path, optionally sorting them first
+    with an external merge sort. Payees are transformed, numbered and
+    totalled one at a time, so neither the sorted payees nor their
+    transformed records are held in memory. _Note: this consumes the payees
+    of the input parameter._
+
+    Parameters
+    ----------
+    data : dict
+        validated user input data, as returned by extract_user_data(). Its
+        payees may be a list or any other iterable.
+
+    path : str
+        system path of the output file
+
+    sort_by : str
+        optional sort order: "tin", "name" or "account". Payees are written
+        in input order if not given.
+
+    spill_dir : str
+        optional directory for sort run files
+
+    archive_path : str
+        optional path of an archival copy (see writer.write_stream)
+
+    report : SummaryReport
+        optional summary report to accumulate the payees into
+
+    progress : ProgressReporter
+        optional progress reporter, tracking the payees as they are
+        transformed and rendered (the "render" stage)
+
+    Returns
+    ----------
+    int
+        Number of payees written.
+    """
+    from .extsort import sort_payees, drain
+    payee_list = data["payees"]
+    total = None
+    if isinstance(payee_list, list):
+        total = len(payee_list)
+        payee_list = drain(payee_list)
+    if sort_by:
+        payee_list = sort_payees(payee_list, sort_by, spill_dir=spill_dir)
+    if progress is not None:
+        payee_list = progress.track(payee_list, "render", total)
+    return write_stream(transmitter.xform(data["transmitter"]),
+                        payer.xform(data["payer"]),
+                        (payees.xform([payee])[0] for payee in payee_list),
+                        path, archive_path, report)
+
+
+def get_schema_path(type="MISC"):
+    """
+    Returns the system path of the schema used to validate input data of the
+    given form type.
+
+    Parameters
+    ----------
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    Returns
+    ----------
+    str
+        system path for the schema file
     """
     module_path = os.path.split(os.path.realpath(__file__))[0]
-    schema_path = os.path.join(
+    return os.path.join(
         module_path,
         "../schema",
         "1099_MISC_schema.json" if type == "MISC" else "1099_NEC_schema.json",
     )
+
+
+def get_default_output_path(input_path):
+    """
+    Returns the output path used when none is given: a timestamped file name
+    in the directory of the input file.
+
+    Parameters
+    ----------
+    input_path : str
+        system path for file containing the user input JSON data
+
+    Returns
+    ----------
+    str
+        system path for the output to be generated
+    """
     input_dirname = os.path.dirname(os.path.abspath(input_path))
-    if output_path is None:
-        output_path = "{}/output_{}".format(
-            input_dirname, strftime("%Y-%m-%d %H_%M_%S", gmtime())
-        )
+    return "{}/output_{}".format(
+        input_dirname, strftime("%Y-%m-%d %H_%M_%S", gmtime())
+    )
 
-    user_data = extract_user_data(input_path)
-    validate_user_data(user_data, schema_path)
 
-    master = load_full_schema(user_data)
-    insert_generated_values(master)
+def input_fingerprint(path, type="MISC"):
+    """
+    Returns a digest identifying the contents of the input file at path and
+    the form type it is processed as. Used to match checkpoints to the input
+    they were created from.
 
-    ascii_string = get_fire_format(master)
-    write_1099_file(ascii_string, output_path)
+    Parameters
+    ----------
+    path : str
+        system path for file containing the user input JSON data
+
+    type : str
+        form type of the input data
+
+    Returns
+    ----------
+    str
+        Hex digest of the input.
+    """
+    import hashlib
+
+    digest = hashlib.sha256(type.encode("utf-8"))
+    with open(path, mode="rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 
 def extract_user_data(path):
     """
     Opens file at path specified by input parameter. Reads data as JSON and
-    returns a dict containing that JSON data.
+    returns a dict containing that JSON data. gzip, xz and bz2 compressed
+    files are decompressed as they are read (see the compression module).
 
     Parameters
     ----------
@@ -88,11 +917,12 @@ def extract_user_data(path):
         JSON data loaded from file at input path
     """
     user_data = {}
-    with open(path, mode="r", encoding="utf-8") as file:
+    with open_input(path) as file:
         user_data = json.load(file)
     return user_data
 
 
+@metrics.instrument("validate")
 def validate_user_data(data, schema_path):
     """
     Validates data (first param) against the base schema (second param)
@@ -106,11 +936,76 @@ def validate_user_data(data, schema_path):
         system path for file containing schema to data validate against
 
     """
+    # Imported here rather than at module level: jsonschema accounts for most
+    # of the import time of this module, and is not needed by the CLI until a
+    # file is actually validated.
+    from jsonschema.exceptions import best_match
+
+    error = best_match(load_validator(schema_path).iter_errors(data))
+    if error is not None:
+        raise error
+    metrics.count("payees_processed", len(data.get("payees", ())))
+
+
+def validate_payees(payee_list, schema_path):
+    """
+    Validates payees one at a time against a schema, as they are iterated.
+    The first invalid payee raises a jsonschema ValidationError.
+
+    Parameters
+    ----------
+    payee_list : iterable of dict
+        user-supplied payee data. May be a generator.
+
+    schema_path: str
+        system path for file containing schema to data validate against
+
+    Yields
+    ----------
+    dict
+        Valid payees, in order.
+    """
+    from jsonschema.exceptions import best_match
+
+    validator = load_validator(schema_path)
+    count = 0
+    for payee in payee_list:
+        error = best_match(validator.iter_errors({"payees": [payee]}))
+        if error is not None:
+            raise error
+        count += 1
+        yield payee
+    metrics.count("payees_processed", count)
+
+
+@metrics.cached("validator")
+@lru_cache(maxsize=None)
+def load_validator(schema_path):
+    """
+    Loads the schema at the given path, checks it, and returns a validator
+    instance for it. Validators are cached per schema path, so repeated
+    validations (e.g. in batch runs) only load and compile each schema once.
+
+    Parameters
+    ----------
+    schema_path: str
+        system path for file containing schema to data validate against
+
+    Returns
+    ----------
+    jsonschema.protocols.Validator
+        Validator for the schema at schema_path
+    """
+    from jsonschema.validators import validator_for
+
     with open(schema_path, mode="r", encoding="utf-8") as schema:
         schema = json.load(schema)
-        validate(data, schema)
+    validator_class = validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
 
 
+@metrics.instrument("transform")
 def load_full_schema(data):
     """
     Merges data into the master schema for records, including fields that were
@@ -133,6 +1028,7 @@ def load_full_schema(data):
         "payer": "",
         "payees": [],
         "end_of_payer": "",
+        "state_totals": [],
         "end_of_transmission": "",
     }
     merged_data["transmitter"] = transmitter.xform(data["transmitter"])
@@ -144,7 +1040,7 @@ def load_full_schema(data):
     return merged_data
 
 
-def insert_generated_values(data):
+def insert_generated_values(data, report=None):
     """
     Inserts system-generated values into the appropriate fields. _Note: this
     edits the dict object provided as a parameter in-place._
@@ -159,9 +1055,14 @@ def insert_generated_values(data):
         this includes end_of_payer and end_of_transmission records, with all
         fields captured.
 
+    report : SummaryReport
+        optional summary report, accumulated along with the payer totals (see
+        insert_payer_totals)
+
     """
+    # Payer totals generate the state totals records, which are then numbered
+    insert_payer_totals(data, report)
     insert_sequence_numbers(data)
-    insert_payer_totals(data)
     insert_transmitter_totals(data)
 
 
@@ -169,7 +1070,7 @@ def insert_sequence_numbers(data):
     """
     Inserts sequence numbers into each record, in the following order:
     transmitter, payer, payee(s) (each in order supplied by user),
-    end of payer, end of transmission.
+    end of payer, state totals (if any), end of transmission.
 
     _Note: this edits the input parameter in-place._
 
@@ -187,63 +1088,53 @@ def insert_sequence_numbers(data):
     for payee in data["payees"]:
         payee["record_sequence_number"] = seq.get_next()
     data["end_of_payer"]["record_sequence_number"] = seq.get_next()
+    for state in data.get("state_totals", []):
+        state["record_sequence_number"] = seq.get_next()
     data["end_of_transmission"]["record_sequence_number"] = seq.get_next()
 
 
-def insert_payer_totals(data):
+def insert_payer_totals(data, report=None):
     """
     Inserts requried values into the payer and end_of_payer records. This
     includes values for the following fields: payment_amount_*,
     amount_codes, number_of_payees, total_number_of_payees, number_of_a_records.
 
+    If the payer participates in the Combined Federal/State Filing Program
+    (payer::combined_fed_state is "1"), per-state totals are accumulated in
+    the same pass over the payees, and one state_totals (K) record per state
+    is stored in data["state_totals"].
+
     _Note: this edits the input parameter in-place._
 
+    If a summary report is given, each payee is added to it in the same pass,
+    with the payment amounts parsed for the totals (see the report module).
+
     Parameters
     ----------
     data : dict
         Dictionary containing payer, payee, and end_of_payer records, into which
         computed values will be inserted.
 
-    """
-    codes = [
-        "1",
-        "2",
-        "3",
-        "4",
-        "5",
-        "6",
-        "7",
-        "8",
-        "9",
-        "A",
-        "B",
-        "C",
-        "D",
-        "E",
-        "F",
-        "G",
-        "H",
-        "J"
-    ]
-    totals = [0 for _ in range(len(codes))]
-    payer_code_string = ""
+    report : SummaryReport
+        optional summary report to accumulate the payees into
 
-    for payee in data["payees"]:
-        for i, code in enumerate(codes):
-            try:
-                totals[i] += int(payee["payment_amount_" + code])
-            except ValueError:
-                pass
-
-    for i, (total, code) in enumerate(zip(totals, codes)):
-        if total != 0:
-            payer_code_string += code
-            data["end_of_payer"]["payment_amount_" + code] = f"{total:0>18}"
-
-    data["payer"]["amount_codes"] = str(payer_code_string)
-    payee_count = len(data["payees"])
-    data["payer"]["number_of_payees"] = f"{payee_count:0>8}"
-    data["end_of_payer"]["number_of_payees"] = f"{payee_count:0>8}"
+    """
+    totals = PayerTotals()
+    if data["payer"]["combined_fed_state"] == "1":
+        states = StateTotals()
+        for payee in data["payees"]:
+            amounts = totals.add(payee)
+            states.add(payee, amounts)
+            if report is not None:
+                report.add(payee, amounts)
+        data["state_totals"] = state_totals.xform(states.records())
+    elif report is not None:
+        for payee in data["payees"]:
+            report.add(payee, totals.add(payee))
+    else:
+        for payee in data["payees"]:
+            totals.add(payee)
+    totals.insert(data["payer"], data["end_of_payer"])
 
 
 def insert_transmitter_totals(data):
@@ -268,6 +1159,7 @@ def insert_transmitter_totals(data):
     data["end_of_transmission"]["number_of_a_records"] = "00000001"
 
 
+@metrics.instrument("render")
 def get_fire_format(data):
     """
     Returns the input dictionary converted into the string format required by
@@ -277,6 +1169,7 @@ def get_fire_format(data):
     * payer (dict)
     * payees (array of dict objects)
     * end_of_payer (dict)
+    * state_totals (optional array of dict objects)
     * end_of_transmission
 
     Parameters
@@ -291,31 +1184,177 @@ def get_fire_format(data):
         FIRE-formatted string containing data provided as the input parameter.
 
     """
-    fire_string = ""
+    return "".join(iter_fire_format(data))
+
+
+def iter_fire_format(data):
+    """
+    Yields the records of the input dictionary one at a time, each converted
+    into the string format required by the IRS FIRE electronic filing system.
+    Records are yielded in file order; joining them gives the same result as
+    get_fire_format().
+
+    Parameters
+    ----------
+    data : dict
+        Dictionary containing records to be processed into FIRE-formatted
+        strings (see get_fire_format).
+
+    Yields
+    ----------
+    str
+        FIRE-formatted record.
+
+    """
+    yield transmitter.fire(data["transmitter"])
+    yield payer.fire(data["payer"])
+    for payee in data["payees"]:
+        yield payees.fire([payee])
+    yield end_of_payer.fire(data["end_of_payer"])
+    for state in data.get("state_totals", []):
+        yield state_totals.fire([state])
+    yield end_of_transmission.fire(data["end_of_transmission"])
+
+
+@metrics.instrument("render")
+def get_fire_bytes(data):
+    """
+    Returns the same records as get_fire_format(), rendered directly to
+    ASCII bytes. Non-ASCII characters in user data are transliterated (see
+    util.to_ascii), so every record is exactly as long in bytes as its
+    layout.
+
+    Parameters
+    ----------
+    data : dict
+        Dictionary containing records to be processed into a FIRE-formatted
+        string (see get_fire_format).
+
+    Returns
+    ----------
+    bytes
+        FIRE-formatted bytes containing data provided as the input parameter.
+
+    """
+    return b"".join(iter_fire_bytes(data))
 
-    fire_string += transmitter.fire(data["transmitter"])
-    fire_string += payer.fire(data["payer"])
-    fire_string += payees.fire(data["payees"])
-    fire_string += end_of_payer.fire(data["end_of_payer"])
-    fire_string += end_of_transmission.fire(data["end_of_transmission"])
 
-    return fire_string
+def iter_fire_bytes(data):
+    """
+    Yields the records of the input dictionary one at a time, as ASCII bytes
+    (see iter_fire_format and get_fire_bytes).
+
+    Parameters
+    ----------
+    data : dict
+        Dictionary containing records to be processed into FIRE-formatted
+        strings (see get_fire_format).
+
+    Yields
+    ----------
+    bytes
+        FIRE-formatted record.
+
+    """
+    yield transmitter.fire_bytes(data["transmitter"])
+    yield payer.fire_bytes(data["payer"])
+    for payee in data["payees"]:
+        yield payees.fire_bytes([payee])
+    yield end_of_payer.fire_bytes(data["end_of_payer"])
+    for state in data.get("state_totals", []):
+        yield state_totals.fire_bytes([state])
+    yield end_of_transmission.fire_bytes(data["end_of_transmission"])
 
 
-def write_1099_file(formatted_string, path):
+def iter_fire_records(transmitter_data, payer_data, payee_list, type=None,
+                      spool_memory=SPOOL_MEMORY, spill_dir=None):
+    """
+    Yields the FIRE-formatted records of a transmission one at a time, as
+    750-byte ASCII records, in file order, from user-supplied data. Totals,
+    sequence numbers and the summary records are generated internally.
+
+    The transmitter and payer records carry totals over all payees, so they
+    can only be rendered once every payee has been seen. Payees are therefore
+    transformed, numbered, totalled and rendered one at a time into a spool
+    file, which is held in memory up to spool_memory bytes and moved to disk
+    beyond that; the records are then yielded from the spool. Memory use is
+    bounded by spool_memory regardless of the number of payees. No records
+    are yielded until payee_list is exhausted.
+
+    Parameters
+    ----------
+    transmitter_data : dict
+        user-supplied transmitter data
+
+    payer_data : dict
+        user-supplied payer data
+
+    payee_list : iterable of dict
+        user-supplied payee data. May be a generator.
+
+    type : str
+        optional form type, "MISC" or "NEC". If given, the transmitter and
+        payer are validated against its schema before any payee is read, and
+        each payee as it is read; the first invalid record raises a
+        jsonschema ValidationError. Data is not validated if not given.
+
+    spool_memory : int
+        number of bytes of rendered records held in memory before the spool
+        is moved to disk
+
+    spill_dir : str
+        optional directory for the spool file. Defaults to the system
+        temporary directory.
+
+    Yields
+    ----------
+    bytes
+        FIRE-formatted record, 750 bytes long.
+
+    """
+    import tempfile
+    from .writer import RecordWriter
+
+    if type is not None:
+        schema_path = get_schema_path(type)
+        validate_user_data({"transmitter": transmitter_data,
+                            "payer": payer_data, "payees": []}, schema_path)
+        payee_list = validate_payees(payee_list, schema_path)
+
+    with tempfile.SpooledTemporaryFile(max_size=spool_memory, mode="w+b",
+                                       prefix="fire-1099-spool-",
+                                       dir=spill_dir) as spool:
+        record_writer = RecordWriter(spool, transmitter.xform(transmitter_data),
+                                     payer.xform(payer_data))
+        for payee in payee_list:
+            record_writer.write_payee(payees.xform([payee])[0])
+        record_writer.finish()
+        spool.seek(0)
+        for record in iter(lambda: spool.read(RECORD_LENGTH), b""):
+            yield record
+
+
+@metrics.instrument("write")
+def write_1099_file(formatted_string, path, archive_path=None):
     """
     Writes the given string to a file at the given path. If the file does not
-    exist, it will be created.
+    exist, it will be created. The string is written to a temporary file that
+    is fsync'd and renamed over the given path, so that an interrupted write
+    never leaves a truncated file behind.
 
     Parameters
     ----------
-    formatted_string : str
-        FIRE-formatted string to be written to disk.
+    formatted_string : str or bytes
+        FIRE-formatted string to be written to disk. str is written UTF-8
+        encoded; use get_fire_bytes() for output with exact byte offsets.
 
     path: str
-        Path of file to be written.
+        Path of file to be written. Compressed if it ends in .gz, .xz or
+        .bz2.
+
+    archive_path: str
+        optional path of an archival copy, written in the same pass and
+        compressed according to its extension.
 
     """
-    file = open(path, mode="w+")
-    file.write(formatted_string)
-    file.close()
+    write_atomic(formatted_string, path, archive_path)
@@ -4,6 +4,14 @@ Defines a set of classes and functions shared by other modules within
 the fire-1099 application.
 """
 import re
+import unicodedata
+from functools import lru_cache
+
+from . import metrics
+
+# Payment amount codes, in the order required by IRS Publication 1220
+AMOUNT_CODES = ["1", "2", "3", "4", "5", "6", "7", "8", "9",
+                "A", "B", "C", "D", "E", "F", "G", "H", "J"]
 
 # SequenceGenerator: generates sequential integer numbers
 class SequenceGenerator:
@@ -51,6 +59,266 @@ class SequenceGenerator:
         """
         return self.counter
 
+# PayerTotals: accumulates the running totals reported in payer records
+class PayerTotals:
+    """
+    Accumulates payee counts and payment amount totals, by amount code, as
+    payees are supplied via the add() method. Totals can be exported to (and
+    restored from) a plain dict, so that a partially processed set of payees
+    can be checkpointed and resumed.
+
+    Attributes
+    ----------
+    self.totals : list of int
+        Running total for each amount code, in the order of AMOUNT_CODES.
+
+    self.payee_count : int
+        Number of payees added so far.
+
+    Methods
+    ----------
+    add(payee):
+        Adds the payment amounts of a transformed payee record to the totals.
+
+    remove(payee, amounts=None):
+        Subtracts a previously added payee record from the totals.
+
+    amount_codes():
+        Returns the amount codes for which a non-zero total was accumulated.
+
+    insert(payer_data, end_of_payer_data):
+        Writes the accumulated totals into payer and end_of_payer records.
+    """
+    def __init__(self, totals=None, payee_count=0):
+        self.totals = list(totals) if totals else [0] * len(AMOUNT_CODES)
+        self.payee_count = payee_count
+
+    def add(self, payee):
+        """
+        Adds the payment amounts of a single (transformed) payee record.
+
+        Parameters
+        ----------
+        payee : dict
+            Payee record, as returned by payees.xform().
+
+        Returns
+        ---------
+        list of int
+            The payee's payment amounts, in the order of AMOUNT_CODES.
+        """
+        amounts = payee_amounts(payee)
+        totals = self.totals
+        for i, amount in enumerate(amounts):
+            totals[i] += amount
+        self.payee_count += 1
+        return amounts
+
+    def remove(self, payee, amounts=None):
+        """
+        Subtracts a single (transformed) payee record that was previously
+        added, so that totals can be maintained as payees change.
+
+        Parameters
+        ----------
+        payee : dict
+            Payee record, as returned by payees.xform().
+
+        amounts : list of int
+            Optional payment amounts of the payee, as returned by add().
+
+        Returns
+        ---------
+        list of int
+            The payee's payment amounts, in the order of AMOUNT_CODES.
+        """
+        if amounts is None:
+            amounts = payee_amounts(payee)
+        totals = self.totals
+        for i, amount in enumerate(amounts):
+            totals[i] -= amount
+        self.payee_count -= 1
+        return amounts
+
+    def amount_codes(self):
+        """
+        Returns the amount codes with a non-zero total, in IRS order.
+
+        Returns
+        ---------
+        str
+            Concatenated amount codes, e.g. "17A".
+        """
+        return "".join(code for total, code in zip(self.totals, AMOUNT_CODES)
+                       if total != 0)
+
+    def insert(self, payer_data, end_of_payer_data):
+        """
+        Inserts the accumulated totals into the given payer and end_of_payer
+        records. _Note: this edits both parameters in-place._
+
+        Parameters
+        ----------
+        payer_data : dict
+            Transformed payer record.
+
+        end_of_payer_data : dict
+            Transformed end_of_payer record.
+        """
+        for total, code in zip(self.totals, AMOUNT_CODES):
+            if total != 0:
+                end_of_payer_data["payment_amount_" + code] = f"{total:0>18}"
+        payer_data["amount_codes"] = self.amount_codes()
+        payer_data["number_of_payees"] = f"{self.payee_count:0>8}"
+        end_of_payer_data["number_of_payees"] = f"{self.payee_count:0>8}"
+
+    def to_dict(self):
+        """
+        Returns the accumulated state as a JSON-serializable dict.
+        """
+        return {"totals": self.totals, "payee_count": self.payee_count}
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Restores an instance from a dict returned by to_dict().
+        """
+        return cls(state["totals"], state["payee_count"])
+
+# StateTotals: accumulates per-state totals for Combined Federal/State Filing
+class StateTotals:
+    """
+    Accumulates payee counts, payment amount totals and state/local income tax
+    withheld per state, for the Combined Federal/State Filing Program. State
+    codes are the two-digit numeric codes of IRS Publication 1220; totals are
+    held in fixed-size lists indexed by that code, so accumulating a payee
+    involves no dictionary lookups or allocations per state.
+
+    Attributes
+    ----------
+    self.payee_counts : list of int
+        Number of payees per state code.
+
+    self.totals : list of list of int
+        Payment amount totals per state code, in the order of AMOUNT_CODES.
+
+    self.state_tax_withheld : list of int
+        State income tax withheld per state code.
+
+    self.local_tax_withheld : list of int
+        Local income tax withheld per state code.
+
+    Methods
+    ----------
+    add(payee, amounts=None):
+        Adds a transformed payee record to the totals of its state.
+
+    remove(payee, amounts=None):
+        Subtracts a previously added payee record from the totals of its
+        state.
+
+    records():
+        Returns K record values for each state with at least one payee.
+    """
+    STATE_CODES = 100
+
+    def __init__(self):
+        self.payee_counts = [0] * self.STATE_CODES
+        self.totals = [[0] * len(AMOUNT_CODES)
+                       for _ in range(self.STATE_CODES)]
+        self.state_tax_withheld = [0] * self.STATE_CODES
+        self.local_tax_withheld = [0] * self.STATE_CODES
+
+    def add(self, payee, amounts=None):
+        """
+        Adds a single (transformed) payee record to the totals of the state
+        given by its combined_federal_state_code. Payees without a numeric
+        state code do not participate and are ignored.
+
+        Parameters
+        ----------
+        payee : dict
+            Payee record, as returned by payees.xform().
+
+        amounts : list of int
+            Optional payment amounts of the payee, as returned by
+            payee_amounts(), if already computed.
+        """
+        self._accumulate(payee, amounts, 1)
+
+    def remove(self, payee, amounts=None):
+        """
+        Subtracts a single (transformed) payee record that was previously
+        added (see add).
+        """
+        self._accumulate(payee, amounts, -1)
+
+    def _accumulate(self, payee, amounts, sign):
+        code = payee["combined_federal_state_code"]
+        if not code.isdigit():
+            return
+        code = int(code)
+        if amounts is None:
+            amounts = payee_amounts(payee)
+        self.payee_counts[code] += sign
+        totals = self.totals[code]
+        for i, amount in enumerate(amounts):
+            totals[i] += sign * amount
+        self.state_tax_withheld[code] += \
+            sign * int(digits_only(payee["state_income_tax_withheld"]) or 0)
+        self.local_tax_withheld[code] += \
+            sign * int(digits_only(payee["local_income_tax_withheld"]) or 0)
+
+    def records(self):
+        """
+        Returns the values of one state totals (K) record per participating
+        state, in ascending order of state code.
+
+        Returns
+        ---------
+        list of dict
+            Untransformed state totals records (see entities.state_totals).
+        """
+        records = []
+        for code, count in enumerate(self.payee_counts):
+            if count == 0:
+                continue
+            record = {
+                "number_of_payees": str(count),
+                "state_income_tax_withheld_total":
+                    str(self.state_tax_withheld[code]),
+                "local_income_tax_withheld_total":
+                    str(self.local_tax_withheld[code]),
+                "combined_federal_state_code": f"{code:0>2}"
+            }
+            for total, amount_code in zip(self.totals[code], AMOUNT_CODES):
+                record["payment_amount_" + amount_code] = str(total)
+            records.append(record)
+        return records
+
+def payee_amounts(payee):
+    """
+    Returns the payment amounts of a (transformed) payee record as integers,
+    in the order of AMOUNT_CODES. Amounts that are not numeric count as zero.
+
+    Parameters
+    ----------
+    payee : dict
+        Payee record, as returned by payees.xform().
+
+    Returns
+    ---------
+    list of int
+        Payment amounts.
+    """
+    amounts = []
+    for code in AMOUNT_CODES:
+        try:
+            amounts.append(int(payee["payment_amount_" + code]))
+        except ValueError:
+            amounts.append(0)
+    return amounts
+
 ########## Entity support functions ##########
 
 def xform_entity(entity_dict, data):
@@ -88,7 +356,8 @@ def xform_entity(entity_dict, data):
             data_dict[key] = default
     return data_dict
 
-def fire_entity(entity_dict, key_ordering, data, expected_length=750):
+def fire_entity(entity_dict, key_ordering, data, expected_length=750,
+                binary=False):
     """
     Applies transformation functions specified by the entity dictionary (first
     param) to the user-supplied data (second param). If no user data is
@@ -108,6 +377,14 @@ def fire_entity(entity_dict, key_ordering, data, expected_length=750):
         Data to be transformed and inserted into the returned dict.
         All keys in this dict are expected to be present in entity_dict.
 
+    binary: bool
+        If True, the record is returned as ASCII bytes. Field values may then
+        be str or bytes.
+
+    In either mode, non-ASCII characters in str values are transliterated
+    (see to_ascii) before the value is padded, and transliterated values are
+    cut to their field's length.
+
     Returns
     ----------
     dict
@@ -115,10 +392,17 @@ def fire_entity(entity_dict, key_ordering, data, expected_length=750):
         with transformed values from parameter "data" or defaults.
 
     """
-    record_string = ""
+    record_string = b"" if binary else ""
     for key in key_ordering:
         _, length, fill_char, _ = entity_dict[key]
-        new_string = data[key].ljust(length, fill_char)
+        if binary:
+            new_string = to_ascii(data[key], length).ljust(
+                length, fill_char.encode("ascii"))
+        elif data[key].isascii():
+            new_string = data[key].ljust(length, fill_char)
+        else:
+            new_string = to_ascii(data[key], length).decode("ascii").ljust(
+                length, fill_char)
         record_string += new_string
         if len(new_string) != length:
             raise Exception(f"Generated a record string of incorrect length: \
@@ -129,6 +413,162 @@ def fire_entity(entity_dict, key_ordering, data, expected_length=750):
                     {len(record_string)}")
     return record_string
 
+def compile_fire_entity(entity_dict, key_ordering, expected_length=750,
+                        binary=False):
+    """
+    Returns a function equivalent to fire_entity() for the given entity
+    layout, with the per-record work reduced to padding and joining field
+    values. Field lengths and fill characters are looked up once, here,
+    rather than for every record, and the layout's total length is checked
+    up front.
+
+    Records with a field value longer than its field, or with non-ASCII
+    characters, are handed to fire_entity(), so that errors are reported and
+    values transliterated exactly as before.
+
+    Binary encoders join the record as a str and encode it with a single
+    ASCII encode. Only records that contain bytes values or non-ASCII
+    characters are padded field by field (after transliteration, which may
+    change a value's length), so byte offsets always match the layout.
+
+    Parameters
+    ----------
+    entity_dict: dict
+        Dictionary containing all fields required for the type of record
+        in question (see fire_entity).
+
+    key_ordering: list of str
+        Keys of entity_dict, in the order the fields appear in the record.
+
+    expected_length: int
+        Length of the generated record string.
+
+    binary: bool
+        If True, the returned function returns the record as ASCII bytes
+        (see fire_entity).
+
+    Returns
+    ----------
+    function
+        Function taking a transformed record (dict) and returning the record
+        as a string formatted to IRS Publication 1220.
+
+    """
+    fields = tuple((key, entity_dict[key][1], entity_dict[key][2])
+                   for key in key_ordering)
+    layout_length = sum(length for _, length, _ in fields)
+    if layout_length != expected_length:
+        raise Exception(f"Layout length does not match record length: \
+                    Expected: {expected_length} -- Actual: {layout_length}")
+
+    def fire_compiled(data):
+        record_string = "".join([data[key].ljust(length, fill_char)
+                                 for key, length, fill_char in fields])
+        if len(record_string) != expected_length or \
+           not record_string.isascii():
+            return fire_entity(entity_dict, key_ordering, data,
+                               expected_length)
+        return record_string
+
+    if not binary:
+        return fire_compiled
+
+    byte_fields = tuple((key, length, fill_char.encode("ascii"))
+                        for key, length, fill_char in fields)
+
+    def fire_compiled_bytes(data):
+        try:
+            record = fire_compiled(data).encode("ascii")
+            if len(record) == expected_length:
+                return record
+        except (TypeError, UnicodeEncodeError):
+            pass
+        record = b"".join([to_ascii(data[key], length).ljust(length,
+                                                             fill_byte)
+                           for key, length, fill_byte in byte_fields])
+        if len(record) != expected_length:
+            return fire_entity(entity_dict, key_ordering, data,
+                               expected_length, binary=True)
+        return record
+
+    return fire_compiled_bytes
+
+def parse_entity(entity_dict, key_ordering, record):
+    """
+    Splits a FIRE-formatted record back into its fields: the inverse of
+    fire_entity(), up to the fill characters padding each field, which are
+    removed. Digit fill characters are kept, as they cannot be told apart
+    from the value of a numeric field.
+
+    Parameters
+    ----------
+    entity_dict: dict
+        Dictionary containing all fields required for the type of record
+        in question (see fire_entity).
+
+    key_ordering: list of str
+        Keys of entity_dict, in the order the fields appear in the record.
+
+    record: str or bytes
+        FIRE-formatted record. bytes are decoded as ASCII.
+
+    Returns
+    ----------
+    dict
+        Field values (str), keyed by field name.
+
+    """
+    if isinstance(record, (bytes, bytearray)):
+        record = record.decode("ascii")
+    fields = {}
+    start = 0
+    for key in key_ordering:
+        _, length, fill_char, _ = entity_dict[key]
+        value = record[start:start + length]
+        fields[key] = value if fill_char.isdigit() else value.rstrip(fill_char)
+        start += length
+    return fields
+
+def compile_parse_entity(entity_dict, key_ordering):
+    """
+    Returns a function equivalent to parse_entity() for the given entity
+    layout, with field offsets and fill characters computed once, here,
+    rather than for every record.
+
+    Parameters
+    ----------
+    entity_dict: dict
+        Dictionary containing all fields required for the type of record
+        in question (see fire_entity).
+
+    key_ordering: list of str
+        Keys of entity_dict, in the order the fields appear in the record.
+
+    Returns
+    ----------
+    function
+        Function taking a FIRE-formatted record (str or bytes) and returning
+        its field values (dict).
+
+    """
+    fields = []
+    start = 0
+    for key in key_ordering:
+        _, length, fill_char, _ = entity_dict[key]
+        fields.append((key, start, start + length,
+                       None if fill_char.isdigit() else fill_char))
+        start += length
+    fields = tuple(fields)
+
+    def parse_compiled(record):
+        if isinstance(record, (bytes, bytearray)):
+            record = record.decode("ascii")
+        return {key: record[start:end] if fill_char is None
+                     else record[start:end].rstrip(fill_char)
+                for key, start, end, fill_char in fields}
+
+    return parse_compiled
+
 """
 Transformations on user-supplied data
 -------------------------------------
@@ -137,28 +577,89 @@ formatting requirements according to IRS Pub 1220. For example, most text
 fields are required to contain uppercase characters. 
 
 The functions below facilitate transformations that are similar across 
-different fields and entities.
+different fields and entities. They accept str, bytes or bytearray values, and
+return values of the same kind. ASCII values are handled with precomputed
+translate tables rather than regular expressions.
 """
 
+_NON_DIGIT_BYTES = bytes(b for b in range(256) if not 0x30 <= b <= 0x39)
+_UPPERCASE_TABLE = bytes.maketrans(b"abcdefghijklmnopqrstuvwxyz",
+                                   b"ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+# Latin letters that do not decompose into an ASCII letter, and typographic
+# punctuation, with their closest ASCII equivalent
+_TRANSLITERATION_EXTRAS = {
+    "Æ": "AE", "æ": "ae", "Ð": "D", "ð": "d", "Ø": "O", "ø": "o",
+    "Þ": "TH", "þ": "th", "ß": "ss", "Đ": "D", "đ": "d", "Ħ": "H",
+    "ħ": "h", "ı": "i", "Ł": "L", "ł": "l", "Œ": "OE", "œ": "oe",
+    "‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-"
+}
+
 
 def digits_only(value):
     """
     Removes all non-digit characters
     """
-    return re.sub("[^0-9]*", "", value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.translate(None, _NON_DIGIT_BYTES)
+    try:
+        return value.encode("ascii").translate(
+            None, _NON_DIGIT_BYTES).decode("ascii")
+    except UnicodeEncodeError:
+        return re.sub("[^0-9]*", "", value)
 
 def uppercase(value):
     """
     Returns the string with all alpha characters in uppercase
     """
+    if isinstance(value, (bytes, bytearray)):
+        return value.translate(_UPPERCASE_TABLE)
     return value.upper()
 
 def rjust_zero(value, length):
     """
     right-justifies *value* and pads with zeros to *length*
     """
+    if isinstance(value, (bytes, bytearray)):
+        return digits_only(value).rjust(length, b"0")
     return f"{digits_only(value):0>{length}}"
 
+@metrics.cached("transliteration")
+@lru_cache(maxsize=None)
+def transliteration_table():
+    """
+    Returns a str.translate table mapping the Latin-1 Supplement and Latin
+    Extended-A/B characters to ASCII: accented letters lose their accents,
+    and the letters and punctuation in _TRANSLITERATION_EXTRAS are spelled
+    out. Characters without an ASCII equivalent are removed. Built on first
+    use.
+    """
+    table = {}
+    for codepoint in range(0x80, 0x250):
+        decomposed = unicodedata.normalize("NFKD", chr(codepoint))
+        table[codepoint] = decomposed.encode("ascii", "ignore").decode("ascii")
+    for char, replacement in _TRANSLITERATION_EXTRAS.items():
+        table[ord(char)] = replacement
+    return table
+
+def to_ascii(value, length=None):
+    """
+    Returns *value* as ASCII bytes, transliterating non-ASCII characters (see
+    transliteration_table) and dropping those that cannot be transliterated.
+    Bytes values are returned unchanged.
+
+    Transliteration may spell one character out as two (e.g. Æ as AE), so a
+    value that fits its field may no longer fit once transliterated. If
+    *length* is given, transliterated values are cut to *length* characters.
+    ASCII values are never cut.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    try:
+        return value.encode("ascii")
+    except UnicodeEncodeError:
+        return value.translate(transliteration_table()).encode(
+            "ascii", "ignore")[:length]
+
 def factor_transforms(transforms):
     """
     Factor a list of transform tuples into a list of sort keys and a dict of
@@ -0,0 +1,256 @@
+"""
+Module: Watch
+Keeps an output file up to date with an input file that is being edited.
+
+The input file is polled for changes. On each change, its payees are compared
+with those of the previous version by content hash: only payees that were not
+present before are validated, transformed and rendered, and payer, state and
+transmitter totals are adjusted by the payees added and removed, rather than
+recomputed.
+
+Records are fixed-width, so if the number of payees is unchanged the output
+file is patched in place: changed payee records are overwritten at their
+offsets, followed by the transmitter, payer and trailing records. Otherwise
+(if the output file is compressed, or was modified by someone else), the
+file is rewritten from the rendered records held in memory, through the
+usual partial file and rename.
+"""
+import os
+import json
+import time
+import hashlib
+from collections import Counter
+
+from fire.entities import transmitter, payer, payees, end_of_payer, \
+                          state_totals, end_of_transmission
+from . import translator
+from .reject import validate_header, payee_errors
+from .util import PayerTotals, StateTotals
+from .writer import summary_records, write_records
+from .compression import compression_for_path
+
+RECORD_LENGTH = 750
+# Position of the record sequence number, which is the same in all records
+SEQUENCE_START = 499
+SEQUENCE_END = 507
+# Default number of seconds between checks for changes
+DEFAULT_INTERVAL = 1.0
+
+
+def payee_hash(payee):
+    """
+    Returns the content hash of a (user-supplied) payee: the SHA-256 digest
+    of its canonical JSON serialization.
+
+    Parameters
+    ----------
+    payee : dict
+        user-supplied payee data
+
+    Returns
+    ----------
+    bytes
+        Content hash.
+    """
+    return hashlib.sha256(json.dumps(
+        payee, sort_keys=True, separators=(",", ":")).encode("utf-8")).digest()
+
+
+def _numbered(record, sequence_number):
+    return b"".join([record[:SEQUENCE_START],
+                     f"{sequence_number:0>8}".encode("ascii"),
+                     record[SEQUENCE_END:]])
+
+
+class WatchSession:
+    """
+    Holds the transformed and rendered payees of the last version of the
+    input written to the output file, along with their totals, so that the
+    next version can be written by rendering only what changed.
+
+    Attributes
+    ----------
+    self.hashes : list of bytes
+        Content hashes of the payees in the output file, in order.
+
+    self.totals : PayerTotals
+        Totals of the payees in the output file.
+
+    self.states : StateTotals
+        Per-state totals of the payees in the output file.
+
+    Methods
+    ----------
+    update(user_data):
+        Brings the output file up to date with new user data.
+    """
+    def __init__(self, output_path, type="MISC"):
+        self.output_path = output_path
+        self.schema_path = translator.get_schema_path(type)
+        self.validator = translator.load_validator(self.schema_path)
+        self.hashes = []
+        self.totals = PayerTotals()
+        self.states = StateTotals()
+        self._payees = {}
+        self._size = None
+
+    def update(self, user_data):
+        """
+        Validates, transforms and renders the payees of user_data that are
+        not in the output file yet, and writes the new version of the
+        output. If the transmitter or payer records are invalid, a
+        ValidationError is raised; if any new payee is invalid, the output
+        is left unchanged and the errors are returned.
+
+        Parameters
+        ----------
+        user_data : dict
+            user input data, as returned by translator.extract_user_data()
+
+        Returns
+        ----------
+        dict
+            Summary of the update: payees (in the new version), changed
+            (payee records written), rendered (payees transformed and
+            rendered) and patched (whether the file was patched in place),
+            or errors (invalid payees, by input index).
+        """
+        validate_header(user_data, self.schema_path)
+        payee_list = user_data["payees"]
+        hashes = [payee_hash(payee) for payee in payee_list]
+
+        rendered = {}
+        errors = []
+        for index, (digest, payee) in enumerate(zip(hashes, payee_list)):
+            if digest in self._payees or digest in rendered:
+                continue
+            payee_errors_found = payee_errors(self.validator, payee)
+            if payee_errors_found:
+                errors.append({"index": index, "errors": payee_errors_found})
+                continue
+            record = payees.xform([payee])[0]
+            rendered[digest] = (record, payees.fire_bytes([record]))
+        if errors:
+            return {"errors": errors}
+
+        old_counts = Counter(self.hashes)
+        new_counts = Counter(hashes)
+        self._payees.update(rendered)
+        for digest, count in (old_counts - new_counts).items():
+            record = self._payees[digest][0]
+            for _ in range(count):
+                self.states.remove(record, self.totals.remove(record))
+            if digest not in new_counts:
+                del self._payees[digest]
+        for digest, count in (new_counts - old_counts).items():
+            record = self._payees[digest][0]
+            for _ in range(count):
+                self.states.add(record, self.totals.add(record))
+
+        payer_data = payer.xform(user_data["payer"])
+        records = summary_records(
+            transmitter.xform(user_data["transmitter"]), payer_data,
+            self.totals,
+            self.states if payer_data["combined_fed_state"] == "1" else None)
+        changed = [i for i, digest in enumerate(hashes)
+                   if i >= len(self.hashes) or self.hashes[i] != digest]
+
+        patched = len(hashes) == len(self.hashes) and \
+            compression_for_path(self.output_path) is None and \
+            self._size is not None and \
+            os.path.isfile(self.output_path) and \
+            os.path.getsize(self.output_path) == self._size
+        if patched:
+            self._patch(hashes, changed, records)
+        else:
+            write_records(self._iter_records(hashes, records),
+                          self.output_path)
+        self._size = os.path.getsize(self.output_path)
+        self.hashes = hashes
+        return {"payees": len(hashes), "changed": len(changed),
+                "rendered": len(rendered), "patched": patched}
+
+    def _payee_record(self, hashes, index):
+        return _numbered(self._payees[hashes[index]][1], index + 3)
+
+    def _iter_records(self, hashes, records):
+        yield transmitter.fire_bytes(records["transmitter"])
+        yield payer.fire_bytes(records["payer"])
+        for index in range(len(hashes)):
+            yield self._payee_record(hashes, index)
+        yield from _iter_trailer(records)
+
+    def _patch(self, hashes, changed, records):
+        with open(self.output_path, mode="r+b") as file:
+            for index in changed:
+                file.seek((2 + index) * RECORD_LENGTH)
+                file.write(self._payee_record(hashes, index))
+            file.seek(0)
+            file.write(transmitter.fire_bytes(records["transmitter"]))
+            file.write(payer.fire_bytes(records["payer"]))
+            file.seek((2 + len(hashes)) * RECORD_LENGTH)
+            for record in _iter_trailer(records):
+                file.write(record)
+            file.truncate()
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def _iter_trailer(records):
+    yield end_of_payer.fire_bytes(records["end_of_payer"])
+    yield state_totals.fire_bytes(records["state_totals"])
+    yield end_of_transmission.fire_bytes(records["end_of_transmission"])
+
+
+def watch(input_path, output_path, type="MISC", interval=DEFAULT_INTERVAL,
+          callback=None, stop=None):
+    """
+    Writes the output file for input_path, then polls input_path every
+    interval seconds and updates the output file whenever the input
+    changes (see WatchSession). Runs until stop is set, or forever if no
+    stop event is given.
+
+    Parameters
+    ----------
+    input_path : str
+        system path for file containing the user input JSON data
+
+    output_path : str
+        system path for the output to be kept up to date
+
+    type : str
+        form type of the input data, either "MISC" (default) or "NEC"
+
+    interval : float
+        number of seconds between checks for changes
+
+    callback : function
+        optional function called with the summary of each update (see
+        WatchSession.update), or with {"error": message} if the input
+        could not be read or its transmitter or payer is invalid.
+
+    stop : threading.Event
+        optional event that ends the watch when set
+    """
+    session = WatchSession(output_path, type)
+    last_signature = None
+    while stop is None or not stop.is_set():
+        try:
+            stat = os.stat(input_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            # Editors may briefly remove the file while saving it
+            signature = None
+        if signature is not None and signature != last_signature:
+            last_signature = signature
+            try:
+                result = session.update(
+                    translator.extract_user_data(input_path))
+            except Exception as error: # pylint: disable=broad-except
+                result = {"error": f"{error.__class__.__name__}: {error}"}
+            if callback is not None:
+                callback(result)
+        if stop is None:
+            time.sleep(interval)
+        else:
+            stop.wait(interval)
@@ -0,0 +1,591 @@
+"""
+Module: Writer
+Crash-safe output of FIRE-formatted files.
+
+Output is never written directly to the destination path. Records are written
+to a partial file next to the destination, which is flushed, fsync'd and
+renamed into place once complete, so that the destination either holds a full
+file or nothing at all. If writing fails, the partial file is removed (except
+for checkpointed writes, which resume from it). Files are written in binary mode, so that offsets in
+the file are exact byte offsets; str data is written UTF-8 encoded, and FIRE
+records are rendered directly to ASCII bytes (see the entities' fire_bytes).
+
+Long runs can additionally be checkpointed: every N payees, the position in
+the partial file, the last record sequence number written and the running
+payer totals are recorded in a checkpoint file. A restarted run with the same
+input and output path truncates the partial file back to the last checkpoint
+and continues from the next payee, instead of starting over.
+
+Payees can also be streamed through a RecordWriter, which computes the payer
+and transmitter totals in the same pass as it writes the payee records, and
+fills in the transmitter and payer records (whose positions are fixed) once
+all payees have been written.
+
+Destinations ending in .gz, .xz or .bz2 are written compressed. An archival
+copy (compressed according to its own extension) can be written alongside
+the destination, from the same records.
+"""
+import os
+import json
+import tempfile
+
+from fire.entities import transmitter, payer, payees, end_of_payer, \
+                          state_totals, end_of_transmission
+from .util import PayerTotals, StateTotals, SequenceGenerator
+from .compression import compression_for_path, compress_stream
+from . import metrics
+
+PARTIAL_SUFFIX = ".part"
+# Size of the blocks copied from a spooled RecordWriter file
+COPY_BLOCK_SIZE = 1024 * 1024
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+def fsync_directory(path):
+    """
+    Flushes the directory entry for the given path to disk, so that a
+    preceding rename survives a crash. Not supported on all platforms; errors
+    are ignored.
+
+    Parameters
+    ----------
+    path : str
+        Path of a file whose parent directory should be synced.
+    """
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def replace_file(temp_path, path):
+    """
+    Atomically moves temp_path over path, and syncs the parent directory.
+
+    Parameters
+    ----------
+    temp_path : str
+        Path of a fully written and fsync'd file.
+
+    path : str
+        Destination path.
+    """
+    if metrics.registry() is not None:
+        metrics.count("bytes_written", os.path.getsize(temp_path))
+    os.replace(temp_path, path)
+    fsync_directory(path)
+
+
+def _as_bytes(value):
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    return value
+
+
+def write_atomic(formatted_string, path, archive_path=None):
+    """
+    Writes the given string to a partial file next to path, fsyncs it, and
+    renames it to path. Readers of path never observe a truncated file.
+
+    Parameters
+    ----------
+    formatted_string : str or bytes
+        String to be written to disk. str is written UTF-8 encoded.
+
+    path : str
+        Path of file to be written. Compressed if it ends in .gz, .xz or
+        .bz2.
+
+    archive_path : str
+        optional path of an archival copy (see write_records).
+    """
+    write_records((formatted_string,), path, archive_path)
+
+
+class _Sink:
+    """
+    Partial file for one destination of write_records() (and of
+    aio.write_1099_file()), compressed according to the destination's
+    extension.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = path + PARTIAL_SUFFIX
+        self.file = open(self.temp_path, mode="wb+")
+        self.stream = compress_stream(self.file, compression_for_path(path))
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def commit(self):
+        if self.stream is not self.file:
+            self.stream.close()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        replace_file(self.temp_path, self.path)
+
+    def discard(self):
+        try:
+            if self.stream is not self.file:
+                self.stream.close()
+            self.file.close()
+        finally:
+            _remove_partial(self.temp_path)
+
+
+def _remove_partial(temp_path):
+    if os.path.isfile(temp_path):
+        os.remove(temp_path)
+
+
+def write_records(records, path, archive_path=None):
+    """
+    Writes each string in records to a partial file next to path as it is
+    produced, then fsyncs the file and renames it to path. Like
+    write_atomic(), but without holding the whole output in memory.
+
+    Parameters
+    ----------
+    records : iterable of str or bytes
+        Records to be written, in order. str is written UTF-8 encoded.
+
+    path : str
+        Path of file to be written. Compressed if it ends in .gz, .xz or
+        .bz2.
+
+    archive_path : str
+        optional path of an archival copy of the same records, written in
+        the same pass. Compressed according to its own extension.
+
+    Returns
+    ----------
+    int
+        Number of records written.
+    """
+    sinks = [_Sink(path)]
+    try:
+        if archive_path is not None:
+            sinks.append(_Sink(archive_path))
+        count = 0
+        for record in records:
+            record = _as_bytes(record)
+            for sink in sinks:
+                sink.write(record)
+            count += 1
+        for sink in sinks:
+            sink.commit()
+    except BaseException:
+        for sink in sinks:
+            sink.discard()
+        raise
+    return count
+
+
+def read_checkpoint(path, fingerprint):
+    """
+    Returns the checkpoint saved for the output file at path, or None if there
+    is no usable checkpoint. A checkpoint is only usable if it was written for
+    the same input (as identified by fingerprint) and the partial file it
+    refers to still exists.
+
+    Parameters
+    ----------
+    path : str
+        Path of the output file being generated.
+
+    fingerprint : str
+        Identifier of the input being processed.
+
+    Returns
+    ----------
+    dict or None
+        Checkpoint data, as written by save_checkpoint().
+    """
+    checkpoint_path = path + CHECKPOINT_SUFFIX
+    if not os.path.isfile(checkpoint_path) or \
+       not os.path.isfile(path + PARTIAL_SUFFIX):
+        return None
+    try:
+        with open(checkpoint_path, mode="r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+    except ValueError:
+        return None
+    if checkpoint.get("fingerprint") != fingerprint:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """
+    Atomically writes checkpoint data for the output file at path.
+
+    Parameters
+    ----------
+    path : str
+        Path of the output file being generated.
+
+    checkpoint : dict
+        JSON-serializable checkpoint data.
+    """
+    checkpoint_path = path + CHECKPOINT_SUFFIX
+    temp_path = checkpoint_path + PARTIAL_SUFFIX
+    with open(temp_path, mode="w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    replace_file(temp_path, checkpoint_path)
+
+
+def write_checkpointed(data, path, checkpoint_interval, fingerprint=""):
+    """
+    Writes the records in data to path, one record at a time, saving a
+    checkpoint every checkpoint_interval payees. If a checkpoint for the same
+    fingerprint is found, writing resumes after the last checkpointed payee.
+    data must still hold every payee, including those already written.
+
+    The output is only moved to path once the end of transmission record has
+    been written and flushed to disk; the checkpoint is then removed.
+
+    Parameters
+    ----------
+    data : dict
+        Master set of records, with generated values already inserted (see
+        translator.insert_generated_values).
+
+    path : str
+        Path of file to be written.
+
+    checkpoint_interval : int
+        Number of payees to write between checkpoints.
+
+    fingerprint : str
+        Identifier of the input being processed, used to reject checkpoints
+        left behind by a different input.
+    """
+    if compression_for_path(path) is not None:
+        raise Exception(f"Checkpointed output cannot be compressed: {path}")
+    temp_path = path + PARTIAL_SUFFIX
+    checkpoint = read_checkpoint(path, fingerprint)
+
+    if checkpoint is None:
+        start = 0
+        totals = PayerTotals()
+        file = open(temp_path, mode="wb+")
+        file.write(transmitter.fire_bytes(data["transmitter"]))
+        file.write(payer.fire_bytes(data["payer"]))
+    else:
+        start = checkpoint["payees_written"]
+        totals = PayerTotals.from_dict(checkpoint["totals"])
+        file = open(temp_path, mode="rb+")
+        file.seek(checkpoint["offset"])
+        file.truncate()
+
+    with file:
+        for i in range(start, len(data["payees"])):
+            payee = data["payees"][i]
+            file.write(payees.fire_bytes([payee]))
+            totals.add(payee)
+            if (i + 1) % checkpoint_interval == 0:
+                file.flush()
+                os.fsync(file.fileno())
+                save_checkpoint(path, {
+                    "fingerprint": fingerprint,
+                    "payees_written": i + 1,
+                    "record_sequence_number": payee["record_sequence_number"],
+                    "offset": file.tell(),
+                    "totals": totals.to_dict()
+                })
+
+        if totals.payee_count != len(data["payees"]):
+            raise Exception(f"Checkpointed payee count does not match input: \
+                    Expected: {len(data['payees'])} \
+                    -- Actual: {totals.payee_count}")
+        file.write(end_of_payer.fire_bytes(data["end_of_payer"]))
+        file.write(state_totals.fire_bytes(data.get("state_totals", [])))
+        file.write(end_of_transmission.fire_bytes(data["end_of_transmission"]))
+        file.flush()
+        os.fsync(file.fileno())
+
+    replace_file(temp_path, path)
+    if os.path.isfile(path + CHECKPOINT_SUFFIX):
+        os.remove(path + CHECKPOINT_SUFFIX)
+
+
+class RecordWriter:
+    """
+    Streams the records of a transmission to a seekable binary file, one
+    payee at a time. Space for the transmitter and payer records is reserved
+    when the writer is created; payee records are numbered, totalled and
+    written as they are supplied, and finish() writes the end of payer, state
+    totals and end of transmission records before going back to fill in the
+    transmitter and payer records with the final totals.
+
+    Attributes
+    ----------
+    self.totals : PayerTotals
+        Running totals of the payees written so far.
+
+    self.states : StateTotals
+        Running per-state totals, if the payer participates in the Combined
+        Federal/State Filing Program; otherwise None.
+
+    self.report : SummaryReport
+        Optional summary report, accumulated along with the totals (see the
+        report module).
+
+    Methods
+    ----------
+    write_payee(payee):
+        Numbers, totals and writes a transformed payee record.
+
+    write_block(records, count, amounts):
+        Writes a run of payee records rendered and totalled by the caller.
+
+    finish():
+        Writes the trailing records and fills in the leading records.
+    """
+    def __init__(self, file, transmitter_data, payer_data, report=None):
+        self.file = file
+        self.transmitter = transmitter_data
+        self.payer = payer_data
+        self.report = report
+        self.totals = PayerTotals()
+        self.states = StateTotals() \
+            if payer_data["combined_fed_state"] == "1" else None
+        self.seq = SequenceGenerator()
+        self.seq.counter = 2
+        self._start = file.tell()
+        file.write(b"\x00" * 1500)
+
+    def write_payee(self, payee):
+        """
+        Numbers, totals and writes a single payee record. _Note: this inserts
+        the record sequence number into the payee in-place._
+
+        Parameters
+        ----------
+        payee : dict
+            Payee record, as returned by payees.xform().
+
+        Returns
+        ----------
+        bytes
+            The FIRE-formatted payee record.
+        """
+        payee["record_sequence_number"] = self.seq.get_next()
+        amounts = self.totals.add(payee)
+        if self.states is not None:
+            self.states.add(payee, amounts)
+        if self.report is not None:
+            self.report.add(payee, amounts)
+        record = payees.fire_bytes([payee])
+        self.file.write(record)
+        return record
+
+    def write_block(self, records, count, amounts):
+        """
+        Writes a run of payee records that were rendered elsewhere (see the
+        columnar module), numbered from self.seq.get_current() + 1, and adds
+        their totals. Per-state totals and the summary report are left to
+        the caller.
+
+        Parameters
+        ----------
+        records : bytes-like
+            FIRE-formatted payee records, concatenated.
+
+        count : int
+            Number of records in the run.
+
+        amounts : list of int
+            Payment totals of the run, in the order of AMOUNT_CODES.
+        """
+        self.seq.counter += count
+        self.totals.payee_count += count
+        totals = self.totals.totals
+        for i, amount in enumerate(amounts):
+            totals[i] += amount
+        self.file.write(records)
+
+    def finish(self):
+        """
+        Writes the end of payer, state totals and end of transmission records,
+        then the transmitter and payer records, at the positions reserved for
+        them. The file position is left at the end of the transmission.
+
+        Returns
+        ----------
+        dict
+            The records written, keyed as in the master schema (without
+            payees).
+        """
+        records = summary_records(self.transmitter, self.payer, self.totals,
+                                  self.states)
+        self.file.write(end_of_payer.fire_bytes(records["end_of_payer"]))
+        self.file.write(state_totals.fire_bytes(records["state_totals"]))
+        self.file.write(
+            end_of_transmission.fire_bytes(records["end_of_transmission"]))
+        end = self.file.tell()
+        self.file.seek(self._start)
+        self.file.write(transmitter.fire_bytes(self.transmitter))
+        self.file.write(payer.fire_bytes(self.payer))
+        self.file.seek(end)
+        return records
+
+
+def summary_records(transmitter_data, payer_data, totals, states=None):
+    """
+    Inserts the totals of a set of payees into the transmitter and payer
+    records, and returns them along with the end of payer, state totals and
+    end of transmission records, numbered to follow totals.payee_count payee
+    records. _Note: this edits transmitter_data and payer_data in-place._
+
+    Parameters
+    ----------
+    transmitter_data : dict
+        Transformed transmitter record.
+
+    payer_data : dict
+        Transformed payer record.
+
+    totals : PayerTotals
+        Totals of the payees.
+
+    states : StateTotals
+        Per-state totals of the payees, or None if the payer does not
+        participate in the Combined Federal/State Filing Program.
+
+    Returns
+    ----------
+    dict
+        The records, keyed as in the master schema (without payees).
+    """
+    seq = SequenceGenerator()
+    seq.counter = totals.payee_count + 2
+    end_of_payer_data = end_of_payer.xform({})
+    totals.insert(payer_data, end_of_payer_data)
+    end_of_payer_data["record_sequence_number"] = seq.get_next()
+    state_data = state_totals.xform(
+        states.records() if states is not None else [])
+    for state in state_data:
+        state["record_sequence_number"] = seq.get_next()
+
+    payee_count = f"{totals.payee_count:0>8}"
+    end_of_transmission_data = end_of_transmission.xform({})
+    end_of_transmission_data["total_number_of_payees"] = payee_count
+    end_of_transmission_data["number_of_a_records"] = "00000001"
+    end_of_transmission_data["record_sequence_number"] = seq.get_next()
+    transmitter_data["total_number_of_payees"] = payee_count
+    transmitter_data["record_sequence_number"] = "00000001"
+    payer_data["record_sequence_number"] = "00000002"
+    return {
+        "transmitter": transmitter_data,
+        "payer": payer_data,
+        "end_of_payer": end_of_payer_data,
+        "state_totals": state_data,
+        "end_of_transmission": end_of_transmission_data
+    }
+
+
+def write_stream(transmitter_data, payer_data, payee_records, path,
+                 archive_path=None, report=None):
+    """
+    Streams a transmission to path through a RecordWriter, using the same
+    partial file, fsync and rename scheme as write_atomic().
+
+    The RecordWriter fills in the leading records last, so compressed
+    output and archival copies cannot be written as the records are
+    produced. In that case, the transmission is spooled to an unnamed
+    temporary file next to path, and copied through write_records() once
+    complete.
+
+    Parameters
+    ----------
+    transmitter_data : dict
+        Transformed transmitter record.
+
+    payer_data : dict
+        Transformed payer record.
+
+    payee_records : iterable of dict
+        Transformed payee records, in the order they are to be written.
+
+    path : str
+        Path of file to be written. Compressed if it ends in .gz, .xz or
+        .bz2.
+
+    archive_path : str
+        optional path of an archival copy (see write_records).
+
+    report : SummaryReport
+        optional summary report to accumulate the payees into
+
+    Returns
+    ----------
+    int
+        Number of payees written.
+    """
+    def fill(file):
+        record_writer = RecordWriter(file, transmitter_data, payer_data,
+                                     report)
+        for payee in payee_records:
+            record_writer.write_payee(payee)
+        record_writer.finish()
+        return record_writer.totals.payee_count
+
+    return stream_records(fill, path, archive_path)
+
+
+def stream_records(fill, path, archive_path=None):
+    """
+    Calls fill with a seekable binary file to write a transmission to (in
+    practice, through a RecordWriter), then commits the file to path: the
+    partial file is fsync'd and renamed into place or, for compressed output
+    and archival copies, the spooled transmission is copied through
+    write_records() (see write_stream).
+
+    Parameters
+    ----------
+    fill : function
+        Function taking the binary file to write to, and returning a value
+        passed on to the caller.
+
+    path : str
+        Path of file to be written. Compressed if it ends in .gz, .xz or
+        .bz2.
+
+    archive_path : str
+        optional path of an archival copy (see write_records).
+
+    Returns
+    ----------
+    object
+        The value returned by fill.
+    """
+    if archive_path is not None or compression_for_path(path) is not None:
+        with tempfile.TemporaryFile(
+                dir=os.path.dirname(os.path.abspath(path))) as file:
+            result = fill(file)
+            file.seek(0)
+            write_records(iter(lambda: file.read(COPY_BLOCK_SIZE), b""),
+                          path, archive_path)
+        return result
+
+    temp_path = path + PARTIAL_SUFFIX
+    try:
+        with open(temp_path, mode="wb+") as file:
+            result = fill(file)
+            file.flush()
+            os.fsync(file.fileno())
+        replace_file(temp_path, path)
+    except BaseException:
+        _remove_partial(temp_path)
+        raise
+    return result
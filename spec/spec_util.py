@@ -2,9 +2,11 @@
 Utility functions used in test specs.
 """
 
-# pylint: disable=missing-docstring
+# pylint: disable=missing-docstring, protected-access
 
+import os
 import json
+import string
 
 from copy import deepcopy
 
@@ -13,6 +15,9 @@ import jsonschema
 from jsonschema import validate
 from nose.tools import raises
 
+from fire.entities import transmitter, payer, payees
+from fire.translator import translator
+
 SCHEMA = json.load(open("./fire/schema/base_schema.json"))
 VALID_ALL_PATH = "./spec/data/valid_all.json"
 INVALID_PHONE_NUMS = ["+1 555 666 7777", "555 A44 B777", "123ABC5678",
@@ -70,6 +75,14 @@ END_OF_PAYER_BLANK_MAP = [
     (508, 750)
 ]
 
+STATE_TOTALS_BLANK_MAP = [
+    (10, 15),
+    (340, 499),
+    (508, 706),
+    (743, 746),
+    (749, 750)
+]
+
 END_OF_TRANSMISSION_BLANK_MAP = [
     (10, 15),
     (304, 499),
@@ -172,3 +185,136 @@ def check_valid_amount(dict_obj, path, dollar_amount):
 def check_invalid_amount(dict_obj, path, dollar_amount):
     temp_obj = dive_to_path(dict_obj, path, dollar_amount)
     validate(temp_obj, SCHEMA)
+
+
+"""
+Random user data for differential and round-trip tests, generated from
+the input schema and the entity _ITEMS tables
+"""
+FUZZ_SEED = int(os.environ.get("FIRE_FUZZ_SEED", "1220"))
+MAX_PAYEES = 12
+
+with open(translator.get_schema_path("MISC"), mode="r",
+          encoding="utf-8") as schema_file:
+    MISC_SCHEMA = json.load(schema_file)
+
+# Text alphabet: ASCII letters, digits and punctuation, plus non-ASCII
+# letters that transliterate to a single ASCII character, so that generated
+# values never outgrow their fields
+TEXT_CHARS = string.ascii_letters + string.digits + " &-.,'#/" + "éÉñÑüÜçÅøØ"
+
+
+def _text(rng, max_length, min_length=0):
+    length = rng.choice([min_length, max_length,
+                         rng.randint(min_length, max_length)])
+    return "".join(rng.choice(TEXT_CHARS) for _ in range(length))
+
+def _digits(rng, length):
+    return "".join(rng.choice(string.digits) for _ in range(length))
+
+def _tin(rng):
+    if rng.random() < 0.5:
+        return _digits(rng, 2) + rng.choice(["", " ", "-"]) + _digits(rng, 7)
+    sep = rng.choice(["", " ", "-"])
+    return _digits(rng, 3) + sep + _digits(rng, 2) + sep + _digits(rng, 4)
+
+def _dollar_amount(rng):
+    cents = rng.choice([0, 1, 99, 100, 10**11 - 1,
+                        rng.randrange(10**rng.randint(1, 11))])
+    dollars, cents = divmod(cents, 100)
+    style = rng.randrange(4)
+    if style == 0:
+        return f"{dollars}{cents:02}"
+    if style == 1:
+        return f"{dollars}.{cents:02}"
+    if style == 2:
+        return f"${dollars:,}.{cents:02}"
+    return f"{'' if dollars == 0 else dollars}.{cents:02}"
+
+def _zip_code(rng):
+    return _digits(rng, 5) + rng.choice(["", "-" + _digits(rng, 4)])
+
+def _phone(rng):
+    area = _digits(rng, 3)
+    if rng.random() < 0.5:
+        area = f"({area})"
+    sep = rng.choice(["", " ", ".", "-"])
+    return area + sep + _digits(rng, 3) + sep + _digits(rng, 4)
+
+def _email(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in
+                   range(rng.randint(1, 20))) + "@example.com"
+
+DEFINITION_GENERATORS = {
+    "tin": _tin,
+    "state": lambda rng: rng.choice(["CA", "ny", "Tx", "GA"]),
+    "zip_code": _zip_code,
+    "email": _email,
+    "address": lambda rng: _text(rng, 40),
+    "city": lambda rng: _text(rng, 40),
+    "phone": _phone,
+    "year": lambda rng: str(rng.randint(2000, 2030)),
+    "generic_name": lambda rng: _text(rng, 40),
+    "name_control": lambda rng: _text(rng, 4, 4),
+    "dollar_amount": _dollar_amount,
+    "foreign_entity": lambda rng: rng.choice(["", "1"]),
+    "transmitter_control_code": lambda rng: "".join(
+        rng.choice(string.ascii_letters + string.digits) for _ in range(5))
+}
+
+# Fields with a pattern that is not a schema definition
+FIELD_GENERATORS = {
+    "combined_fed_state": lambda rng: rng.choice(["", "1"]),
+    "last_filing_indicator": lambda rng: rng.choice(["", "1"]),
+    "combined_federal_state_code": lambda rng: rng.choice(
+        ["", "06", "13", "6", "34", _text(rng, 2)])
+}
+
+# Fields generated by the translator, which user data should not set
+GENERATED_FIELDS = {"record_type", "record_sequence_number",
+                    "total_number_of_payees", "amount_codes"}
+
+
+def _generate_record(rng, properties, required, entity_dict):
+    record = {}
+    for field, field_schema in properties.items():
+        if field in GENERATED_FIELDS or \
+           (field not in required and rng.random() < 0.3):
+            continue
+        if field in FIELD_GENERATORS:
+            record[field] = FIELD_GENERATORS[field](rng)
+        elif "$ref" in field_schema:
+            definition = field_schema["$ref"].rsplit("/", 1)[-1]
+            record[field] = DEFINITION_GENERATORS[definition](rng)
+        else:
+            record[field] = _text(rng, field_schema.get("maxLength", 10))
+    # Fields in the record layout but not in the schema are accepted as-is.
+    # Payment amounts outside the schema are left out: with all 18 amount
+    # codes in use, the payer's amount codes would not fit their field.
+    for field, (_, length, _, _) in entity_dict.items():
+        if field not in properties and field not in GENERATED_FIELDS and \
+           not field.startswith(("blank", "payment_amount_")) and \
+           rng.random() < 0.2:
+            record[field] = _text(rng, length)
+    return record
+
+def generate_user_data(rng):
+    properties = MISC_SCHEMA["properties"]
+    payee_schema = properties["payees"]["items"]
+    data = {
+        "transmitter": _generate_record(
+            rng, properties["transmitter"]["properties"],
+            properties["transmitter"]["required"],
+            transmitter._TRANSMITTER_TRANSFORMS),
+        "payer": _generate_record(
+            rng, properties["payer"]["properties"],
+            properties["payer"]["required"], payer._PAYER_TRANSFORMS),
+        "payees": [
+            _generate_record(rng, payee_schema["properties"],
+                             payee_schema["required"],
+                             payees._PAYEE_TRANSFORMS)
+            for _ in range(rng.randint(0, MAX_PAYEES))]
+    }
+    if rng.random() < 0.5:
+        data["payer"]["combined_fed_state"] = "1"
+    return data
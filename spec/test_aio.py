@@ -0,0 +1,90 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import gzip
+import asyncio
+import tempfile
+
+from copy import deepcopy
+
+import jsonschema
+
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA, VALID_ALL_PATH
+from fire.translator import aio, translator, writer
+
+OUTPUT_FILE_PREFIX = "./spec/data/test_outfile_aio"
+
+
+def _expected_output():
+    master = translator.load_full_schema(deepcopy(VALID_ALL_DATA))
+    translator.insert_generated_values(master)
+    return translator.get_fire_format(master)
+
+def test_aio_run_matches_sync_output():
+    output_path = f"{OUTPUT_FILE_PREFIX}_run.ascii"
+    asyncio.run(aio.run(VALID_ALL_PATH, output_path, "MISC", chunk_size=1))
+    with open(output_path, mode="r", encoding="utf-8") as output_file:
+        assert output_file.read() == _expected_output()
+    os.remove(output_path)
+
+def test_aio_runs_conversions_side_by_side():
+    ticks = []
+
+    async def ticker(done):
+        while not done.is_set():
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def convert_all():
+        done = asyncio.Event()
+        tick_task = asyncio.ensure_future(ticker(done))
+        await asyncio.gather(*[
+            aio.run(VALID_ALL_PATH, f"{OUTPUT_FILE_PREFIX}_{i}.ascii",
+                    "MISC", chunk_size=1)
+            for i in range(3)])
+        done.set()
+        await tick_task
+
+    asyncio.run(convert_all())
+    assert ticks
+    for i in range(3):
+        output_path = f"{OUTPUT_FILE_PREFIX}_{i}.ascii"
+        with open(output_path, mode="r", encoding="utf-8") as output_file:
+            assert len(output_file.read()) == 4500
+        os.remove(output_path)
+
+def test_aio_run_compressed_with_archive():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii.gz")
+        archive_path = os.path.join(directory, "archive.ascii")
+        asyncio.run(aio.run(VALID_ALL_PATH, output_path, "MISC",
+                            chunk_size=1, archive_path=archive_path))
+        with gzip.open(output_path, mode="rt", encoding="utf-8") as file:
+            assert file.read() == _expected_output()
+        with open(archive_path, mode="r", encoding="utf-8") as file:
+            assert file.read() == _expected_output()
+        assert sorted(os.listdir(directory)) == \
+            ["archive.ascii", "output.ascii.gz"]
+
+def test_aio_write_failure_leaves_no_partial_file():
+    master = translator.load_full_schema(deepcopy(VALID_ALL_DATA))
+    translator.insert_generated_values(master)
+    del master["payees"][1]["payee_city"]
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        try:
+            asyncio.run(aio.write_1099_file(master, output_path, 1))
+            assert False, "write_1099_file did not fail"
+        except KeyError:
+            pass
+        assert not os.path.exists(output_path + writer.PARTIAL_SUFFIX)
+        assert os.listdir(directory) == []
+
+@raises(jsonschema.exceptions.ValidationError)
+def test_aio_validate_rejects_invalid_payee():
+    temp = deepcopy(VALID_ALL_DATA)
+    del temp["payees"][1]["payees_tin"]
+    asyncio.run(aio.validate_user_data(
+        temp, translator.get_schema_path("MISC"), chunk_size=1))
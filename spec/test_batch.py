@@ -0,0 +1,79 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+import shutil
+import tempfile
+
+from click.testing import CliRunner
+from nose.tools import raises
+
+from spec_util import VALID_ALL_PATH
+from fire.translator import batch, translator
+
+
+def _make_inputs(directory):
+    shutil.copy(VALID_ALL_PATH, os.path.join(directory, "client_a.json"))
+    shutil.copy(VALID_ALL_PATH, os.path.join(directory, "client_b.json"))
+    with open(os.path.join(directory, "client_c.json"), mode="w",
+              encoding="utf-8") as invalid_file:
+        json.dump({"payees": []}, invalid_file)
+
+def test_collect_inputs_directory_and_glob():
+    with tempfile.TemporaryDirectory() as directory:
+        _make_inputs(directory)
+        assert len(batch.collect_inputs(directory)) == 3
+        assert len(batch.collect_inputs(
+            os.path.join(directory, "client_[ab].json"))) == 2
+
+def test_run_batch_summary():
+    with tempfile.TemporaryDirectory() as directory:
+        _make_inputs(directory)
+        output_dir = os.path.join(directory, "out")
+        summary = batch.run_batch(batch.collect_inputs(directory), output_dir,
+                                  "MISC", 2)
+
+        assert summary["total_files"] == 3
+        assert summary["succeeded"] == 2
+        assert summary["failed"] == 1
+        assert summary["payees"] == 4
+        statuses = [result["status"] for result in summary["files"]]
+        assert statuses == ["ok", "ok", "error"]
+        assert summary["files"][0]["totals"]["7"] == 1700
+
+        with open(os.path.join(output_dir, "client_a.ascii"), mode="r",
+                  encoding="utf-8") as output_file:
+            assert len(output_file.read()) == 4500
+        with open(summary["summary_path"], mode="r",
+                  encoding="utf-8") as summary_file:
+            assert json.load(summary_file)["succeeded"] == 2
+
+@raises(Exception)
+def test_run_batch_rejects_duplicate_output_names():
+    with tempfile.TemporaryDirectory() as directory:
+        input_paths = []
+        for client in ["client_a", "client_b"]:
+            os.mkdir(os.path.join(directory, client))
+            input_paths.append(os.path.join(directory, client, "input.json"))
+            shutil.copy(VALID_ALL_PATH, input_paths[-1])
+        output_dir = os.path.join(directory, "out")
+        try:
+            batch.run_batch(input_paths, output_dir, "MISC", 1)
+        finally:
+            assert not os.path.exists(output_dir)
+
+def test_cli_batch_subcommand_and_default_command():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        _make_inputs(directory)
+        output_dir = os.path.join(directory, "out")
+        result = runner.invoke(translator.cli, [
+            "batch", os.path.join(directory, "client_[ab].json"),
+            "--output-dir", output_dir, "--workers", "1"])
+        assert result.exit_code == 0, result.output
+
+        output_path = os.path.join(directory, "single.ascii")
+        result = runner.invoke(translator.cli, [
+            VALID_ALL_PATH, "--output", output_path, "--type", "MISC"])
+        assert result.exit_code == 0, result.output
+        assert os.path.isfile(output_path)
@@ -0,0 +1,193 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import re
+import sys
+import gzip
+import json
+import tempfile
+import subprocess
+
+from copy import deepcopy
+
+from click.testing import CliRunner
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import translator, budget
+
+# Memory budget of the benchmark run, in MB
+BENCHMARK_BUDGET_MB = 48
+BENCHMARK_PAYEES = 10000
+
+
+def _many_payees(count):
+    data = deepcopy(VALID_ALL_DATA)
+    data["payees"] = [dict(data["payees"][i % 2], payees_tin=f"{i:09}")
+                      for i in range(count)]
+    return data
+
+def _write_json(directory, data, name="input.json"):
+    path = os.path.join(directory, name)
+    with open(path, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file, indent=1)
+    return path
+
+def _read(path):
+    with open(path, mode="rb") as file:
+        return file.read()
+
+def test_parse_size():
+    assert budget.parse_size("1024") == 1024
+    assert budget.parse_size("512k") == 512 * 1024
+    assert budget.parse_size("64M") == 64 * 1024 ** 2
+    assert budget.parse_size("1.5GB") == 3 * 1024 ** 3 // 2
+    assert budget.parse_size(4096) == 4096
+
+@raises(Exception)
+def test_parse_size_invalid():
+    budget.parse_size("lots")
+
+def test_choose_strategy():
+    size = 1000
+    assert budget.choose_strategy(size, 100 + size * budget.MEMORY_FACTOR,
+                                  100) == "memory"
+    assert budget.choose_strategy(size, 100 + size * budget.SPILL_FACTOR,
+                                  100) == "spill"
+    assert budget.choose_strategy(size, size, 100) == "stream"
+
+def test_estimate_input_size():
+    with tempfile.TemporaryDirectory() as directory:
+        contents = json.dumps(_many_payees(50)).encode("utf-8")
+        path = os.path.join(directory, "input.json")
+        with open(path, mode="wb") as file:
+            file.write(contents)
+        assert budget.estimate_input_size(path) == len(contents)
+        with gzip.open(path + ".gz", mode="wb") as file:
+            file.write(contents)
+        assert budget.estimate_input_size(path + ".gz") == len(contents)
+
+def test_read_streaming():
+    for keys in (["transmitter", "payer", "payees"],
+                 ["payees", "transmitter", "payer"],
+                 ["transmitter", "payees", "payer"]):
+        yield _check_read_streaming, keys
+
+def _check_read_streaming(keys):
+    # Small reads, so that values straddle the parser's buffer refills
+    read_size = budget.READ_SIZE
+    budget.READ_SIZE = 7
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            data = _many_payees(5)
+            data["payees"][0]["first_payee_name_line"] = "Zoë [1, 2]"
+            ordered = {key: data[key] for key in keys}
+            ordered["extra"] = [1.5, None, True]
+            data = budget.read_streaming(_write_json(directory, ordered))
+            assert not isinstance(data["payees"], list)
+            assert data["transmitter"] == ordered["transmitter"]
+            assert data["payer"] == ordered["payer"]
+            assert list(data["payees"]) == ordered["payees"]
+            assert data["extra"] == [1.5, None, True]
+    finally:
+        budget.READ_SIZE = read_size
+
+def test_read_streaming_empty_payees():
+    with tempfile.TemporaryDirectory() as directory:
+        data = dict(deepcopy(VALID_ALL_DATA), payees=[])
+        assert list(budget.read_streaming(
+            _write_json(directory, data))["payees"]) == []
+        del data["payees"]
+        assert list(budget.read_streaming(
+            _write_json(directory, data))["payees"]) == []
+
+@raises(Exception)
+def test_read_streaming_truncated_input():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "input.json")
+        with open(path, mode="w", encoding="utf-8") as input_file:
+            input_file.write(json.dumps(VALID_ALL_DATA)[:-20])
+        list(budget.read_streaming(path)["payees"])
+
+def test_strategies_produce_identical_output():
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, _many_payees(20))
+        expected_path = os.path.join(directory, "expected.ascii")
+        translator.run(input_path, expected_path)
+
+        memory_factor = budget.MEMORY_FACTOR
+        try:
+            for strategy, max_memory, factor in (
+                    ("memory", 1 << 40, memory_factor),
+                    ("spill", 1 << 40, 1 << 40),
+                    ("stream", 1, memory_factor)):
+                budget.MEMORY_FACTOR = factor
+                output_path = os.path.join(directory, f"{strategy}.ascii")
+                summary = translator.run(input_path, output_path,
+                                         max_memory=max_memory, report="json")
+                assert summary["strategy"] == strategy
+                assert summary["payees"] == 20
+                assert summary["peak_rss"] > 0
+                assert _read(output_path) == _read(expected_path)
+        finally:
+            budget.MEMORY_FACTOR = memory_factor
+
+@raises(Exception)
+def test_stream_strategy_validates_payees():
+    with tempfile.TemporaryDirectory() as directory:
+        data = _many_payees(3)
+        del data["payees"][2]["payees_tin"]
+        translator.run(_write_json(directory, data),
+                       os.path.join(directory, "output.ascii"), max_memory=1)
+
+def test_failed_streamed_run_leaves_no_partial_file():
+    for output_name in ("output.ascii", "output.ascii.gz"):
+        yield _check_failed_streamed_run, output_name
+
+def _check_failed_streamed_run(output_name):
+    with tempfile.TemporaryDirectory() as directory:
+        data = _many_payees(3)
+        del data["payees"][2]["payees_tin"]
+        input_path = _write_json(directory, data)
+        result = CliRunner().invoke(translator.cli, [
+            input_path, "--output", os.path.join(directory, output_name),
+            "--max-memory", "1K"])
+        assert result.exit_code != 0
+        assert os.listdir(directory) == ["input.json"]
+
+def test_cli_max_memory():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, _many_payees(3))
+        output_path = os.path.join(directory, "output.ascii")
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--max-memory", "1K"])
+        assert result.exit_code == 0, result.output
+        assert "Strategy: stream -- peak RSS:" in result.output
+        assert "Warning: peak RSS exceeded --max-memory" in result.output
+
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--max-memory", "lots"])
+        assert result.exit_code == 2
+
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--max-memory", "1G",
+            "--dedup"])
+        assert result.exit_code == 2
+
+# Benchmark: a conversion run in a fresh interpreter stays within its budget
+def test_max_memory_benchmark():
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, _many_payees(BENCHMARK_PAYEES))
+        assert os.path.getsize(input_path) * budget.SPILL_FACTOR > \
+            BENCHMARK_BUDGET_MB * 2 ** 20
+        process = subprocess.run(
+            [sys.executable, "-c", "from fire.translator import cli; cli()",
+             input_path, "--output", os.path.join(directory, "output.ascii"),
+             "--max-memory", f"{BENCHMARK_BUDGET_MB}M"],
+            stderr=subprocess.PIPE, check=True, universal_newlines=True)
+        match = re.search(r"Strategy: (\w+) -- peak RSS: ([\d.]+) MB",
+                          process.stderr)
+        assert match, process.stderr
+        assert match.group(1) == "stream"
+        assert float(match.group(2)) <= BENCHMARK_BUDGET_MB, process.stderr
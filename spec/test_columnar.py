@@ -0,0 +1,168 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+import tempfile
+
+from copy import deepcopy
+from unittest import SkipTest
+
+from click.testing import CliRunner
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import translator, columnar
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.feather
+except ImportError:
+    raise SkipTest("pyarrow is not installed")
+
+
+def _payee_table(payee_list):
+    columns = sorted({key for payee in payee_list for key in payee})
+    return pyarrow.table({column: [payee.get(column) for payee in payee_list]
+                          for column in columns})
+
+def _write_inputs(directory, data, suffix=".parquet"):
+    input_path = os.path.join(directory, "input.json")
+    with open(input_path, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file)
+    payees_path = os.path.join(directory, "payees" + suffix)
+    if suffix == ".parquet":
+        pyarrow.parquet.write_table(_payee_table(data["payees"]), payees_path)
+    else:
+        pyarrow.feather.write_feather(_payee_table(data["payees"]),
+                                      payees_path)
+    return input_path, payees_path
+
+def _read(path):
+    with open(path, mode="rb") as file:
+        return file.read()
+
+def _combined_data():
+    data = deepcopy(VALID_ALL_DATA)
+    data["payees"].append(deepcopy(data["payees"][0]))
+    data["payees"][0]["first_payee_name_line"] = "Zoë Ærøskøbing"
+    for payee, code in zip(data["payees"], ("06", "06", "")):
+        payee["combined_federal_state_code"] = code
+        payee["state_income_tax_withheld"] = "12.34"
+    return data
+
+def test_columnar_output_matches_json_output():
+    for suffix in (".parquet", ".feather"):
+        for batch_size in (1, 2, columnar.DEFAULT_BATCH_SIZE):
+            yield _check_columnar_output, suffix, batch_size
+
+def _check_columnar_output(suffix, batch_size):
+    with tempfile.TemporaryDirectory() as directory:
+        data = _combined_data()
+        input_path, payees_path = _write_inputs(directory, data, suffix)
+        expected_path = os.path.join(directory, "expected.ascii")
+        translator.run(input_path, expected_path)
+
+        output_path = os.path.join(directory, "output.ascii")
+        header = dict(data, payees=[])
+        count = columnar.write_columnar(header, payees_path, output_path,
+                                        batch_size=batch_size)
+        assert count == 3
+        assert _read(output_path) == _read(expected_path)
+
+def test_run_with_payees_path():
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        input_path, payees_path = _write_inputs(directory, data)
+        expected_path = os.path.join(directory, "expected.ascii")
+        translator.run(input_path, expected_path)
+
+        # The payees of the JSON input are not used
+        with open(input_path, mode="w", encoding="utf-8") as input_file:
+            json.dump(dict(data, payees=[]), input_file)
+        output_path = os.path.join(directory, "output.ascii")
+        summary = translator.run(input_path, output_path,
+                                 payees_path=payees_path, index=True)
+        assert summary["payees"] == 2
+        assert _read(output_path) == _read(expected_path)
+        assert os.path.exists(summary["index"])
+
+def test_columnar_non_string_columns():
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        input_path, _ = _write_inputs(directory, data)
+        expected_path = os.path.join(directory, "expected.ascii")
+        translator.run(input_path, expected_path)
+
+        table = _payee_table(data["payees"])
+        index = table.schema.get_field_index("payee_zip_code")
+        table = table.set_column(index, "payee_zip_code", pyarrow.array(
+            [int(payee["payee_zip_code"].replace("-", ""))
+             for payee in data["payees"]]))
+        payees_path = os.path.join(directory, "payees.parquet")
+        pyarrow.parquet.write_table(table, payees_path)
+        output_path = os.path.join(directory, "output.ascii")
+        columnar.write_columnar(dict(data, payees=[]), payees_path,
+                                output_path)
+        assert _read(output_path) == _read(expected_path)
+
+def test_columnar_empty_payee_file():
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        _, payees_path = _write_inputs(directory, dict(data, payees=[
+            data["payees"][0]]))
+        table = pyarrow.parquet.read_table(payees_path).slice(0, 0)
+        pyarrow.parquet.write_table(table, payees_path)
+        output_path = os.path.join(directory, "output.ascii")
+        assert columnar.write_columnar(data, payees_path, output_path) == 0
+        records = _read(output_path)
+        assert [records[i:i + 1] for i in range(0, len(records), 750)] == \
+            [b"T", b"A", b"C", b"F"]
+
+@raises(Exception)
+def test_columnar_invalid_value():
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        data["payees"][1]["payees_tin"] = "12-34"
+        _, payees_path = _write_inputs(directory, data)
+        columnar.write_columnar(data, payees_path,
+                                os.path.join(directory, "output.ascii"))
+
+@raises(Exception)
+def test_columnar_missing_required_column():
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        for payee in data["payees"]:
+            del payee["payee_city"]
+        _, payees_path = _write_inputs(directory, data)
+        columnar.write_columnar(data, payees_path,
+                                os.path.join(directory, "output.ascii"))
+
+@raises(Exception)
+def test_columnar_null_required_value():
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        del data["payees"][1]["payee_city"]
+        _, payees_path = _write_inputs(directory, data)
+        columnar.write_columnar(data, payees_path,
+                                os.path.join(directory, "output.ascii"))
+
+@raises(Exception)
+def test_columnar_unknown_file_type():
+    list(columnar.iter_batches("payees.csv"))
+
+def test_cli_payees():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        input_path, payees_path = _write_inputs(
+            directory, deepcopy(VALID_ALL_DATA), ".feather")
+        output_path = os.path.join(directory, "output.ascii")
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--payees", payees_path])
+        assert result.exit_code == 0, result.output
+        assert len(_read(output_path)) == 6 * 750
+
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--payees", payees_path,
+            "--dedup"])
+        assert result.exit_code == 2
@@ -0,0 +1,97 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import bz2
+import gzip
+import lzma
+import shutil
+import tempfile
+
+from copy import deepcopy
+
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA, VALID_ALL_PATH
+from fire.translator import batch, compression, translator, writer
+
+CODECS = {".gz": gzip, ".xz": lzma, ".bz2": bz2}
+
+
+def _expected_output():
+    master = translator.load_full_schema(deepcopy(VALID_ALL_DATA))
+    translator.insert_generated_values(master)
+    return translator.get_fire_bytes(master)
+
+def _compress(source, path, codec):
+    with open(source, mode="rb") as plain, codec.open(path, mode="wb") as out:
+        shutil.copyfileobj(plain, out)
+
+def test_extract_user_data_compressed():
+    for suffix, codec in CODECS.items():
+        yield _check_extract, suffix, codec
+
+def _check_extract(suffix, codec):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "input.json" + suffix)
+        _compress(VALID_ALL_PATH, path, codec)
+        assert translator.extract_user_data(path) == VALID_ALL_DATA
+
+def test_detect_compression_by_magic_bytes():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "export.dat")
+        _compress(VALID_ALL_PATH, path, lzma)
+        assert compression.detect_compression(path) == "xz"
+        assert translator.extract_user_data(path) == VALID_ALL_DATA
+        assert compression.detect_compression(VALID_ALL_PATH) is None
+
+def test_run_compressed_output_with_archive():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii.gz")
+        archive_path = os.path.join(directory, "archive.ascii.xz")
+        translator.run(VALID_ALL_PATH, output_path, "MISC",
+                       archive_path=archive_path)
+
+        with gzip.open(output_path, mode="rb") as output_file:
+            assert output_file.read() == _expected_output()
+        with lzma.open(archive_path, mode="rb") as archive_file:
+            assert archive_file.read() == _expected_output()
+        assert sorted(os.listdir(directory)) == \
+            ["archive.ascii.xz", "output.ascii.gz"]
+
+def test_run_streamed_with_plain_archive():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        archive_path = os.path.join(directory, "archive.ascii.bz2")
+        translator.run(VALID_ALL_PATH, output_path, "MISC", sort_by="tin",
+                       archive_path=archive_path)
+
+        with open(output_path, mode="rb") as output_file:
+            output = output_file.read()
+        with bz2.open(archive_path, mode="rb") as archive_file:
+            assert archive_file.read() == output
+        assert len(output) == 4500
+
+def test_gzip_output_is_reproducible():
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f"{i}.gz") for i in range(2)]
+        for path in paths:
+            writer.write_atomic(b"A" * 750, path)
+        with open(paths[0], mode="rb") as first, \
+             open(paths[1], mode="rb") as second:
+            assert first.read() == second.read()
+
+@raises(Exception)
+def test_checkpointed_output_cannot_be_compressed():
+    master = translator.load_full_schema(deepcopy(VALID_ALL_DATA))
+    translator.insert_generated_values(master)
+    writer.write_checkpointed(master, "./spec/data/unused.ascii.gz", 1)
+
+def test_batch_collects_compressed_inputs():
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(VALID_ALL_PATH, os.path.join(directory, "a.json"))
+        _compress(VALID_ALL_PATH, os.path.join(directory, "b.json.gz"), gzip)
+        inputs = batch.collect_inputs(directory)
+        assert [os.path.basename(path) for path in inputs] == \
+            ["a.json", "b.json.gz"]
+        assert batch.get_output_path(inputs[1]).endswith(
+            os.sep + "b.ascii")
@@ -0,0 +1,95 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+
+from copy import deepcopy
+
+from click.testing import CliRunner
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import dedup, translator
+
+OUTPUT_PATH = "./spec/data/test_outfile_dedup.ascii"
+INPUT_PATH = "./spec/data/test_infile_dedup.json"
+
+
+def _duplicated_payees():
+    first, second = deepcopy(VALID_ALL_DATA["payees"])
+    first["payers_account_number_for_payee"] = "acct-1"
+    duplicate = deepcopy(first)
+    duplicate["payees_tin"] = first["payees_tin"][:3] + "-" + \
+        first["payees_tin"][3:5] + "-" + first["payees_tin"][5:]
+    duplicate["payers_account_number_for_payee"] = " ACCT-1 "
+    duplicate["payee_city"] = "SOMEWHERE ELSE"
+    return [first, second, duplicate]
+
+def test_payee_key_normalizes_tin_and_account():
+    assert dedup.payee_key({"payees_tin": "12-3456789",
+                            "payers_account_number_for_payee": " ab1 "}) == \
+        dedup.payee_key({"payees_tin": "123456789",
+                         "payers_account_number_for_payee": "AB1"})
+
+def test_dedup_merges_amounts_and_flags_conflicts():
+    data = {"payees": _duplicated_payees()}
+    report = dedup.dedup_user_data(data)
+    data["payees"] = list(data["payees"])
+
+    assert report["input_payees"] == 3
+    assert report["output_payees"] == 2
+    assert report["duplicates"] == 1
+    assert not report["spilled"]
+    assert data["payees"][0]["payment_amount_7"] == "1400"
+    assert data["payees"][1]["payment_amount_7"] == \
+        VALID_ALL_DATA["payees"][1]["payment_amount_7"]
+    assert [c["field"] for c in report["conflicts"]] == ["payee_city"]
+
+def test_dedup_spilled_index_matches_in_memory():
+    payees = _duplicated_payees() * 5
+    in_memory = {"payees": deepcopy(payees)}
+    spilled = {"payees": deepcopy(payees)}
+    dedup.dedup_user_data(in_memory)
+    report = dedup.dedup_user_data(spilled, memory_budget=1,
+                                   spill_dir="./spec/data")
+
+    assert report["spilled"]
+    assert report["output_payees"] == 2
+    assert list(spilled["payees"]) == list(in_memory["payees"])
+    assert report["duplicates"] == 13
+    # The spill file is removed once the payees have been read back
+    assert not [name for name in os.listdir("./spec/data")
+                if name.startswith("fire-1099-dedup-")]
+
+def test_translator_run_with_dedup():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payees"] = _duplicated_payees()
+    with open(INPUT_PATH, mode="w", encoding="utf-8") as input_file:
+        json.dump(temp, input_file)
+    summary = translator.run(INPUT_PATH, OUTPUT_PATH, "MISC", dedup=True)
+
+    assert summary["payees"] == 2
+    with open(OUTPUT_PATH, mode="r", encoding="utf-8") as output_file:
+        assert len(output_file.read()) == 4500
+    report_path = OUTPUT_PATH + translator.DEDUP_REPORT_SUFFIX
+    with open(report_path, mode="r", encoding="utf-8") as report_file:
+        assert json.load(report_file)["duplicates"] == 1
+    for path in [INPUT_PATH, OUTPUT_PATH, report_path]:
+        os.remove(path)
+
+def test_cli_dedup_without_report():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payees"] = _duplicated_payees()
+    with open(INPUT_PATH, mode="w", encoding="utf-8") as input_file:
+        json.dump(temp, input_file)
+    result = CliRunner().invoke(translator.cli, [
+        INPUT_PATH, "--output", OUTPUT_PATH, "--dedup"])
+
+    report_path = OUTPUT_PATH + translator.DEDUP_REPORT_SUFFIX
+    try:
+        assert result.exit_code == 0, result.output
+        assert "Merged 1 duplicate payees" in result.output
+        assert "Summary report" not in result.output
+    finally:
+        for path in [INPUT_PATH, OUTPUT_PATH, report_path]:
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,65 @@
+# pylint: disable=missing-docstring, invalid-name
+
+from spec_util import check_blanks, STATE_TOTALS_BLANK_MAP
+from fire.entities import state_totals
+from fire.translator.util import StateTotals
+
+VALID_STATE_TOTALS = [{
+    "number_of_payees": "2",
+    "payment_amount_7": "1700",
+    "state_income_tax_withheld_total": "250",
+    "local_income_tax_withheld_total": "",
+    "combined_federal_state_code": "6"
+}]
+
+
+"""
+User data transformation tests: state_totals.xform()
+"""
+def test_state_totals_xform_pads_numbers():
+    transformed = state_totals.xform(VALID_STATE_TOTALS)
+    assert transformed[0]["number_of_payees"] == "00000002"
+    assert transformed[0]["payment_amount_7"] == 14*"0" + "1700"
+    assert transformed[0]["combined_federal_state_code"] == "06"
+
+"""
+FIRE-formatted ASCII string generation tests: state_totals.fire()
+"""
+def test_state_totals_fire_string_length():
+    transformed = state_totals.xform(VALID_STATE_TOTALS * 2)
+    assert len(state_totals.fire(transformed)) == 1500
+
+def test_state_totals_fire_layout():
+    transformed = state_totals.xform(VALID_STATE_TOTALS)
+    test_string = state_totals.fire(transformed)
+    assert test_string[0] == "K"
+    assert test_string[706:724] == 15*"0" + "250"
+    assert test_string[746:748] == "06"
+
+def test_state_totals_fire_blanks_layout():
+    transformed = state_totals.xform(VALID_STATE_TOTALS)
+    test_string = state_totals.fire(transformed)
+    for (offset_1_indexed, inclusive_bound) in STATE_TOTALS_BLANK_MAP:
+        yield check_blanks, test_string[(offset_1_indexed -1):inclusive_bound]
+
+"""
+Accumulation tests: util.StateTotals
+"""
+def test_state_totals_accumulates_by_state_code():
+    states = StateTotals()
+    payee = {"combined_federal_state_code": "06",
+             "state_income_tax_withheld": "1,000",
+             "local_income_tax_withheld": ""}
+    for code in ["1", "2", "3", "4", "5", "6", "7", "8", "9",
+                 "A", "B", "C", "D", "E", "F", "G", "H", "J"]:
+        payee["payment_amount_" + code] = "000000000100"
+    states.add(payee)
+    states.add(payee)
+    states.add(dict(payee, combined_federal_state_code="25"))
+    states.add(dict(payee, combined_federal_state_code=""))
+
+    records = states.records()
+    assert [r["combined_federal_state_code"] for r in records] == ["06", "25"]
+    assert records[0]["number_of_payees"] == "2"
+    assert records[0]["payment_amount_7"] == "200"
+    assert records[0]["state_income_tax_withheld_total"] == "2000"
@@ -0,0 +1,64 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+
+from copy import deepcopy
+
+import jsonschema
+
+from jsonschema import validate
+from nose.tools import raises
+
+from fire.entities import extension_of_time
+from fire.translator import extension
+from fire.translator.util import fire_entity
+
+VALID_EXTENSION_PATH = "./spec/data/valid_extension.json"
+OUTPUT_PATH = "./spec/data/test_outfile_extension.ascii"
+
+with open(VALID_EXTENSION_PATH, mode='r', encoding='utf-8') as valid_file:
+    VALID_EXTENSION_DATA = json.load(valid_file)
+with open(extension.get_schema_path(), mode='r', encoding='utf-8') as schema:
+    EXTENSION_SCHEMA = json.load(schema)
+
+
+def test_extension_schema_valid_data():
+    assert validate(VALID_EXTENSION_DATA, EXTENSION_SCHEMA) is None
+
+@raises(jsonschema.exceptions.ValidationError)
+def test_extension_schema_missing_payer_tin():
+    temp = deepcopy(VALID_EXTENSION_DATA)
+    del temp["payers"][0]["payer_tin"]
+    validate(temp, EXTENSION_SCHEMA)
+
+@raises(jsonschema.exceptions.ValidationError)
+def test_extension_schema_requires_control_code():
+    temp = deepcopy(VALID_EXTENSION_DATA)
+    del temp["transmitter_control_code"]
+    validate(temp, EXTENSION_SCHEMA)
+
+def test_extension_records_layout():
+    records = list(extension.iter_extension_records(VALID_EXTENSION_DATA))
+    assert len(records) == 2
+    for record in records:
+        assert len(record) == 200
+        assert record[0:5] == "55AA5"
+    assert records[0][5:14] == "123456789"
+    assert records[0][14:32] == "ASDF GLOBAL INC" + 3*"\x00"
+    assert records[0][176:185] == "100011234"
+
+def test_extension_compiled_encoder_matches_reference():
+    # pylint: disable=protected-access
+    for payer in VALID_EXTENSION_DATA["payers"]:
+        data = extension_of_time.xform(payer)
+        assert extension_of_time.fire(data) == fire_entity(
+            extension_of_time._EXTENSION_OF_TIME_TRANSFORMS,
+            extension_of_time._EXTENSION_OF_TIME_SORT, data, 200)
+
+def test_extension_run_writes_bulk_file():
+    count = extension.run(VALID_EXTENSION_PATH, OUTPUT_PATH)
+    assert count == 2
+    with open(OUTPUT_PATH, mode='r', encoding='utf-8') as output_file:
+        assert len(output_file.read()) == 400
+    os.remove(OUTPUT_PATH)
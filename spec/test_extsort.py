@@ -0,0 +1,90 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+import random
+
+from copy import deepcopy
+
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import extsort, translator
+
+OUTPUT_PATH = "./spec/data/test_outfile_extsort.ascii"
+INPUT_PATH = "./spec/data/test_infile_extsort.json"
+
+
+def _shuffled_payees(count, seed=1220):
+    rng = random.Random(seed)
+    template = VALID_ALL_DATA["payees"][0]
+    payee_list = []
+    for i in range(count):
+        payee = deepcopy(template)
+        payee["payees_tin"] = f"{rng.randrange(10**9):09}"
+        payee["payers_account_number_for_payee"] = f"acct-{i % 7}"
+        payee_list.append(payee)
+    return payee_list
+
+def _fire_format(data):
+    master = translator.load_full_schema(deepcopy(data))
+    translator.insert_generated_values(master)
+    return translator.get_fire_format(master)
+
+def test_external_sort_matches_sorted():
+    payee_list = _shuffled_payees(200)
+    for sort_by, key in extsort.SORT_KEYS.items():
+        expected = sorted(payee_list, key=key)
+        for run_size in [1, 7, 1000]:
+            yield _check_sort, payee_list, sort_by, run_size, expected
+
+def _check_sort(payee_list, sort_by, run_size, expected):
+    assert list(extsort.sort_payees(iter(payee_list), sort_by,
+                                    run_size)) == expected
+
+def test_external_sort_merges_in_passes():
+    items = [{"n": random.Random(i).randrange(50)} for i in range(300)]
+    width = extsort.MAX_MERGE_WIDTH
+    extsort.MAX_MERGE_WIDTH = 3
+    try:
+        result = list(extsort.external_sort(items, lambda x: f"{x['n']:03}",
+                                            run_size=4))
+    finally:
+        extsort.MAX_MERGE_WIDTH = width
+    assert result == sorted(items, key=lambda x: x["n"])
+
+def test_drain_empties_list():
+    items = [1, 2, 3]
+    assert list(extsort.drain(items)) == [1, 2, 3]
+    assert items == []
+
+@raises(Exception)
+def test_sort_payees_rejects_unknown_order():
+    extsort.sort_payees([], "zip")
+
+def test_translator_run_sorted_by_tin():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payees"] = _shuffled_payees(25)
+    with open(INPUT_PATH, mode="w", encoding="utf-8") as input_file:
+        json.dump(temp, input_file)
+    summary = translator.run(INPUT_PATH, OUTPUT_PATH, "MISC", sort_by="tin")
+
+    assert summary["payees"] == 25
+    temp["payees"].sort(key=extsort.tin_key)
+    with open(OUTPUT_PATH, mode="r", encoding="utf-8") as output_file:
+        assert output_file.read() == _fire_format(temp)
+    for path in [INPUT_PATH, OUTPUT_PATH]:
+        os.remove(path)
+
+def test_write_streamed_sorted_combined_fed_state():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payer"]["combined_fed_state"] = "1"
+    for i, payee in enumerate(temp["payees"]):
+        payee["combined_federal_state_code"] = ["06", "13"][i % 2]
+    expected = _fire_format(
+        dict(temp, payees=sorted(temp["payees"], key=extsort.name_key)))
+    translator.write_streamed(temp, OUTPUT_PATH, "name")
+
+    with open(OUTPUT_PATH, mode="r", encoding="utf-8") as output_file:
+        assert output_file.read() == expected
+    os.remove(OUTPUT_PATH)
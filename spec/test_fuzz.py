@@ -0,0 +1,167 @@
+# pylint: disable=missing-docstring, invalid-name, protected-access
+"""
+Differential fuzz tests: random inputs, generated from the input schema and
+the entity _ITEMS tables, are run through the reference implementations
+(xform_entity, fire_entity and translator.insert_generated_values) and
+through every accelerated engine (compiled str and bytes encoders, the
+streaming RecordWriter, checkpointed and asyncio writers, and the columnar
+renderer if pyarrow is installed), which must all produce byte-identical
+output.
+
+Runs a fixed number of seeded cases by default. Set FIRE_FUZZ_SEED and
+FIRE_FUZZ_CASES to explore further, e.g.:
+
+    FIRE_FUZZ_SEED=$RANDOM FIRE_FUZZ_CASES=2000 nosetests spec/test_fuzz.py
+
+A failing case can be reproduced from the seed in the test name.
+"""
+
+import os
+import random
+import asyncio
+import tempfile
+
+from copy import deepcopy
+
+from jsonschema import validate
+
+from spec_util import FUZZ_SEED, MAX_PAYEES, MISC_SCHEMA, generate_user_data
+from fire.entities import transmitter, payer, payees, end_of_payer, \
+                          state_totals, end_of_transmission
+from fire.translator import translator, aio, writer, columnar
+from fire.translator.util import fire_entity, xform_entity
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FUZZ_CASES = int(os.environ.get("FIRE_FUZZ_CASES", "40"))
+
+ENTITIES = [
+    ("transmitter", transmitter, transmitter._TRANSMITTER_TRANSFORMS,
+     transmitter._TRANSMITTER_SORT),
+    ("payer", payer, payer._PAYER_TRANSFORMS, payer._PAYER_SORT),
+    ("payees", payees, payees._PAYEE_TRANSFORMS, payees._PAYEE_SORT),
+    ("end_of_payer", end_of_payer, end_of_payer._END_OF_PAYER_TRANSFORMS,
+     end_of_payer._END_OF_PAYER_SORT),
+    ("state_totals", state_totals, state_totals._STATE_TOTALS_TRANSFORMS,
+     state_totals._STATE_TOTALS_SORT),
+    ("end_of_transmission", end_of_transmission,
+     end_of_transmission._END_OF_TRANSMISSION_TRANSFORMS,
+     end_of_transmission._END_OF_TRANSMISSION_SORT)
+]
+
+
+"""
+Reference output
+"""
+def _reference_master(user_data):
+    master = {
+        "transmitter": xform_entity(transmitter._TRANSMITTER_TRANSFORMS,
+                                    user_data["transmitter"]),
+        "payer": xform_entity(payer._PAYER_TRANSFORMS, user_data["payer"]),
+        "payees": [xform_entity(payees._PAYEE_TRANSFORMS, payee)
+                   for payee in user_data["payees"]],
+        "end_of_payer": xform_entity(end_of_payer._END_OF_PAYER_TRANSFORMS,
+                                     {}),
+        "state_totals": [],
+        "end_of_transmission": xform_entity(
+            end_of_transmission._END_OF_TRANSMISSION_TRANSFORMS, {})
+    }
+    translator.insert_generated_values(master)
+    return master
+
+def _records(master):
+    for name, module, entity_dict, sort in ENTITIES:
+        records = master[name]
+        for record in records if isinstance(records, list) else [records]:
+            yield name, module, entity_dict, sort, record
+
+def _reference_bytes(master):
+    return b"".join(fire_entity(entity_dict, sort, record, binary=True)
+                    for _, _, entity_dict, sort, record in _records(master))
+
+
+"""
+Differential checks
+"""
+def test_fuzz_engines_match_reference():
+    for case in range(FUZZ_CASES):
+        yield _check_case, FUZZ_SEED + case
+
+def _check_case(seed):
+    rng = random.Random(seed)
+    user_data = generate_user_data(rng)
+    validate(user_data, MISC_SCHEMA)
+
+    master = _reference_master(user_data)
+    expected = _reference_bytes(master)
+
+    # Compiled encoders, record by record
+    for name, module, entity_dict, sort, record in _records(master):
+        reference_str = fire_entity(entity_dict, sort, record)
+        reference_bytes = fire_entity(entity_dict, sort, record, binary=True)
+        rendered = module.fire([record] if name in ("payees", "state_totals")
+                               else record)
+        assert rendered == reference_str, f"seed {seed}: {name} (str)"
+        rendered = module.fire_bytes(
+            [record] if name in ("payees", "state_totals") else record)
+        assert rendered == reference_bytes, f"seed {seed}: {name} (bytes)"
+        if reference_str.isascii():
+            assert reference_bytes == reference_str.encode("ascii")
+
+    # Whole-file engines
+    translated = translator.load_full_schema(deepcopy(user_data))
+    translator.insert_generated_values(translated)
+    assert translated == master, f"seed {seed}: load_full_schema"
+    assert translator.get_fire_bytes(translated) == expected, \
+        f"seed {seed}: get_fire_bytes"
+
+    chunk_size = rng.randint(1, 5)
+    translated = asyncio.run(aio.load_full_schema(deepcopy(user_data),
+                                                  chunk_size))
+    translator.insert_generated_values(translated)
+    assert translated == master, f"seed {seed}: aio.load_full_schema"
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "output.ascii")
+
+        writer.write_stream(
+            transmitter.xform(user_data["transmitter"]),
+            payer.xform(user_data["payer"]),
+            payees.xform(deepcopy(user_data["payees"])), path)
+        assert _read(path) == expected, f"seed {seed}: write_stream"
+
+        writer.write_checkpointed(deepcopy(master), path,
+                                  rng.randint(1, MAX_PAYEES))
+        assert _read(path) == expected, f"seed {seed}: write_checkpointed"
+
+        asyncio.run(aio.write_1099_file(master, path, chunk_size))
+        assert _read(path) == expected, f"seed {seed}: aio.write_1099_file"
+
+        if pyarrow is not None:
+            payees_path = os.path.join(temp_dir, "payees.parquet")
+            pyarrow.parquet.write_table(
+                _payee_table(user_data["payees"]), payees_path)
+            columnar.write_columnar(user_data, payees_path, path,
+                                    batch_size=rng.randint(1, MAX_PAYEES))
+            assert _read(path) == expected, f"seed {seed}: write_columnar"
+
+def _payee_table(payee_list):
+    # Required columns are kept when there are no payees
+    columns = set(MISC_SCHEMA["properties"]["payees"]["items"]["required"])
+    columns.update(key for payee in payee_list for key in payee)
+    return pyarrow.table({
+        column: pyarrow.array([payee.get(column) for payee in payee_list],
+                              pyarrow.string())
+        for column in sorted(columns)})
+
+def _read(path):
+    with open(path, mode="rb") as output_file:
+        return output_file.read()
+
+def test_fuzz_generator_is_deterministic():
+    assert generate_user_data(random.Random(FUZZ_SEED)) == \
+        generate_user_data(random.Random(FUZZ_SEED))
@@ -0,0 +1,110 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+import tempfile
+
+from copy import deepcopy
+
+from click.testing import CliRunner
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import translator, index
+
+
+def _write_input(directory, payee_count=50):
+    data = deepcopy(VALID_ALL_DATA)
+    data["payees"] = []
+    for i in range(payee_count):
+        payee = deepcopy(VALID_ALL_DATA["payees"][i % 2])
+        payee["payees_tin"] = f"{i:03}-00-{i % 7:04}"
+        payee["payers_account_number_for_payee"] = f"ACCT{i % 10}"
+        data["payees"].append(payee)
+    input_path = os.path.join(directory, "input.json")
+    with open(input_path, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file)
+    return input_path
+
+def test_index_lookup_by_each_key():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        summary = translator.run(_write_input(directory), output_path,
+                                 index=True)
+        assert summary["index"] == output_path + index.INDEX_SUFFIX
+        # 50 payees, 3 keys each
+        assert os.path.getsize(summary["index"]) == 24 + 150 * 12
+
+        matches = index.lookup(output_path, tin="012-00-0005")
+        assert [fields["payees_tin"] for fields in matches] == ["012000005"]
+        assert matches[0]["record_sequence_number"] == "00000015"
+
+        matches = index.lookup(output_path, account="ACCT3")
+        assert [fields["record_sequence_number"] for fields in matches] == \
+            [f"{i + 3:08}" for i in range(3, 50, 10)]
+
+        matches = index.lookup(output_path, name_control="spac")
+        assert len(matches) == 25
+
+        matches = index.lookup(output_path, account="ACCT3",
+                               name_control="BOBL")
+        assert [fields["payees_tin"] for fields in matches] == \
+            [f"{i:03}00{i % 7:04}" for i in (3, 13, 23, 33, 43)]
+
+        assert index.lookup(output_path, tin="999-99-9999") == []
+
+def test_index_of_sorted_output():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        translator.run(_write_input(directory), output_path,
+                       sort_by="account", index=True)
+        matches = index.lookup(output_path, tin="012000005")
+        with open(output_path, mode="rb") as output_file:
+            output_file.seek(
+                (int(matches[0]["record_sequence_number"]) - 1) * 750)
+            assert output_file.read(750)[11:20] == b"012000005"
+
+@raises(Exception)
+def test_index_refuses_stale_index():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        input_path = _write_input(directory)
+        translator.run(input_path, output_path, index=True)
+        os.replace(output_path + index.INDEX_SUFFIX,
+                   os.path.join(directory, "old.idx"))
+        translator.run(_write_input(directory, 10), output_path)
+        index.lookup(output_path, os.path.join(directory, "old.idx"),
+                     tin="012000005")
+
+@raises(Exception)
+def test_index_refuses_compressed_output():
+    with tempfile.TemporaryDirectory() as directory:
+        translator.run(_write_input(directory),
+                       os.path.join(directory, "output.ascii.gz"), index=True)
+
+def test_cli_lookup():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        input_path = _write_input(directory)
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--type", "MISC"])
+        assert result.exit_code == 0, result.output
+        result = runner.invoke(translator.cli, ["lookup", output_path,
+                                                "--tin", "012000005"])
+        assert result.exit_code == 2
+        assert "--index" in result.output
+
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--type", "MISC", "--index"])
+        assert result.exit_code == 0, result.output
+        result = runner.invoke(translator.cli, ["lookup", output_path,
+                                                "--tin", "012-00-0005"])
+        assert result.exit_code == 0, result.output
+        fields = json.loads(result.output)
+        assert fields["payees_tin"] == "012000005"
+        assert not any(key.startswith("blank") for key in fields)
+
+        result = runner.invoke(translator.cli, ["lookup", output_path,
+                                                "--tin", "999999999"])
+        assert result.exit_code == 1
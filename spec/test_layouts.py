@@ -0,0 +1,145 @@
+# pylint: disable=missing-docstring, invalid-name, protected-access
+
+from copy import deepcopy
+
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.entities import payees, payer, transmitter, end_of_payer, \
+                          state_totals, end_of_transmission, \
+                          extension_of_time, forms
+from fire.translator import layouts
+from fire.translator.layouts import Field, Layout, check_fields
+from fire.translator.util import fire_entity, parse_entity
+
+
+def _fields():
+    return [Field("a", 1, 2), Field("b", 3, 5), Field("c", 8, 3)]
+
+def test_check_fields_accepts_unordered_fields():
+    check_fields("test", list(reversed(_fields())), 10)
+
+@raises(Exception)
+def test_check_fields_overlap():
+    fields = _fields()
+    fields[1] = Field("b", 2, 6)
+    check_fields("test", fields, 10)
+
+@raises(Exception)
+def test_check_fields_gap():
+    fields = _fields()
+    fields[2] = Field("c", 9, 2)
+    check_fields("test", fields, 10)
+
+@raises(Exception)
+def test_check_fields_record_length():
+    check_fields("test", _fields(), 750)
+
+@raises(Exception)
+def test_check_fields_duplicate_name():
+    fields = _fields()
+    fields[2] = Field("a", 8, 3)
+    check_fields("test", fields, 10)
+
+@raises(Exception)
+def test_check_fields_zero_length():
+    fields = _fields() + [Field("d", 11, 0)]
+    check_fields("test", fields, 10)
+
+@raises(Exception)
+def test_check_fields_unknown_kind():
+    fields = _fields()
+    fields[1] = Field("b", 3, 5, kind="lowercase")
+    check_fields("test", fields, 10)
+
+def test_layout_kinds():
+    layout = Layout("test", [Field("a", 1, 2), Field("b", 3, 5,
+                                                     transform=str.upper),
+                             Field("c", 8, 3, transform=str.upper,
+                                   kind="uppercase")], 10)
+    assert layout.kinds == {"a": "identity", "b": None, "c": "uppercase"}
+    assert payees._LAYOUT.kinds["payees_tin"] == "digits_only"
+    assert payees._LAYOUT.kinds["payment_amount_A"] == "rjust_zero"
+
+@raises(Exception)
+def test_register_twice():
+    layouts.register("payees", layouts.fields_from_items(payees._ITEMS))
+
+def test_layout_encoders_match_fire_entity():
+    data = deepcopy(VALID_ALL_DATA)
+    cases = [(payees, data["payees"][0]), (payer, data["payer"]),
+             (transmitter, data["transmitter"]), (end_of_payer, {}),
+             (state_totals, {}), (end_of_transmission, {}),
+             (extension_of_time, {})]
+    for module, user_data in cases:
+        yield _check_encoders, module, module._LAYOUT.xform(user_data)
+
+def _check_encoders(module, record):
+    layout = module._LAYOUT
+    expected = fire_entity(layout.transforms, layout.sort, record,
+                           layout.record_length)
+    assert layout.encode(record) == expected
+    assert layout.encode_bytes(record) == expected.encode("ascii")
+    assert layout.decode(expected) == \
+        parse_entity(layout.transforms, layout.sort, expected)
+
+def test_decode_inverts_encode():
+    layout = layouts.get_layout("payees")
+    record = layout.xform(deepcopy(VALID_ALL_DATA["payees"][0]))
+    for rendered in (layout.encode(record), layout.encode_bytes(record)):
+        assert layout.decode(rendered) == record
+
+def test_entity_modules_are_registered():
+    for name in ("transmitter", "payer", "payees", "end_of_payer",
+                 "state_totals", "end_of_transmission", "extension_of_time"):
+        assert name in layouts.layout_names()
+    assert layouts.get_layout("extension_of_time").record_length == 200
+
+@raises(Exception)
+def test_unknown_layout():
+    layouts.get_layout("payees_w2")
+
+def test_form_layouts():
+    for form_type in ("INT", "DIV", "B", "K"):
+        yield _check_form_layout, form_type
+
+def _check_form_layout(form_type):
+    layout = forms.payee_layout(form_type)
+    assert isinstance(layout, Layout)
+    payee = deepcopy(VALID_ALL_DATA["payees"][0])
+    payee["fatca_filing_requirement_indicator"] = "1"
+    payee["special_data_entries"] = "SPECIAL"
+    record = forms.xform(form_type, [payee])[0]
+    record["record_sequence_number"] = "00000003"
+    rendered = forms.fire(form_type, [record])
+    assert len(rendered) == 750
+    # Shared positions match the 1099-MISC payee record
+    misc = payees.xform([payee])[0]
+    misc["record_sequence_number"] = "00000003"
+    assert rendered[:543] == payees.fire([misc])[:543]
+    # Fields are written at their declared start positions
+    for field in layout.fields:
+        value = rendered[field.start - 1:field.start - 1 + field.length]
+        assert value.rstrip("\x00") == \
+            record[field.name].rstrip("\x00"), field.name
+    fatca = [field for field in layout.fields
+             if field.name == "fatca_filing_requirement_indicator"][0]
+    assert rendered[fatca.start - 1] == "1"
+    assert rendered[662:669] == "SPECIAL"
+    assert layout.decode(rendered) == record
+
+def test_form_int_positions():
+    record = forms.xform("INT", [{"foreign_country_or_us_possession": "fr",
+                                  "cusip_number": "abc123"}])[0]
+    rendered = forms.fire("INT", [record])
+    assert rendered[546:548] == "FR"
+    assert rendered[586:592] == "ABC123"
+
+def test_form_return_types():
+    assert forms.RETURN_TYPES["MISC"] == "A"
+    assert forms.RETURN_TYPES["NEC"] == "NE"
+    assert forms.payee_layout("NEC") is layouts.get_layout("payees")
+
+@raises(Exception)
+def test_form_unknown_type():
+    forms.payee_layout("W2")
@@ -0,0 +1,209 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import re
+import json
+import tempfile
+import threading
+import urllib.request
+
+from copy import deepcopy
+from unittest import SkipTest
+
+from click.testing import CliRunner
+from nose.tools import raises, with_setup
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import translator, metrics, server
+
+
+def _write_json(directory, data):
+    path = os.path.join(directory, "input.json")
+    with open(path, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file)
+    return path
+
+def _samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+def _reset():
+    metrics.disable()
+
+@with_setup(_reset, _reset)
+def test_disabled_by_default():
+    assert metrics.registry() is None
+    metrics.count("payees_rendered", 5)
+    assert metrics.render() == ""
+
+@with_setup(_reset, _reset)
+def test_render_counters_and_histogram():
+    registry = metrics.enable()
+    registry.count("payees_rendered", 3)
+    registry.count("stage_failures", stage="va\"lidate")
+    registry.observe("render", 0.02)
+    registry.observe("render", 1000)
+    text = metrics.render()
+    assert "# TYPE fire_1099_stage_duration_seconds histogram" in text
+    samples = _samples(text)
+    assert samples["fire_1099_payees_rendered_total"] == 3
+    assert samples["fire_1099_payees_rejected_total"] == 0
+    assert samples['fire_1099_stage_failures_total{stage="va\\"lidate"}'] == 1
+    assert samples['fire_1099_stage_duration_seconds_bucket'
+                   '{stage="render",le="0.01"}'] == 0
+    assert samples['fire_1099_stage_duration_seconds_bucket'
+                   '{stage="render",le="0.025"}'] == 1
+    assert samples['fire_1099_stage_duration_seconds_bucket'
+                   '{stage="render",le="900"}'] == 1
+    assert samples['fire_1099_stage_duration_seconds_bucket'
+                   '{stage="render",le="+Inf"}'] == 2
+    assert samples['fire_1099_stage_duration_seconds_count'
+                   '{stage="render"}'] == 2
+    assert samples['fire_1099_stage_duration_seconds_sum'
+                   '{stage="render"}'] == 1000.02
+
+@with_setup(_reset, _reset)
+def test_run_metrics():
+    metrics.enable()
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        translator.run(_write_json(directory, VALID_ALL_DATA), output_path)
+        samples = _samples(metrics.render())
+        assert samples["fire_1099_payees_processed_total"] == 2
+        assert samples["fire_1099_payees_rendered_total"] == 2
+        assert samples["fire_1099_bytes_written_total"] == \
+            os.path.getsize(output_path)
+        for stage in ("run", "validate", "transform", "render", "write"):
+            assert samples["fire_1099_stage_duration_seconds_count"
+                           f"{{stage=\"{stage}\"}}"] == 1
+        assert 'fire_1099_cache_hit_ratio{cache="validator"}' in samples
+
+@with_setup(_reset, _reset)
+def test_run_metrics_rejects():
+    metrics.enable()
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        del data["payees"][0]["payees_tin"]
+        translator.run(_write_json(directory, data),
+                       os.path.join(directory, "output.ascii"),
+                       reject_path=os.path.join(directory, "rejects.ndjson"))
+        samples = _samples(metrics.render())
+        assert samples["fire_1099_payees_processed_total"] == 2
+        assert samples["fire_1099_payees_rejected_total"] == 1
+        assert samples["fire_1099_payees_rendered_total"] == 1
+
+@with_setup(_reset, _reset)
+def test_run_metrics_multiform():
+    metrics.enable()
+    with tempfile.TemporaryDirectory() as directory:
+        translator.run(_write_json(directory, VALID_ALL_DATA),
+                       os.path.join(directory, "output.ascii"),
+                       multiform=True)
+        samples = _samples(metrics.render())
+        assert samples["fire_1099_payees_processed_total"] == 2
+        assert samples["fire_1099_payees_rendered_total"] == 2
+
+@with_setup(_reset, _reset)
+def test_run_metrics_columnar():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise SkipTest("pyarrow is not installed")
+    metrics.enable()
+    with tempfile.TemporaryDirectory() as directory:
+        payee_list = VALID_ALL_DATA["payees"]
+        payees_path = os.path.join(directory, "payees.parquet")
+        pyarrow.parquet.write_table(pyarrow.table({
+            column: [payee.get(column) for payee in payee_list]
+            for column in sorted({key for payee in payee_list
+                                  for key in payee})}), payees_path)
+        translator.run(_write_json(directory, dict(VALID_ALL_DATA,
+                                                   payees=[])),
+                       os.path.join(directory, "output.ascii"),
+                       payees_path=payees_path)
+        samples = _samples(metrics.render())
+        assert samples["fire_1099_payees_processed_total"] == 2
+        assert samples["fire_1099_payees_rendered_total"] == 2
+
+@raises(Exception)
+@with_setup(_reset, _reset)
+def test_stage_failures():
+    metrics.enable()
+    data = deepcopy(VALID_ALL_DATA)
+    del data["payer"]
+    try:
+        translator.validate_user_data(data, translator.get_schema_path())
+    finally:
+        samples = _samples(metrics.render())
+        assert samples['fire_1099_stage_failures_total{stage="validate"}'] \
+            == 1
+
+@with_setup(_reset, _reset)
+def test_serve():
+    metrics.enable().count("payees_rendered", 7)
+    metrics_server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{metrics_server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            text = response.read().decode("utf-8")
+        assert _samples(text)["fire_1099_payees_rendered_total"] == 7
+    finally:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+
+@with_setup(_reset, _reset)
+def test_server_metrics():
+    metrics.enable()
+    httpd = server.ConversionServer(("127.0.0.1", 0), 2, 2)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    metrics_server = metrics.serve(0)
+    try:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{httpd.server_address[1]}/convert",
+            json.dumps(VALID_ALL_DATA).encode("utf-8"),
+            {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            assert len(response.read()) == 6 * 750
+        url = f"http://127.0.0.1:{metrics_server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            samples = _samples(response.read().decode("utf-8"))
+        assert samples["fire_1099_payees_processed_total"] == 2
+        assert samples["fire_1099_payees_rendered_total"] == 2
+        for stage in ("validate", "transform", "render"):
+            assert samples["fire_1099_stage_duration_seconds_count"
+                           f"{{stage=\"{stage}\"}}"] == 1
+    finally:
+        for running in (httpd, metrics_server):
+            running.shutdown()
+            running.server_close()
+
+@with_setup(_reset, _reset)
+def test_cli_metrics_file():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, VALID_ALL_DATA)
+        metrics_path = os.path.join(directory, "fire.prom")
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", os.path.join(directory, "output.ascii"),
+            "--metrics-file", metrics_path])
+        assert result.exit_code == 0, result.output
+        with open(metrics_path, mode="r", encoding="utf-8") as file:
+            assert _samples(file.read())[
+                "fire_1099_payees_rendered_total"] == 2
+
+        # Failed runs are recorded too
+        data = deepcopy(VALID_ALL_DATA)
+        del data["payer"]
+        result = runner.invoke(translator.cli, [
+            _write_json(directory, data), "--output",
+            os.path.join(directory, "output.ascii"),
+            "--metrics-file", metrics_path])
+        assert result.exit_code != 0
+        with open(metrics_path, mode="r", encoding="utf-8") as file:
+            text = file.read()
+        assert re.search(r'stage_failures_total\{stage="run"\} [1-9]', text)
@@ -0,0 +1,143 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+import tempfile
+
+from copy import deepcopy
+
+import jsonschema
+
+from click.testing import CliRunner
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import translator, multiform
+
+
+def _nec_payee(i):
+    payee = deepcopy(VALID_ALL_DATA["payees"][i % 2])
+    for key in list(payee):
+        if key.startswith("payment_amount_"):
+            del payee[key]
+    payee["payment_amount_1"] = f"{(i + 1) * 100}"
+    payee["payees_tin"] = f"55500{i:04}"
+    payee["form_type"] = "NEC"
+    return payee
+
+def _mixed_data():
+    data = deepcopy(VALID_ALL_DATA)
+    data["payees"] = [_nec_payee(0), data["payees"][0], _nec_payee(1),
+                      _nec_payee(2), data["payees"][1]]
+    data["payees"][1]["form_type"] = "MISC"
+    return data
+
+def _write_input(directory, data, name="input.json"):
+    path = os.path.join(directory, name)
+    with open(path, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file)
+    return path
+
+def _records(path):
+    with open(path, mode="rb") as output_file:
+        contents = output_file.read()
+    assert len(contents) % 750 == 0
+    return [contents[i:i + 750] for i in range(0, len(contents), 750)]
+
+def test_multiform_groups_and_sequencing():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        summary = translator.run(_write_input(directory, _mixed_data()),
+                                 output_path, multiform=True)
+        assert summary["forms"] == {"MISC": 2, "NEC": 3}
+        assert summary["payees"] == 5
+
+        records = _records(output_path)
+        assert [record[:1] for record in records] == \
+            [b"T", b"A", b"B", b"B", b"C", b"A", b"B", b"B", b"B", b"C",
+             b"F"]
+        assert [int(record[499:507]) for record in records] == \
+            list(range(1, 12))
+
+        misc_payer, nec_payer = records[1], records[5]
+        assert misc_payer[25:27] == b"A\x00"
+        assert nec_payer[25:27] == b"NE"
+        assert nec_payer[27:43].rstrip(b"\x00") == b"1"
+        # NEC payees in input order
+        assert [record[11:20] for record in records[6:9]] == \
+            [b"555000000", b"555000001", b"555000002"]
+        # Payee counts and amount 1 totals per group
+        assert int(records[4][1:9]) == 2
+        assert int(records[9][1:9]) == 3
+        assert int(records[9][15:33]) == 100 + 200 + 300
+
+        assert int(records[0][295:303]) == 5
+        assert int(records[10][1:9]) == 2
+        assert int(records[10][49:57]) == 5
+
+# Each group is rendered exactly as a single-form run of its payees, up to
+# sequence numbers and transmission totals
+def test_multiform_groups_match_single_form_runs():
+    with tempfile.TemporaryDirectory() as directory:
+        data = _mixed_data()
+        output_path = os.path.join(directory, "output.ascii")
+        translator.run(_write_input(directory, data), output_path,
+                       multiform=True)
+        records = _records(output_path)
+
+        for form_type, group in (("MISC", records[1:5]),
+                                 ("NEC", records[5:10])):
+            single = deepcopy(data)
+            single["payer"]["type_of_return"] = \
+                multiform.RETURN_TYPES[form_type]
+            single["payees"] = [
+                payee for payee in data["payees"]
+                if payee.get("form_type", "MISC") == form_type]
+            single_path = os.path.join(directory, f"{form_type}.ascii")
+            translator.run(_write_input(directory, single, "single.json"),
+                           single_path, form_type)
+            expected = _records(single_path)[1:-1]
+            assert [record[:499] + record[507:] for record in group] == \
+                [record[:499] + record[507:] for record in expected]
+
+def test_multiform_untagged_payees_take_run_type():
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        data["payees"].append(_nec_payee(0))
+        summary = translator.run(_write_input(directory, data),
+                                 os.path.join(directory, "output.ascii"),
+                                 "MISC", multiform=True)
+        assert summary["forms"] == {"MISC": 2, "NEC": 1}
+
+@raises(jsonschema.exceptions.ValidationError)
+def test_multiform_validates_payees_against_their_form():
+    with tempfile.TemporaryDirectory() as directory:
+        data = _mixed_data()
+        del data["payees"][2]["payment_amount_1"]
+        translator.run(_write_input(directory, data),
+                       os.path.join(directory, "output.ascii"),
+                       multiform=True)
+
+@raises(Exception)
+def test_multiform_rejects_unknown_form_type():
+    with tempfile.TemporaryDirectory() as directory:
+        data = _mixed_data()
+        data["payees"][0]["form_type"] = "DIV"
+        translator.run(_write_input(directory, data),
+                       os.path.join(directory, "output.ascii"),
+                       multiform=True)
+
+def test_cli_multi_form():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_input(directory, _mixed_data())
+        output_path = os.path.join(directory, "output.ascii")
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--type", "MISC",
+            "--multi-form"])
+        assert result.exit_code == 0, result.output
+        assert "2 MISC, 3 NEC" in result.output
+
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", output_path, "--multi-form", "--dedup"])
+        assert result.exit_code == 2
@@ -0,0 +1,121 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import io
+import os
+import json
+import tempfile
+
+from copy import deepcopy
+from itertools import count
+
+from click.testing import CliRunner
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import translator, progress
+
+
+def _write_json(directory, data):
+    path = os.path.join(directory, "input.json")
+    with open(path, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file)
+    return path
+
+def _read(path):
+    with open(path, mode="rb") as file:
+        return file.read()
+
+def _stages(events):
+    return [(event["stage"], event["done"], event["finished"])
+            for event in events]
+
+def test_track_events():
+    events = []
+    # Each read of the clock advances it by one second
+    reporter = progress.ProgressReporter(events.append, interval=1,
+                                         clock=count().__next__)
+    items = list(range(progress.CHECK_EVERY * 2 + 5))
+    assert list(reporter.track(items, "render")) == items
+    assert _stages(events) == [
+        ("render", 0, False),
+        ("render", progress.CHECK_EVERY, False),
+        ("render", progress.CHECK_EVERY * 2, False),
+        ("render", len(items), True)]
+    assert all(event["total"] == len(items) for event in events)
+    assert events[1]["rate"] == progress.CHECK_EVERY
+    assert events[1]["eta"] == round((len(items) - progress.CHECK_EVERY) /
+                                     progress.CHECK_EVERY, 1)
+    assert events[-1]["eta"] == 0
+    assert events[-1]["rss"] > 0
+
+def test_track_interval():
+    events = []
+    reporter = progress.ProgressReporter(events.append, interval=60,
+                                         clock=count().__next__)
+    list(reporter.track(iter(range(progress.CHECK_EVERY * 3)), "validate"))
+    assert _stages(events) == [("validate", 0, False),
+                               ("validate", progress.CHECK_EVERY * 3, True)]
+    assert events[0]["total"] is None and events[0]["eta"] is None
+
+def test_format_event():
+    event = {"stage": "render", "done": 250, "total": 1000, "elapsed": 2.5,
+             "rate": 100.0, "eta": 7.5, "rss": 3 * 2 ** 20,
+             "finished": False}
+    line = progress.format_event(event)
+    assert "250/1000 (25.0%)" in line
+    assert "100 payees/s" in line and "ETA 8s" in line
+    assert "RSS 3.0 MB" in line
+
+def test_ndjson_callback():
+    stream = io.StringIO()
+    reporter = progress.ProgressReporter(progress.ndjson_callback(stream))
+    list(reporter.track([1, 2], "transform"))
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert _stages(events) == [("transform", 0, False),
+                               ("transform", 2, True)]
+
+def test_run_progress():
+    for options in ({}, {"sort_by": "tin"}, {"max_memory": 1}):
+        yield _check_run_progress, options
+
+def _check_run_progress(options):
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, VALID_ALL_DATA)
+        expected_path = os.path.join(directory, "expected.ascii")
+        translator.run(input_path, expected_path, **options)
+
+        events = []
+        output_path = os.path.join(directory, "output.ascii")
+        translator.run(input_path, output_path, progress=events.append,
+                       **options)
+        assert _read(output_path) == _read(expected_path)
+        finished = {event["stage"]: event["done"] for event in events
+                    if event["finished"]}
+        assert finished["validate"] == finished["render"] == 2
+        if not options:
+            assert [event["stage"] for event in events if event["finished"]] \
+                == ["validate", "transform", "render"]
+
+def test_run_progress_rejects():
+    with tempfile.TemporaryDirectory() as directory:
+        data = deepcopy(VALID_ALL_DATA)
+        del data["payees"][0]["payees_tin"]
+        events = []
+        translator.run(_write_json(directory, data),
+                       os.path.join(directory, "output.ascii"),
+                       reject_path=os.path.join(directory, "rejects.ndjson"),
+                       progress=events.append)
+        finished = {event["stage"]: event["done"] for event in events
+                    if event["finished"]}
+        assert finished == {"validate": 2, "render": 1}
+
+def test_cli_progress():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, VALID_ALL_DATA)
+        result = runner.invoke(translator.cli, [
+            input_path, "--output", os.path.join(directory, "output.ascii"),
+            "--progress", "--progress-json", "-"])
+        assert result.exit_code == 0, result.stderr
+        events = [json.loads(line) for line in result.stdout.splitlines()]
+        assert {event["stage"] for event in events} == set(progress.STAGES)
+        assert "render" in result.stderr and "payees/s" in result.stderr
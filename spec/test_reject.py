@@ -0,0 +1,102 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+
+from copy import deepcopy
+
+import jsonschema
+
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import reject, translator, writer
+
+OUTPUT_PATH = "./spec/data/test_outfile_reject.ascii"
+REJECT_PATH = "./spec/data/test_outfile_reject.ndjson"
+INPUT_PATH = "./spec/data/test_infile_reject.json"
+
+
+def _write_input(data):
+    with open(INPUT_PATH, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file)
+
+def _fire_format(data):
+    master = translator.load_full_schema(deepcopy(data))
+    translator.insert_generated_values(master)
+    return translator.get_fire_format(master)
+
+def test_payee_errors_reports_field():
+    validator = translator.load_validator(translator.get_schema_path("MISC"))
+    payee = deepcopy(VALID_ALL_DATA["payees"][0])
+    assert reject.payee_errors(validator, payee) == []
+    payee["payees_tin"] = "1" * 20
+    errors = reject.payee_errors(validator, payee)
+    assert [error["field"] for error in errors] == ["payees_tin"]
+
+def test_translator_run_with_rejects():
+    temp = deepcopy(VALID_ALL_DATA)
+    bad = deepcopy(temp["payees"][0])
+    del bad["payees_tin"]
+    temp["payees"].insert(1, bad)
+    _write_input(temp)
+    summary = translator.run(INPUT_PATH, OUTPUT_PATH, "MISC",
+                             reject_path=REJECT_PATH)
+
+    assert summary["accepted"] == 2
+    assert summary["rejected"] == 1
+    assert summary["payees"] == 2
+    with open(OUTPUT_PATH, mode="r", encoding="utf-8") as output_file:
+        assert output_file.read() == _fire_format(VALID_ALL_DATA)
+    with open(REJECT_PATH, mode="r", encoding="utf-8") as reject_file:
+        rejects = [json.loads(line) for line in reject_file]
+    assert len(rejects) == 1
+    assert rejects[0]["index"] == 1
+    assert rejects[0]["payee"] == bad
+    assert "payees_tin" in rejects[0]["errors"][0]["message"]
+    for path in [INPUT_PATH, OUTPUT_PATH, REJECT_PATH]:
+        os.remove(path)
+
+def test_translator_run_with_all_payees_rejected():
+    temp = deepcopy(VALID_ALL_DATA)
+    for payee in temp["payees"]:
+        payee["payment_amount_1"] = "not a number"
+    _write_input(temp)
+    summary = translator.run(INPUT_PATH, OUTPUT_PATH, "MISC",
+                             reject_path=REJECT_PATH)
+
+    assert summary["accepted"] == 0
+    assert summary["rejected"] == 2
+    with open(OUTPUT_PATH, mode="r", encoding="utf-8") as output_file:
+        output = output_file.read()
+    assert len(output) == 750 * 4
+    assert output[295:303] == "00000000"
+    assert output[750 * 3 + 49:750 * 3 + 57] == "00000000"
+    for path in [INPUT_PATH, OUTPUT_PATH, REJECT_PATH]:
+        os.remove(path)
+
+@raises(jsonschema.exceptions.ValidationError)
+def test_translator_run_with_rejects_still_validates_payer():
+    temp = deepcopy(VALID_ALL_DATA)
+    del temp["payer"]["payer_tin"]
+    _write_input(temp)
+    try:
+        translator.run(INPUT_PATH, OUTPUT_PATH, "MISC",
+                       reject_path=REJECT_PATH)
+    finally:
+        os.remove(INPUT_PATH)
+
+def test_translator_run_with_rejects_failure_removes_partial_file():
+    temp = deepcopy(VALID_ALL_DATA)
+    del temp["payees"][0]["payees_tin"]
+    _write_input(temp)
+    try:
+        translator.run(INPUT_PATH, "./spec/data/does/not/exist.ascii",
+                       "MISC", reject_path=REJECT_PATH)
+        assert False, "run did not fail"
+    except FileNotFoundError:
+        pass
+    finally:
+        os.remove(INPUT_PATH)
+    assert not os.path.exists(REJECT_PATH)
+    assert not os.path.exists(REJECT_PATH + writer.PARTIAL_SUFFIX)
@@ -0,0 +1,109 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import csv
+import json
+import random
+import tempfile
+
+from copy import deepcopy
+
+from spec_util import VALID_ALL_DATA
+from fire.entities import payees
+from fire.translator import translator, report
+from fire.translator.util import AMOUNT_CODES
+
+
+def _write_input(directory, payee_list):
+    data = deepcopy(VALID_ALL_DATA)
+    data["payees"] = payee_list
+    path = os.path.join(directory, "input.json")
+    with open(path, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file)
+    return path
+
+def _payees(count, seed=1220):
+    rng = random.Random(seed)
+    payee_list = []
+    for i in range(count):
+        payee = deepcopy(VALID_ALL_DATA["payees"][i % 2])
+        payee["payees_tin"] = f"{i:09}"
+        payee["payee_state"] = rng.choice(["CA", "NY", "tx"])
+        for code in ("1", "7", "A"):
+            payee[f"payment_amount_{code}"] = str(rng.randrange(10000))
+        payee_list.append(payee)
+    return payee_list
+
+def _read_report(summary):
+    with open(summary["report"], mode="r", encoding="utf-8") as report_file:
+        return json.load(report_file)
+
+def test_report_totals_match_output():
+    with tempfile.TemporaryDirectory() as directory:
+        payee_list = _payees(40)
+        output_path = os.path.join(directory, "output.ascii")
+        summary = translator.run(_write_input(directory, payee_list),
+                                 output_path, report="json", report_top=5)
+        assert summary["report"] == output_path + ".report.json"
+        result = _read_report(summary)
+
+        with open(output_path, mode="rb") as output_file:
+            end_of_payer = output_file.read()[750 * 42:750 * 43]
+        assert end_of_payer[:1] == b"C"
+        assert result["payees"] == 40 == int(end_of_payer[1:9])
+        # C record totals: 18-digit fields from offset 15, in code order
+        assert result["totals"]["1"] == int(end_of_payer[15:33])
+        assert result["totals"]["7"] == int(end_of_payer[15 + 6 * 18:
+                                                         15 + 7 * 18])
+        assert result["total"] == sum(result["totals"].values())
+
+        assert set(result["states"]) == {"CA", "NY", "TX"}
+        assert sum(state["payees"] for state in
+                   result["states"].values()) == 40
+        assert sum(state["totals"]["A"] for state in
+                   result["states"].values()) == result["totals"]["A"]
+
+        records = [payees.xform([payee])[0] for payee in payee_list]
+        totals = [sum(int(record[f"payment_amount_{code}"])
+                      for code in AMOUNT_CODES) for record in records]
+        expected = sorted(range(40), key=lambda i: (-totals[i], i))[:5]
+        assert [payee["index"] for payee in result["top_payees"]] == expected
+        assert [payee["total"] for payee in result["top_payees"]] == \
+            [totals[i] for i in expected]
+
+def test_report_ties_keep_input_order():
+    summary_report = report.SummaryReport(top_n=2)
+    record = payees.xform([deepcopy(VALID_ALL_DATA["payees"][0])])[0]
+    for amounts in ([5], [7], [7], [5], [7]):
+        summary_report.add(record, amounts)
+    assert [(payee["index"], payee["total"]) for payee in
+            summary_report.top_payees()] == [(1, 7), (2, 7)]
+
+def test_report_same_for_streamed_output():
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_input(directory, _payees(30, seed=7))
+        default = _read_report(translator.run(
+            input_path, os.path.join(directory, "default.ascii"),
+            report="json"))
+        screened = _read_report(translator.run(
+            input_path, os.path.join(directory, "screened.ascii"),
+            reject_path=os.path.join(directory, "rejects.ndjson"),
+            report="json"))
+        assert screened == default
+
+def test_report_csv():
+    with tempfile.TemporaryDirectory() as directory:
+        summary = translator.run(
+            _write_input(directory, deepcopy(VALID_ALL_DATA["payees"])),
+            os.path.join(directory, "output.ascii"), report="csv")
+        assert summary["report"].endswith(".report.csv")
+        with open(summary["report"], mode="r", encoding="utf-8",
+                  newline="") as report_file:
+            rows = list(csv.DictReader(report_file))
+        totals = {row["amount_code"]: int(row["amount"])
+                  for row in rows if row["section"] == "total"}
+        assert totals["7"] == 700 + 1000
+        assert totals["1"] == 100 + 1600
+        top = [row for row in rows if row["section"] == "top_payee"]
+        assert len(top) == 2
+        assert top[0]["name"] in ("SPACELEY SPROCKETS", "BOB LOBLAW LLP")
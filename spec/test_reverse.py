@@ -0,0 +1,125 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+import random
+import tempfile
+
+from copy import deepcopy
+
+from click.testing import CliRunner
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA, VALID_ALL_PATH, FUZZ_SEED, \
+    generate_user_data
+from fire.translator import translator, reverse
+
+
+def _read(path):
+    with open(path, mode="rb") as output_file:
+        return output_file.read()
+
+def _write_json(directory, name, data):
+    path = os.path.join(directory, name)
+    with open(path, mode="w", encoding="utf-8") as json_file:
+        json.dump(data, json_file)
+    return path
+
+def _check_round_trip(data, form_type="MISC", **options):
+    with tempfile.TemporaryDirectory() as directory:
+        original_path = os.path.join(directory, "original.ascii")
+        translator.run(_write_json(directory, "input.json", data),
+                       original_path, form_type)
+        summary = reverse.reverse(original_path, **options)
+        assert summary["type"] == form_type
+        assert summary["payees"] == len(data["payees"])
+        with open(summary["output"], mode="r", encoding="utf-8") as json_file:
+            reversed_data = json.load(json_file)
+        translator.validate_user_data(reversed_data,
+                                      translator.get_schema_path(form_type))
+
+        round_trip_path = os.path.join(directory, "round_trip.ascii")
+        translator.run(summary["output"], round_trip_path, form_type)
+        assert _read(round_trip_path) == _read(original_path)
+        return reversed_data
+
+def test_reverse_round_trip():
+    reversed_data = _check_round_trip(VALID_ALL_DATA)
+    payee = reversed_data["payees"][0]
+    assert payee["payees_tin"] == "987654321"
+    assert payee["payment_amount_7"] == "7.00"
+    assert "record_sequence_number" not in payee
+    assert not any(key.startswith("blank") for key in payee)
+
+def test_reverse_round_trip_nec():
+    data = deepcopy(VALID_ALL_DATA)
+    data["payer"]["type_of_return"] = "NE"
+    data["payees"][1]["payee_zip_code"] = "10013-1001"
+    reversed_data = _check_round_trip(data, "NEC")
+    assert reversed_data["payees"][1]["payee_zip_code"] == "10013-1001"
+
+def test_reverse_round_trip_in_worker_pool():
+    data = deepcopy(VALID_ALL_DATA)
+    data["payees"] = [deepcopy(data["payees"][i % 2]) for i in range(25)]
+    for i, payee in enumerate(data["payees"]):
+        payee["payers_account_number_for_payee"] = f"ACCT{i}"
+    reversed_data = _check_round_trip(data, workers=2, chunk_records=4)
+    assert [payee["payers_account_number_for_payee"] for payee in
+            reversed_data["payees"]] == [f"ACCT{i}" for i in range(25)]
+
+# Generated inputs, with trailing blanks removed from text values: blank
+# padding cannot be told apart from trailing blanks, which are stripped
+def test_reverse_round_trip_generated_inputs():
+    for case in range(10):
+        yield _check_generated, FUZZ_SEED + case
+
+def _check_generated(seed):
+    data = generate_user_data(random.Random(seed))
+    for record in [data["transmitter"], data["payer"]] + data["payees"]:
+        for key, value in record.items():
+            record[key] = value.rstrip(" ")
+    _check_round_trip(data, workers=1, type="MISC")
+
+def test_reverse_ndjson_and_compressed_input():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "original.ascii.gz")
+        translator.run(VALID_ALL_PATH, output_path)
+        summary = reverse.reverse(output_path, ndjson=True, workers=1)
+        assert summary["output"] == os.path.join(directory,
+                                                 "original.ascii.ndjson")
+        with open(summary["output"], mode="r", encoding="utf-8") as lines:
+            records = [json.loads(line) for line in lines]
+        assert len(records) == 3
+        assert set(records[0]) == {"transmitter", "payer"}
+        assert records[2]["first_payee_name_line"] == "BOB LOBLAW LLP"
+
+@raises(Exception)
+def test_reverse_rejects_truncated_file():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "original.ascii")
+        translator.run(VALID_ALL_PATH, path)
+        with open(path, mode="r+b") as output_file:
+            output_file.truncate(750 * 3 + 100)
+        reverse.reverse(path, workers=1)
+
+@raises(Exception)
+def test_reverse_rejects_payee_count_mismatch():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "original.ascii")
+        translator.run(VALID_ALL_PATH, path)
+        contents = _read(path)
+        with open(path, mode="wb") as output_file:
+            output_file.write(contents[:750 * 3] + contents[750 * 4:])
+        reverse.reverse(path, workers=1)
+
+def test_cli_reverse():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "original.ascii")
+        translator.run(VALID_ALL_PATH, path)
+        output_path = os.path.join(directory, "reversed.json")
+        result = runner.invoke(translator.cli, [
+            "reverse", path, "--output", output_path, "--workers", "1"])
+        assert result.exit_code == 0, result.output
+        assert "2 payees (MISC)" in result.output
+        assert os.path.isfile(output_path)
@@ -0,0 +1,108 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import json
+import socket
+import threading
+
+from copy import deepcopy
+from http.client import HTTPConnection
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import server, translator
+
+
+def _start_server(workers=2, queue_size=2):
+    httpd = server.ConversionServer(("127.0.0.1", 0), workers, queue_size)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd
+
+def _post(httpd, path, body):
+    connection = HTTPConnection("127.0.0.1", httpd.server_address[1],
+                                timeout=10)
+    payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+    connection.request("POST", path, payload,
+                       {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    result = (response.status, response.getheader("Transfer-Encoding"),
+              response.read())
+    connection.close()
+    return result
+
+def _expected_output():
+    master = translator.load_full_schema(deepcopy(VALID_ALL_DATA))
+    translator.insert_generated_values(master)
+    return translator.get_fire_format(master).encode("utf-8")
+
+def test_server_convert_streams_chunked_output():
+    httpd = _start_server()
+    try:
+        status, encoding, body = _post(httpd, "/convert?type=MISC",
+                                       VALID_ALL_DATA)
+        assert status == 200
+        assert encoding == "chunked"
+        assert body == _expected_output()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_server_convert_and_validate_invalid_input():
+    httpd = _start_server()
+    temp = deepcopy(VALID_ALL_DATA)
+    del temp["payer"]["payer_tin"]
+    try:
+        status, _, body = _post(httpd, "/convert", temp)
+        assert status == 422
+        assert json.loads(body)["errors"]
+
+        status, _, body = _post(httpd, "/validate", temp)
+        assert status == 422
+        assert not json.loads(body)["valid"]
+
+        status, _, body = _post(httpd, "/validate", VALID_ALL_DATA)
+        assert status == 200
+        assert json.loads(body)["valid"]
+
+        status, _, _ = _post(httpd, "/validate", b"{not json")
+        assert status == 400
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_server_rejects_when_full():
+    httpd = _start_server(workers=1, queue_size=0)
+    try:
+        assert httpd.slots.acquire(blocking=False)
+        status, _, _ = _post(httpd, "/validate", VALID_ALL_DATA)
+        assert status == 503
+        httpd.slots.release()
+        status, _, _ = _post(httpd, "/validate", VALID_ALL_DATA)
+        assert status == 200
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+def test_server_rejects_before_reading_body():
+    httpd = _start_server(workers=1, queue_size=0)
+    try:
+        assert httpd.slots.acquire(blocking=False)
+        # Announce a large body but never send it: a server reading the body
+        # before admission control would block until the timeout
+        connection = socket.create_connection(
+            ("127.0.0.1", httpd.server_address[1]), timeout=10)
+        connection.sendall(b"POST /convert HTTP/1.1\r\n"
+                           b"Host: localhost\r\n"
+                           b"Content-Length: 104857600\r\n\r\n")
+        response = connection.makefile("rb")
+        assert response.readline().split()[1] == b"503"
+        response.close()
+        connection.close()
+        httpd.slots.release()
+
+        status, _, _ = _post(httpd, "/validate", b"{not json")
+        assert status == 400
+        status, _, _ = _post(httpd, "/validate", VALID_ALL_DATA)
+        assert status == 200
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
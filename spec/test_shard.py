@@ -0,0 +1,155 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import json
+import tempfile
+import threading
+
+from copy import deepcopy
+
+from click.testing import CliRunner
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import translator, shard
+
+PAYEE_COUNT = 11
+
+
+def _many_payees(count):
+    data = deepcopy(VALID_ALL_DATA)
+    data["payees"] = [dict(data["payees"][i % 2], payees_tin=f"{i:09}")
+                      for i in range(count)]
+    for i, payee in enumerate(data["payees"]):
+        payee["combined_federal_state_code"] = ("06", "25", "")[i % 3]
+        payee["state_income_tax_withheld"] = "12.34"
+    return data
+
+def _write_json(directory, data):
+    path = os.path.join(directory, "input.json")
+    with open(path, mode="w", encoding="utf-8") as input_file:
+        json.dump(data, input_file)
+    return path
+
+def _read(path):
+    with open(path, mode="rb") as file:
+        return file.read()
+
+def test_sharded_output_matches_output():
+    for payee_count in (0, 1, PAYEE_COUNT):
+        for shard_size in (1, 4, PAYEE_COUNT, 100):
+            yield _check_sharded_output, payee_count, shard_size
+
+def _check_sharded_output(payee_count, shard_size):
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, _many_payees(payee_count))
+        expected_path = os.path.join(directory, "expected.ascii")
+        translator.run(input_path, expected_path)
+
+        output_path = os.path.join(directory, "output.ascii")
+        summary = shard.run_sharded(input_path, output_path,
+                                    shard_size=shard_size, workers=3)
+        assert summary["payees"] == payee_count
+        assert summary["shards"] == -(-payee_count // shard_size)
+        assert sum(summary["workers"].values()) == summary["shards"]
+        assert _read(output_path) == _read(expected_path)
+        # The temporary queue directory is removed
+        assert sorted(os.listdir(directory)) == \
+            ["expected.ascii", "input.json", "output.ascii"]
+
+def test_claims_are_exclusive():
+    with tempfile.TemporaryDirectory() as directory:
+        queue_dir = os.path.join(directory, "queue")
+        job = shard.plan(_write_json(directory, _many_payees(PAYEE_COUNT)),
+                         queue_dir, shard_size=5)
+        assert job["shards"] == [5, 5, 1]
+        claims = [shard.claim_shard(queue_dir) for _ in range(4)]
+        assert [os.path.basename(claim) for claim in claims[:3]] == \
+            ["shard-00000.json", "shard-00001.json", "shard-00002.json"]
+        assert claims[3] is None
+
+        # Stale claims go back to the queue
+        assert shard.requeue_stale(queue_dir, 3600) == []
+        assert shard.requeue_stale(queue_dir, 0) == \
+            ["shard-00000.json", "shard-00001.json", "shard-00002.json"]
+        assert len(shard.work(queue_dir)) == 3
+        shard.merge(queue_dir, os.path.join(directory, "output.ascii"))
+
+def test_worker_started_before_plan():
+    poll_interval = shard.POLL_INTERVAL
+    shard.POLL_INTERVAL = 0.01
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            queue_dir = os.path.join(directory, "queue")
+            results = []
+            worker = threading.Thread(target=lambda: results.extend(
+                shard.work(queue_dir, "early")))
+            worker.start()
+            shard.plan(_write_json(directory, _many_payees(PAYEE_COUNT)),
+                       queue_dir, shard_size=4)
+            worker.join(10)
+            assert not worker.is_alive()
+            assert sorted(result["shard"] for result in results) == [0, 1, 2]
+            assert {result["worker"] for result in results} == {"early"}
+    finally:
+        shard.POLL_INTERVAL = poll_interval
+
+@raises(Exception)
+def test_merge_missing_shard():
+    with tempfile.TemporaryDirectory() as directory:
+        queue_dir = os.path.join(directory, "queue")
+        shard.plan(_write_json(directory, _many_payees(PAYEE_COUNT)),
+                   queue_dir, shard_size=5)
+        shard.render_shard(shard.claim_shard(queue_dir), queue_dir)
+        shard.merge(queue_dir, os.path.join(directory, "output.ascii"))
+
+@raises(Exception)
+def test_merge_corrupt_shard():
+    with tempfile.TemporaryDirectory() as directory:
+        queue_dir = os.path.join(directory, "queue")
+        shard.plan(_write_json(directory, _many_payees(PAYEE_COUNT)),
+                   queue_dir, shard_size=5)
+        shard.work(queue_dir)
+        path = os.path.join(queue_dir, shard.DONE_DIR, "shard-00001.ascii")
+        os.replace(os.path.join(queue_dir, shard.DONE_DIR,
+                                "shard-00000.ascii"), path)
+        shard.merge(queue_dir, os.path.join(directory, "output.ascii"))
+
+@raises(Exception)
+def test_plan_invalid_payee():
+    with tempfile.TemporaryDirectory() as directory:
+        data = _many_payees(PAYEE_COUNT)
+        del data["payees"][7]["payees_tin"]
+        shard.plan(_write_json(directory, data),
+                   os.path.join(directory, "queue"))
+
+@raises(Exception)
+def test_plan_existing_queue():
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, _many_payees(PAYEE_COUNT))
+        queue_dir = os.path.join(directory, "queue")
+        shard.plan(input_path, queue_dir)
+        shard.plan(input_path, queue_dir)
+
+def test_cli_shard():
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = _write_json(directory, _many_payees(PAYEE_COUNT))
+        expected_path = os.path.join(directory, "expected.ascii")
+        translator.run(input_path, expected_path)
+
+        output_path = os.path.join(directory, "output.ascii")
+        result = runner.invoke(translator.cli, [
+            "shard", "run", input_path, "--output", output_path,
+            "--shard-size", "3", "-j", "2"])
+        assert result.exit_code == 0, result.output
+        assert "11 payees from 4 shards" in result.output
+        assert _read(output_path) == _read(expected_path)
+
+        queue_dir = os.path.join(directory, "queue")
+        for args in (["plan", input_path, queue_dir, "--shard-size", "5"],
+                     ["work", queue_dir, "--worker", "a"],
+                     ["merge", queue_dir, "--output", output_path]):
+            result = runner.invoke(translator.cli, ["shard"] + args)
+            assert result.exit_code == 0, result.output
+        assert _read(output_path) == _read(expected_path)
@@ -0,0 +1,42 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import re
+import sys
+import subprocess
+
+# Budget for the cumulative import time of the CLI module, in microseconds
+IMPORT_TIME_BUDGET_US = 100000
+
+
+def _import_times(statement):
+    """
+    Runs statement in a fresh interpreter with -X importtime, and returns a
+    dict mapping each imported module to its cumulative import time (us).
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE, check=True, universal_newlines=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)", line)
+        if match:
+            times[match.group(2)] = int(match.group(1))
+    return times
+
+def test_cli_import_time_within_budget():
+    # Best of three runs, to reduce noise from the host
+    best = min(_import_times("import fire.translator.translator")
+               ["fire.translator.translator"] for _ in range(3))
+    assert best < IMPORT_TIME_BUDGET_US, f"Import time: {best}us"
+
+def test_cli_import_defers_heavy_modules():
+    times = _import_times("from fire.translator import cli")
+    assert "jsonschema" not in times
+    assert "hashlib" not in times
+    assert "fire.translator.batch" not in times
+    assert "fire.entities.extension_of_time" not in times
+
+def test_util_import_does_not_load_cli():
+    times = _import_times("import fire.translator.util")
+    assert "click" not in times
+    assert "fire.translator.translator" not in times
@@ -3,8 +3,11 @@
 import os
 import re
 
+from copy import deepcopy
 from time import gmtime, strftime
 
+import jsonschema
+
 from nose.tools import raises
 
 from spec_util import check_blanks, \
@@ -136,3 +139,74 @@ def test_translator_get_fire_format():
 
     for (offset, inclusive_bound) in END_OF_TRANSMISSION_BLANK_MAP:
         yield check_blanks, ascii_string[(offset + 749*5):inclusive_bound]
+
+# Checks that state totals (K) records are generated for combined
+# federal/state filers, placed after the end_of_payer record, and numbered
+def test_translator_state_totals_records():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payer"]["combined_fed_state"] = "1"
+    temp["payees"][0]["combined_federal_state_code"] = "06"
+    temp["payees"][0]["state_income_tax_withheld"] = "500"
+    temp["payees"][1]["combined_federal_state_code"] = "06"
+    data = translator.load_full_schema(temp)
+    translator.insert_generated_values(data)
+    ascii_string = translator.get_fire_format(data)
+
+    assert len(ascii_string) == 5250
+    assert ascii_string[750*4] == "C"
+    k_record = ascii_string[750*5:750*6]
+    assert k_record[0] == "K"
+    assert k_record[1:9] == "00000002"
+    assert k_record[499:507] == "00000006"
+    assert k_record[706:724] == 15*"0" + "500"
+    assert k_record[746:748] == "06"
+    assert ascii_string[750*6] == "F"
+    assert ascii_string[750*6 + 499:750*6 + 507] == "00000007"
+
+def test_translator_no_state_totals_without_combined_filing():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payer"]["combined_fed_state"] = ""
+    temp["payees"][0]["combined_federal_state_code"] = "06"
+    data = translator.load_full_schema(temp)
+    translator.insert_generated_values(data)
+    assert data["state_totals"] == []
+    assert len(translator.get_fire_format(data)) == 4500
+
+def _expected_bytes(user_data):
+    data = translator.load_full_schema(deepcopy(user_data))
+    translator.insert_generated_values(data)
+    return translator.get_fire_bytes(data)
+
+def test_translator_iter_fire_records_matches_get_fire_bytes():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payer"]["combined_fed_state"] = "1"
+    temp["payees"][0]["combined_federal_state_code"] = "06"
+    temp["payees"][0]["state_income_tax_withheld"] = "500"
+    records = list(translator.iter_fire_records(
+        temp["transmitter"], temp["payer"],
+        (payee for payee in temp["payees"]), type="MISC"))
+    assert all(len(record) == 750 for record in records)
+    assert [record[:1] for record in records] == \
+        [b"T", b"A", b"B", b"B", b"C", b"K", b"F"]
+    assert b"".join(records) == _expected_bytes(temp)
+
+# A spool smaller than one record is moved to disk on the first write
+def test_translator_iter_fire_records_spooled_to_disk():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payees"] = temp["payees"] * 20
+    records = translator.iter_fire_records(
+        temp["transmitter"], temp["payer"], iter(temp["payees"]),
+        spool_memory=100)
+    assert b"".join(records) == _expected_bytes(temp)
+
+def test_translator_iter_fire_records_without_payees():
+    records = list(translator.iter_fire_records(
+        VALID_ALL_DATA["transmitter"], VALID_ALL_DATA["payer"], []))
+    assert [record[:1] for record in records] == [b"T", b"A", b"C", b"F"]
+
+@raises(jsonschema.exceptions.ValidationError)
+def test_translator_iter_fire_records_validates_payees():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payees"][1]["payees_tin"] = "12-ABCDEFG"
+    list(translator.iter_fire_records(temp["transmitter"], temp["payer"],
+                                      temp["payees"], type="MISC"))
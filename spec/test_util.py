@@ -0,0 +1,97 @@
+# pylint: disable=missing-docstring, invalid-name, protected-access
+
+from copy import deepcopy
+
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA
+from fire.entities import payees, payer
+from fire.translator import translator
+from fire.translator.util import digits_only, uppercase, rjust_zero, \
+                                 to_ascii, fire_entity, parse_entity
+
+TRANSFORM_VALUES = ["123-45-6789", "(555) 555-1212", "abc Def 12", "", "0"]
+
+
+def test_transforms_match_for_str_and_bytes():
+    for value in TRANSFORM_VALUES:
+        yield _check_transforms, value
+
+def _check_transforms(value):
+    encoded = value.encode("ascii")
+    assert digits_only(encoded) == digits_only(value).encode("ascii")
+    assert digits_only(bytearray(encoded)) == \
+        digits_only(value).encode("ascii")
+    assert uppercase(encoded) == uppercase(value).encode("ascii")
+    assert rjust_zero(encoded, 12) == rjust_zero(value, 12).encode("ascii")
+
+def test_digits_only_non_ascii():
+    assert digits_only("12 34-5") == "12345"
+
+def test_to_ascii_transliterates():
+    assert to_ascii("JOSÉ NUÑEZ") == b"JOSE NUNEZ"
+    assert to_ascii("ØSTERGÅRD ÆBLE") == b"OSTERGARD AEBLE"
+    assert to_ascii("O’BRIEN — LLC") == b"O'BRIEN - LLC"
+    assert to_ascii("北京 CO") == b" CO"
+    assert to_ascii(b"ABC") == b"ABC"
+
+def test_fire_bytes_matches_fire_for_ascii():
+    data = payees.xform(deepcopy(VALID_ALL_DATA["payees"]))
+    assert payees.fire_bytes(data) == payees.fire(data).encode("ascii")
+    for payee in data:
+        assert payees.fire_bytes([payee]) == fire_entity(
+            payees._PAYEE_TRANSFORMS, payees._PAYEE_SORT, payee, binary=True)
+
+def test_fire_bytes_keeps_offsets_with_non_ascii():
+    temp = deepcopy(VALID_ALL_DATA["payees"][0])
+    temp["first_payee_name_line"] = "Zoë Ångström"
+    data = payees.xform([temp])
+    record = payees.fire_bytes(data)
+    assert len(record) == 750
+    assert record == payees.fire(payees.xform([dict(
+        temp, first_payee_name_line="Zoe Angstrom")])).encode("ascii")
+
+def test_fire_bytes_accepts_bytes_values():
+    data = payer.xform(deepcopy(VALID_ALL_DATA["payer"]))
+    expected = payer.fire_bytes(data)
+    data["first_payer_name"] = data["first_payer_name"].encode()
+    assert payer.fire_bytes(data) == expected
+
+def test_fire_cuts_transliteration_to_field_length():
+    data = payer.xform(deepcopy(VALID_ALL_DATA["payer"]))
+    data["payer_tin"] = "12345678ß"
+    assert payer.fire_bytes(data)[11:20] == b"12345678s"
+    assert payer.fire(data)[11:20] == "12345678s"
+
+def test_expanding_transliteration_at_maximum_field_length():
+    temp = deepcopy(VALID_ALL_DATA)
+    temp["payees"][0]["first_payee_name_line"] = "Æ" * 40
+    temp["payees"][1]["first_payee_name_line"] = "ß" * 39 + "Œ"
+    translator.validate_user_data(temp, translator.get_schema_path("MISC"))
+    master = translator.load_full_schema(temp)
+    translator.insert_generated_values(master)
+    rendered = translator.get_fire_bytes(master)
+    assert len(rendered) == 6 * 750
+    assert rendered == translator.get_fire_format(master).encode("ascii")
+    assert rendered[1500 + 287:1500 + 327] == b"AE" * 20
+    assert rendered[2250 + 287:2250 + 327] == b"SS" * 20
+
+@raises(Exception)
+def test_fire_bytes_rejects_overlong_ascii_value():
+    data = payer.xform(deepcopy(VALID_ALL_DATA["payer"]))
+    data["payer_tin"] = "1234567890"
+    payer.fire_bytes(data)
+
+def test_get_fire_bytes_matches_get_fire_format():
+    master = translator.load_full_schema(deepcopy(VALID_ALL_DATA))
+    translator.insert_generated_values(master)
+    assert translator.get_fire_bytes(master) == \
+        translator.get_fire_format(master).encode("ascii")
+
+def test_parse_entity_inverts_fire_entity():
+    record = payees.xform([deepcopy(VALID_ALL_DATA["payees"][0])])[0]
+    record["record_sequence_number"] = "00000003"
+    for rendered in (payees.fire([record]), payees.fire_bytes([record])):
+        fields = parse_entity(payees._PAYEE_TRANSFORMS, payees._PAYEE_SORT,
+                              rendered)
+        assert fields == record
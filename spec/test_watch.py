@@ -0,0 +1,129 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+import gzip
+import json
+import queue
+import tempfile
+import threading
+
+from copy import deepcopy
+
+from spec_util import VALID_ALL_DATA
+from fire.translator import translator, watch
+
+
+def _expected_output(data):
+    master = translator.load_full_schema(deepcopy(data))
+    translator.insert_generated_values(master)
+    return translator.get_fire_bytes(master)
+
+def _read(path):
+    with open(path, mode="rb") as output_file:
+        return output_file.read()
+
+def _check_session(edits):
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        session = watch.WatchSession(output_path, "MISC")
+        data = deepcopy(VALID_ALL_DATA)
+        results = [session.update(deepcopy(data))]
+        assert _read(output_path) == _expected_output(data)
+        for edit in edits:
+            edit(data)
+            results.append(session.update(deepcopy(data)))
+            assert _read(output_path) == _expected_output(data)
+        return results
+
+def test_watch_session_patches_changed_payee():
+    def edit(data):
+        data["payees"][1]["payment_amount_7"] = "99999"
+    first, second = _check_session([edit])
+    assert not first["patched"] and first["rendered"] == 2
+    assert second == {"payees": 2, "changed": 1, "rendered": 1,
+                      "patched": True}
+
+def test_watch_session_reuses_rendered_payees():
+    def add(data):
+        data["payees"].append(deepcopy(data["payees"][0]))
+        data["payees"][-1]["payees_tin"] = "111-11-1111"
+    def reorder(data):
+        data["payees"].reverse()
+    def remove(data):
+        del data["payees"][0]
+    results = _check_session([add, reorder, remove])
+    assert [result["rendered"] for result in results] == [2, 1, 0, 0]
+    assert [result["patched"] for result in results] == \
+        [False, False, True, False]
+
+def test_watch_session_updates_state_totals():
+    def combine(data):
+        data["payer"]["combined_fed_state"] = "1"
+        data["payees"][0]["combined_federal_state_code"] = "06"
+    def split_states(data):
+        data["payees"][1]["combined_federal_state_code"] = "13"
+    def merge_states(data):
+        data["payees"][1]["combined_federal_state_code"] = "06"
+    results = _check_session([combine, split_states, merge_states])
+    assert all(result["patched"] for result in results[1:])
+
+def test_watch_session_leaves_output_on_invalid_payee():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        session = watch.WatchSession(output_path, "MISC")
+        session.update(deepcopy(VALID_ALL_DATA))
+        data = deepcopy(VALID_ALL_DATA)
+        data["payees"][1]["payees_tin"] = "invalid"
+        result = session.update(data)
+        assert [error["index"] for error in result["errors"]] == [1]
+        assert _read(output_path) == _expected_output(VALID_ALL_DATA)
+
+def test_watch_session_rewrites_modified_output():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii")
+        session = watch.WatchSession(output_path, "MISC")
+        session.update(deepcopy(VALID_ALL_DATA))
+        with open(output_path, mode="ab") as output_file:
+            output_file.write(b"\n")
+        result = session.update(deepcopy(VALID_ALL_DATA))
+        assert not result["patched"]
+        assert _read(output_path) == _expected_output(VALID_ALL_DATA)
+
+def test_watch_session_rewrites_compressed_output():
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, "output.ascii.gz")
+        session = watch.WatchSession(output_path, "MISC")
+        data = deepcopy(VALID_ALL_DATA)
+        session.update(deepcopy(data))
+        data["payees"][1]["payment_amount_7"] = "99999"
+        result = session.update(deepcopy(data))
+        assert not result["patched"]
+        with gzip.open(output_path, mode="rb") as output_file:
+            assert output_file.read() == _expected_output(data)
+
+def test_watch_polls_input_for_changes():
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "input.json")
+        output_path = os.path.join(directory, "output.ascii")
+        data = deepcopy(VALID_ALL_DATA)
+        with open(input_path, mode="w", encoding="utf-8") as input_file:
+            json.dump(data, input_file)
+
+        results = queue.Queue()
+        stop = threading.Event()
+        thread = threading.Thread(target=watch.watch, args=(
+            input_path, output_path, "MISC", 0.05, results.put, stop))
+        thread.start()
+        try:
+            assert results.get(timeout=10)["payees"] == 2
+            data["payees"][0]["payment_amount_7"] = "100"
+            with open(input_path + ".tmp", mode="w",
+                      encoding="utf-8") as input_file:
+                json.dump(data, input_file)
+            os.utime(input_path + ".tmp", ns=(0, 10**9))
+            os.replace(input_path + ".tmp", input_path)
+            assert results.get(timeout=10)["changed"] == 1
+        finally:
+            stop.set()
+            thread.join()
+        assert _read(output_path) == _expected_output(data)
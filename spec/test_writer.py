@@ -0,0 +1,80 @@
+# pylint: disable=missing-docstring, invalid-name
+
+import os
+
+from copy import deepcopy
+
+from click.testing import CliRunner
+from nose.tools import raises
+
+from spec_util import VALID_ALL_DATA, VALID_ALL_PATH
+from fire.translator import translator, writer
+
+OUTPUT_PATH = "./spec/data/test_outfile_writer.ascii"
+
+
+def _master():
+    data = translator.load_full_schema(VALID_ALL_DATA)
+    translator.insert_generated_values(data)
+    return data
+
+def _cleanup():
+    for suffix in ["", writer.PARTIAL_SUFFIX, writer.CHECKPOINT_SUFFIX]:
+        if os.path.isfile(OUTPUT_PATH + suffix):
+            os.remove(OUTPUT_PATH + suffix)
+
+def test_write_atomic_leaves_no_partial_file():
+    _cleanup()
+    writer.write_atomic("A" * 750, OUTPUT_PATH)
+    assert os.path.isfile(OUTPUT_PATH)
+    assert not os.path.isfile(OUTPUT_PATH + writer.PARTIAL_SUFFIX)
+    _cleanup()
+
+def test_write_checkpointed_matches_fire_format():
+    _cleanup()
+    data = _master()
+    writer.write_checkpointed(data, OUTPUT_PATH, 1, "fingerprint")
+    with open(OUTPUT_PATH, mode="r", encoding="utf-8") as output_file:
+        assert output_file.read() == translator.get_fire_format(data)
+    assert not os.path.isfile(OUTPUT_PATH + writer.CHECKPOINT_SUFFIX)
+    _cleanup()
+
+def test_write_checkpointed_resumes_after_failure():
+    _cleanup()
+    data = _master()
+    broken = deepcopy(data)
+    del broken["payees"][1]["payee_city"]
+    try:
+        writer.write_checkpointed(broken, OUTPUT_PATH, 1, "fingerprint")
+    except KeyError:
+        pass
+    assert not os.path.isfile(OUTPUT_PATH)
+    checkpoint = writer.read_checkpoint(OUTPUT_PATH, "fingerprint")
+    assert checkpoint["payees_written"] == 1
+    assert checkpoint["record_sequence_number"] == "00000003"
+
+    writer.write_checkpointed(data, OUTPUT_PATH, 1, "fingerprint")
+    with open(OUTPUT_PATH, mode="r", encoding="utf-8") as output_file:
+        assert output_file.read() == translator.get_fire_format(data)
+    _cleanup()
+
+def test_read_checkpoint_ignores_other_inputs():
+    _cleanup()
+    writer.save_checkpoint(OUTPUT_PATH, {"fingerprint": "a"})
+    writer.write_atomic("", OUTPUT_PATH + writer.PARTIAL_SUFFIX)
+    assert writer.read_checkpoint(OUTPUT_PATH, "b") is None
+    _cleanup()
+
+def test_cli_checkpointed_without_type():
+    _cleanup()
+    result = CliRunner().invoke(translator.cli, [
+        VALID_ALL_PATH, "--output", OUTPUT_PATH, "--checkpoint-interval", "1"])
+    assert result.exit_code == 0, result.output
+    with open(OUTPUT_PATH, mode="r", encoding="utf-8") as output_file:
+        assert output_file.read() == translator.get_fire_format(_master())
+    assert not os.path.isfile(OUTPUT_PATH + writer.CHECKPOINT_SUFFIX)
+    _cleanup()
+
+@raises(FileNotFoundError)
+def test_write_checkpointed_invalid_path():
+    writer.write_checkpointed(_master(), "./spec/data/does/not/exist.ascii", 1)